@@ -0,0 +1,156 @@
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+
+def _phase(timer, name):
+    return timer.phase(name) if timer is not None else nullcontext()
+
+
+class RemoteBackend:
+    """An AnkiConnect endpoint that is already running; nothing to manage."""
+
+    name = "remote"
+    pid = None
+
+    def __init__(self, url):
+        self.url = url
+
+    def start(self, timer=None, running=False):
+        pass
+
+    def reap(self):
+        """True (once) if an Anki process this backend launched has exited."""
+        return False
+
+    def stop(self):
+        pass
+
+
+class DesktopBackend(RemoteBackend):
+    """Anki on this Windows machine, launched in the background and hidden."""
+
+    name = "desktop"
+
+    def __init__(self, url, anki_path):
+        super().__init__(url)
+        self.anki_path = anki_path
+        self.process = None  # the Anki we launched, if any
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def start(self, timer=None, running=False):
+        """Launch Anki unless it is already up (``running``: AnkiConnect answered)."""
+        with _phase(timer, "anki_launch"):
+            if not running and not is_anki_running(self.anki_path):
+                self.process = start_anki_silently(self.anki_path)
+        # The window only needs hiding once it appears; don't hold up the rest.
+        def hide():
+            with _phase(timer, "hide_window"):
+                hide_anki_window(self.anki_path, self.pid)
+        threading.Thread(target=hide, daemon=True).start()
+
+    def reap(self):
+        if self.process is not None and self.process.poll() is not None:
+            self.process = None
+            return True
+        return False
+
+
+class FakeBackend(RemoteBackend):
+    """The bundled fake AnkiConnect serving a generated collection in-process."""
+
+    name = "fake"
+
+    def __init__(self, decks=10, cards_per_deck=100, latency=0.0):
+        from fake_ankiconnect import FakeAnkiConnect, FakeCollection
+        self.server = FakeAnkiConnect(FakeCollection.generate(decks, cards_per_deck), latency=latency)
+        super().__init__(self.server.url)
+
+    def start(self, timer=None, running=False):
+        with _phase(timer, "fake_ankiconnect"):
+            self.server.start()
+
+    def stop(self):
+        self.server.stop()
+
+
+def default_backend_name():
+    return "desktop" if sys.platform == "win32" else "remote"
+
+
+def make_backend(name, url, anki_path=None):
+    if name == "desktop":
+        return DesktopBackend(url, anki_path)
+    if name == "remote":
+        return RemoteBackend(url)
+    if name == "fake":
+        return FakeBackend()
+    raise ValueError(f"unknown backend: {name!r} (expected desktop, remote or fake)")
+
+
+# ------------------- Windows process management -------------------
+def is_anki_running(anki_path):
+    """Whether a process of the Anki executable is running (one that isn't answering yet, say)."""
+    import psutil
+    exe = os.path.basename(anki_path).lower()
+    return any(
+        (proc.info['name'] or "").lower() == exe
+        for proc in psutil.process_iter(['name'])
+    )
+
+def start_anki_silently(anki_path):
+    """Launch Anki hidden and return its Popen; readiness is the supervisor's job."""
+    import subprocess
+    print("Starting Anki in background...")
+    si = subprocess.STARTUPINFO()
+    si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return subprocess.Popen(
+        [anki_path],
+        startupinfo=si,
+        creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NO_WINDOW
+    )
+
+def anki_pids(anki_path, pid=None):
+    """Processes that are Anki: the one we launched (and its children) and any running the Anki executable."""
+    import psutil
+    exe = os.path.basename(anki_path).lower()
+    pids = {proc.pid for proc in psutil.process_iter(['name']) if (proc.info['name'] or "").lower() == exe}
+    if pid is not None:
+        try:
+            pids.add(pid)
+            pids.update(child.pid for child in psutil.Process(pid).children(recursive=True))
+        except psutil.NoSuchProcess:
+            pass
+    pids.discard(os.getpid())  # never our own window, whatever its title
+    return pids
+
+def hide_anki_window(anki_path, pid=None, timeout=10):
+    """Hide the visible top-level windows of Anki's processes once one appears.
+
+    Windows are matched by owning process, not by title: ours is called
+    "Anki Server" and is created while Anki is still launching.
+    """
+    import win32gui
+    import win32con
+    import win32process
+    start = time.time()
+    while time.time() - start < timeout:
+        pids = anki_pids(anki_path, pid)
+        found = False
+        def enumHandler(hwnd, lParam):
+            nonlocal found
+            if not win32gui.IsWindowVisible(hwnd):
+                return
+            if win32process.GetWindowThreadProcessId(hwnd)[1] in pids:
+                win32gui.ShowWindow(hwnd, win32con.SW_HIDE)
+                found = True
+        win32gui.EnumWindows(enumHandler, None)
+        if found:
+            return True
+        time.sleep(0.5)
+    return False
@@ -0,0 +1,169 @@
+import itertools
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class DeckEntry:
+    """Due cards of one deck, loaded all at once or page by page.
+
+    ``ids`` is the deck's due-card list from findCards and never changes, so
+    page cursors stay valid while cards are graded away. ``notes`` maps each
+    loaded card id to its (shared) Note. ``version`` changes with every load
+    or removal, and is never reused, so it can tag what was served from it.
+    """
+
+    __slots__ = ("loaded_at", "version", "ids", "notes", "missing")
+    _versions = itertools.count(1)
+
+    def __init__(self, ids):
+        self.loaded_at = time.time()
+        self.bump()
+        self.ids = array("q", ids)
+        self.notes = {}
+        self.missing = set(ids)
+
+    def bump(self):
+        self.version = next(DeckEntry._versions)
+
+    @property
+    def complete(self):
+        return not self.missing
+
+    def cards(self):
+        notes = self.notes
+        return [(i, notes[i]) for i in self.ids if i in notes]
+
+    def page(self, cursor, limit, partial=False):
+        """The loaded cards of a page; None if some aren't loaded, unless ``partial``."""
+        span = self.ids[cursor:cursor + limit]
+        if not partial and any(i in self.missing for i in span):
+            return None
+        notes = self.notes
+        return [(i, notes[i]) for i in span if i in notes]
+
+
+class DeckCache:
+    """Due cards per deck, bounded by deck count, total cards and a time-to-live.
+
+    Cards are ``(card_id, Note)`` pairs; a graded card is dropped from every
+    cached deck that lists it (a parent deck's search includes its subdecks'
+    cards).
+    """
+
+    def __init__(self, max_decks=32, ttl=600, max_cards=200_000):
+        self.max_decks = max_decks
+        self.max_cards = max_cards
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+
+    def entry(self, deck, expire=True):
+        """The deck's entry, complete or partially loaded, if still fresh (or at all, unless ``expire``)."""
+        with self.lock:
+            entry = self.entries.get(deck)
+            if entry is None:
+                return None
+            if expire and not self._fresh(entry):
+                del self.entries[deck]
+                return None
+            self.entries.move_to_end(deck)
+            return entry
+
+    def version(self, deck):
+        """The version of the deck's entry if it is fresh and complete, else None.
+
+        Only such an entry is served as it is; anything else is reloaded
+        (or served offline) first, so its version would tag other cards.
+        """
+        with self.lock:
+            entry = self.entries.get(deck)
+            if entry is None or not entry.complete or not self._fresh(entry):
+                return None
+            return entry.version
+
+    def _fresh(self, entry):
+        return self.ttl is None or time.time() - entry.loaded_at <= self.ttl
+
+    def get(self, deck):
+        """The deck's full card list, or None unless every card is loaded."""
+        entry = self.entry(deck)
+        if entry is None or not entry.complete:
+            return None
+        return entry.cards()
+
+    def begin(self, deck, ids):
+        """Start a paged load of ``deck`` from its due card ids."""
+        with self.lock:
+            self.entries.pop(deck, None)
+            entry = self.entries[deck] = DeckEntry(ids)
+            self._evict()
+            return entry
+
+    def put(self, deck, cards):
+        with self.lock:
+            entry = self.begin(deck, [card_id for card_id, _ in cards])
+            self._add(entry, entry.ids, cards)
+            self._evict()
+            return entry.cards()
+
+    def add_page(self, deck, entry, ids, cards):
+        """Store the cards loaded for ``ids`` (even if the entry was evicted meanwhile)."""
+        with self.lock:
+            self._add(entry, ids, cards)
+            self._evict()
+
+    def _add(self, entry, ids, cards):
+        for card_id, note in cards:
+            if card_id in entry.missing:
+                entry.notes[card_id] = note
+        # Ids cardsInfo did not return (deleted cards) are settled too.
+        entry.missing.difference_update(ids)
+        entry.bump()
+
+    def note(self, card_id, deck=None):
+        """The cached Note of a card, looking in ``deck`` first; None if not loaded."""
+        with self.lock:
+            entry = self.entries.get(deck)
+            if entry is not None and card_id in entry.notes:
+                return entry.notes[card_id]
+            for entry in self.entries.values():
+                note = entry.notes.get(card_id)
+                if note is not None:
+                    return note
+            return None
+
+    def remove_card(self, card_id):
+        """Drop a card from every cached deck; returns the decks it was in."""
+        with self.lock:
+            decks = set()
+            for deck, entry in self.entries.items():
+                if entry.notes.pop(card_id, None) is not None:
+                    decks.add(deck)
+                    entry.bump()
+                elif card_id in entry.missing:
+                    # Not loaded yet (a later page): make sure it never arrives.
+                    entry.missing.discard(card_id)
+                    entry.bump()
+            return decks
+
+    def invalidate(self, deck=None):
+        with self.lock:
+            if deck is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(deck, None)
+
+    def card_count(self):
+        with self.lock:
+            return sum(len(e.notes) for e in self.entries.values())
+
+    def _evict(self):
+        while len(self.entries) > self.max_decks:
+            self.entries.popitem(last=False)
+        if self.max_cards is not None:
+            total = self.card_count()
+            while total > self.max_cards and len(self.entries) > 1:
+                _, entry = self.entries.popitem(last=False)
+                total -= len(entry.notes)
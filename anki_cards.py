@@ -0,0 +1,112 @@
+import sys
+import threading
+import weakref
+
+from anki_fields import compile_plan
+
+
+class Note:
+    """Question/answer text of one note, shared by all of its cards.
+
+    ``match_key`` is the answer prepared for answer checking, if any.
+    """
+
+    __slots__ = ("note_id", "question", "answer", "match_key", "__weakref__")
+
+    def __init__(self, note_id, question, answer, match_key=None):
+        self.note_id = note_id
+        self.question = question
+        self.answer = answer
+        self.match_key = match_key
+
+
+def _intern(value):
+    # Short fields (commands, single words) repeat a lot across notes.
+    return sys.intern(value) if len(value) <= 64 else value
+
+
+class NoteStore:
+    """Deduplicates Note objects across every cached deck.
+
+    Held weakly: once no cached deck references a note it is freed, so the
+    store never outgrows the deck cache.
+    """
+
+    def __init__(self, field_map=None, prepare=None):
+        self.notes = weakref.WeakValueDictionary()
+        self.field_map = field_map or {}
+        self.prepare = prepare
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def configure(self, field_map):
+        with self.lock:
+            self.field_map = field_map
+            self.plans = {}
+
+    def plan(self, model, fields):
+        """The extraction plan for a note type, compiled on first use."""
+        plan = self.plans.get(model)
+        if plan is None or not plan.fits(fields):
+            plan = self.plans[model] = compile_plan(self.field_map, model, fields)
+        return plan
+
+    def _note(self, key, note_id, question, answer):
+        note = self.notes.get(key)
+        if note is None or note.question != question or note.answer != answer:
+            answer = _intern(answer)
+            match_key = self.prepare(answer) if self.prepare else None
+            if match_key == answer:
+                match_key = answer  # share the string rather than keep an equal copy
+            note = self.notes[key] = Note(note_id, _intern(question), answer, match_key)
+        return note
+
+    def build(self, cards_info, notes_info):
+        """``(card_id, Note)`` pairs for cardsInfo.
+
+        Cards of one note share a Note, except for cloze notes where each
+        card (``ord``) asks a different deletion. Decks may mix note types.
+        """
+        notes, clozes = {}, {}
+        with self.lock:
+            for n in notes_info:
+                note_id, fields = n["noteId"], n["fields"]
+                plan = self.plan(n["modelName"], fields)
+                if plan.cloze:
+                    clozes[note_id] = (plan, fields)
+                else:
+                    notes[note_id] = self._note(note_id, note_id, *plan.extract(fields))
+            if not clozes:
+                return [(c["cardId"], notes[c["note"]]) for c in cards_info]
+            cards = []
+            for c in cards_info:
+                note_id = c["note"]
+                note = notes.get(note_id)
+                if note is None:
+                    plan, fields = clozes[note_id]
+                    note = self._note((note_id, c["ord"]), note_id, *plan.extract(fields, c["ord"]))
+                cards.append((c["cardId"], note))
+            return cards
+
+    def from_rows(self, rows):
+        """Inverse of to_rows(), used when restoring a snapshot."""
+        with self.lock:
+            return [(card_id, self._note(note_id, note_id, q, a)) for card_id, note_id, q, a in rows]
+
+
+def to_rows(cards):
+    return [[card_id, n.note_id, n.question, n.answer] for card_id, n in cards]
+
+
+def to_dicts(cards):
+    """The JSON shape served by /api/cards."""
+    return [{"card_id": card_id, "question": n.question, "answer": n.answer} for card_id, n in cards]
+
+
+def to_columns(cards):
+    """/api/cards with ``format=columns``: one list per field instead of a dict per card."""
+    return {
+        "card_id": [card_id for card_id, _ in cards],
+        "question": [n.question for _, n in cards],
+        "answer": [n.answer for _, n in cards],
+    }
@@ -0,0 +1,303 @@
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from anki_metrics import SIZE_BUCKETS, metrics
+
+REQUEST_SECONDS = metrics.histogram(
+    "ankiconnect_request_seconds", "AnkiConnect round trip time by action")
+QUEUE_SECONDS = metrics.histogram(
+    "ankiconnect_queue_seconds", "Time AnkiConnect calls waited for an in-flight slot")
+DECODE_SECONDS = metrics.histogram(
+    "ankiconnect_decode_seconds", "Time decoding AnkiConnect JSON replies by action")
+REQUEST_BYTES = metrics.histogram(
+    "ankiconnect_request_bytes", "AnkiConnect request body size by action", SIZE_BUCKETS)
+RESPONSE_BYTES = metrics.histogram(
+    "ankiconnect_response_bytes", "AnkiConnect reply body size by action", SIZE_BUCKETS)
+ERRORS = metrics.counter("ankiconnect_errors_total", "Failed AnkiConnect calls by action")
+COALESCED = metrics.counter(
+    "ankiconnect_coalesced_total", "AnkiConnect calls answered by an identical call in flight")
+CANCELLED = metrics.counter("ankiconnect_cancelled_total", "AnkiConnect calls cancelled by their caller")
+
+# Actions that only read the collection; identical concurrent calls of
+# these are answered by a single request.
+READ_ONLY_ACTIONS = frozenset({
+    "version", "deckNames", "deckNamesAndIds", "getActiveProfile",
+    "findCards", "findNotes", "cardsInfo", "notesInfo", "cardsModTime",
+    "getDeckStats", "getNumCardsReviewedToday", "modelNames", "modelFieldNames",
+})
+
+# Actions taking a list of ids that can be split across several requests,
+# mapped to the name of that parameter. Each returns one entry per id.
+CHUNKED_ACTIONS = {"cardsInfo": "cards", "notesInfo": "notes", "cardsModTime": "cards"}
+
+
+class AnkiConnectError(Exception):
+    pass
+
+
+class AnkiConnectUnavailable(AnkiConnectError):
+    """AnkiConnect could not be reached or did not answer over HTTP."""
+
+
+class AnkiConnectCancelled(AnkiConnectError):
+    """The call was cancelled (see ``AnkiConnect.cancel``)."""
+
+
+class AsyncAnkiConnect:
+    """AnkiConnect client for an asyncio event loop.
+
+    Requests go out through a pooled ``requests.Session`` (up to
+    ``pool_size`` keep-alive connections) on a thread pool, so the loop
+    never blocks on them. At most ``max_inflight`` requests are sent at once
+    so a burst of loads cannot swamp Anki, which answers one request at a
+    time on its main thread. ``cardsInfo``/``notesInfo`` calls with more
+    than ``chunk_size`` ids are split into concurrent requests, no more of
+    them than can be in flight at once (extra chunks would only wait a
+    round trip for a slot).
+
+    Concurrent identical read-only calls (see READ_ONLY_ACTIONS) share one
+    request unless ``coalesce`` is off; writes always go out on their own.
+    A shared request is only cancelled once every caller waiting on it is.
+    A cancelled request stops being waited for at once; its HTTP exchange
+    finishes (or times out) on its thread.
+    """
+
+    def __init__(self, url, version=6, pool_size=8, timeout=None, coalesce=True,
+                 max_inflight=4, chunk_size=500):
+        self.url = url
+        self.version = version
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self.max_inflight = max_inflight
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        # One retry, for connections that fail to open: a POST that may have
+        # reached Anki is never sent twice.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_inflight, thread_name_prefix="anki-http")
+        self.flights = {}   # request body -> [task, callers waiting]
+        self.slots = None   # semaphore, created on the loop that first uses it
+        self.in_flight = 0
+        self.last_reply = 0.0  # time.monotonic() of the last HTTP reply
+
+    # ------------------- HTTP -------------------
+    def _send(self, body, timeout):
+        r = self.session.post(self.url, data=body, timeout=timeout,
+                              headers={"Content-Type": "application/json"})
+        return r.status_code, r.content
+
+    async def _post(self, label, body, timeout=None):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_inflight)
+        queued = time.perf_counter()
+        async with self.slots:
+            self.in_flight += 1
+            start = time.perf_counter()
+            QUEUE_SECONDS.observe(start - queued)
+            try:
+                status, data = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._send, body, timeout or self.timeout)
+            except requests.Timeout:
+                ERRORS.inc(action=label)
+                raise AnkiConnectUnavailable(f"{label}: timed out") from None
+            except requests.RequestException as e:
+                ERRORS.inc(action=label)
+                raise AnkiConnectUnavailable(f"{label}: {e}") from e
+            finally:
+                self.in_flight -= 1
+        self.last_reply = time.monotonic()
+        if status >= 400:
+            ERRORS.inc(action=label)
+            raise AnkiConnectUnavailable(f"{label}: HTTP {status}")
+        decode_start = time.perf_counter()
+        reply = json.loads(data)
+        end = time.perf_counter()
+        REQUEST_SECONDS.observe(decode_start - start, action=label)
+        DECODE_SECONDS.observe(end - decode_start, action=label)
+        REQUEST_BYTES.observe(len(body), action=label)
+        RESPONSE_BYTES.observe(len(data), action=label)
+        return reply
+
+    # ------------------- calls -------------------
+    async def _shared(self, body, make):
+        flight = self.flights.get(body)
+        if flight is None:
+            flight = self.flights[body] = [asyncio.ensure_future(make()), 0]
+
+            def landed(task):
+                if self.flights.get(body) is flight:
+                    del self.flights[body]
+            flight[0].add_done_callback(landed)
+        else:
+            COALESCED.inc()
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        except asyncio.CancelledError:
+            if flight[1] == 1:
+                flight[0].cancel()  # nobody else is waiting for it
+            raise
+        finally:
+            flight[1] -= 1
+
+    async def invoke(self, action, timeout=None, **params):
+        name = CHUNKED_ACTIONS.get(action)
+        ids = params.get(name) if name else None
+        if ids and len(ids) > self.chunk_size and self.max_inflight > 1:
+            ids = list(ids)
+            size = max(self.chunk_size, -(-len(ids) // self.max_inflight))
+            chunks = await asyncio.gather(*(
+                self._invoke(action, timeout, dict(params, **{name: ids[i:i + size]}))
+                for i in range(0, len(ids), size)
+            ))
+            return [item for chunk in chunks for item in chunk]
+        return await self._invoke(action, timeout, params)
+
+    async def _invoke(self, action, timeout, params):
+        payload = {"action": action, "version": self.version, "params": params}
+        label = _label(action, params)
+        if not self.coalesce or not _read_only(action, params):
+            return _unwrap(action, await self._post(label, json.dumps(payload).encode(), timeout))
+        # The request body doubles as the coalescing key.
+        body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+        return _unwrap(action, await self._shared(body, lambda: self._post(label, body, timeout)))
+
+    async def multi(self, actions, timeout=None):
+        """Run several ``(action, params)`` pairs in one ``multi`` round trip.
+
+        Results come back in the same order as ``actions``; the first failing
+        action raises AnkiConnectError.
+        """
+        actions = list(actions)
+        replies = await self.invoke("multi", timeout=timeout, actions=[
+            {"action": action, "version": self.version, "params": params}
+            for action, params in actions
+        ])
+        return [_unwrap(action, reply) for (action, _), reply in zip(actions, replies)]
+
+    async def gather(self, actions, timeout=None):
+        """Run ``(action, params)`` pairs as concurrent requests, large id lists chunked.
+
+        Unlike ``multi`` the replies are fetched in parallel, which is
+        faster when each action returns a lot of data.
+        """
+        return list(await asyncio.gather(*(self.invoke(action, timeout, **params)
+                                           for action, params in actions)))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+class AnkiConnect:
+    """Blocking facade over AsyncAnkiConnect for the Flask routes and worker threads.
+
+    Calls run on an event loop in a background thread, so calls made from
+    different threads (a stats refresh and a deck load, say) overlap on
+    the same connection pool. Calls made inside ``with client.group(key):``
+    can be abandoned together with ``client.cancel(key)``; the waiting
+    threads then raise AnkiConnectCancelled. ``on_unavailable`` (if set)
+    is called with each AnkiConnectUnavailable before it is raised.
+    """
+
+    def __init__(self, url, version=6, pool_size=8, timeout=None, coalesce=True,
+                 max_inflight=4, chunk_size=500):
+        self.url = url
+        self.version = version
+        self.aio = AsyncAnkiConnect(url, version, pool_size, timeout, coalesce, max_inflight, chunk_size)
+        self.loop = asyncio.new_event_loop()
+        self.groups = {}  # group -> futures of its calls in flight
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.on_unavailable = None
+        threading.Thread(target=self.loop.run_forever, name="anki-io", daemon=True).start()
+
+    @contextmanager
+    def group(self, key):
+        previous = getattr(self.local, "group", None)
+        self.local.group = key
+        try:
+            yield
+        finally:
+            self.local.group = previous
+
+    def cancel(self, key):
+        """Cancel the calls in flight for group ``key``; returns how many there were."""
+        with self.lock:
+            futures = self.groups.pop(key, ())
+        cancelled = sum(future.cancel() for future in futures)
+        CANCELLED.inc(cancelled)
+        return cancelled
+
+    def _call(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        key = getattr(self.local, "group", None)
+        if key is not None:
+            with self.lock:
+                self.groups.setdefault(key, set()).add(future)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise AnkiConnectCancelled(f"cancelled: {key!r}") from None
+        except AnkiConnectUnavailable as e:
+            if self.on_unavailable is not None:
+                self.on_unavailable(e)
+            raise
+        finally:
+            if key is not None:
+                with self.lock:
+                    futures = self.groups.get(key)
+                    if futures is not None:
+                        futures.discard(future)
+                        if not futures:
+                            del self.groups[key]
+
+    def invoke(self, action, timeout=None, **params):
+        return self._call(self.aio.invoke(action, timeout, **params))
+
+    def multi(self, actions, timeout=None):
+        return self._call(self.aio.multi(actions, timeout))
+
+    def gather(self, actions, timeout=None):
+        return self._call(self.aio.gather(actions, timeout))
+
+    def in_flight(self):
+        return self.aio.in_flight
+
+    def last_reply(self):
+        return self.aio.last_reply
+
+    def close(self):
+        self.aio.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def _label(action, params):
+    # Metrics label: "multi" alone would hide what the round trip carried.
+    if action == "multi":
+        return "multi(" + ",".join(sorted({a.get("action", "?") for a in params.get("actions", ())})) + ")"
+    return action
+
+
+def _read_only(action, params):
+    if action == "multi":
+        return all(a.get("action") in READ_ONLY_ACTIONS for a in params.get("actions", ()))
+    return action in READ_ONLY_ACTIONS
+
+
+def _unwrap(action, reply):
+    if not isinstance(reply, dict) or "result" not in reply:
+        raise AnkiConnectError(f"{action}: unexpected reply {reply!r}")
+    if reply.get("error"):
+        ERRORS.inc(action=action)
+        raise AnkiConnectError(f"{action}: {reply['error']}")
+    return reply["result"]
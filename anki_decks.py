@@ -0,0 +1,100 @@
+import threading
+
+
+class DeckNode:
+    __slots__ = ("name", "full", "parent", "children", "own", "total")
+
+    def __init__(self, name, full, parent):
+        self.name = name
+        self.full = full
+        self.parent = parent
+        self.children = {}
+        self.own = [0, 0]    # learn, review of cards directly in this deck
+        self.total = [0, 0]  # own plus every subdeck
+
+
+class DeckIndex:
+    """Trie of the ``A::B::C`` deck hierarchy with rolled-up learn/review counts.
+
+    Lookups go through a name -> node map, children come straight off the
+    node, and a count change walks only the deck's ancestors.
+    """
+
+    def __init__(self, decks=()):
+        self.root = DeckNode("", "", None)
+        self.nodes = {}
+        self.lock = threading.RLock()
+        self.update(decks)
+
+    def _node(self, deck):
+        node = self.nodes.get(deck)
+        if node is None:
+            parent_name, _, name = deck.rpartition("::")
+            parent = self._node(parent_name) if parent_name else self.root
+            node = parent.children[name] = self.nodes[deck] = DeckNode(name, deck, parent)
+        return node
+
+    def update(self, decks):
+        """Sync the trie with a new deck list, touching only decks that changed."""
+        with self.lock:
+            wanted = set(decks)
+            for deck in sorted(set(self.nodes) - wanted, key=len, reverse=True):
+                node = self.nodes.get(deck)
+                if node is not None and not node.children:
+                    self._add(node, -node.own[0], -node.own[1])
+                    del node.parent.children[node.name]
+                    del self.nodes[deck]
+            for deck in decks:
+                self._node(deck)
+
+    def set_stats(self, stats):
+        """Replace every deck's own counts and recompute the rolled-up totals."""
+        with self.lock:
+            for node in self.nodes.values():
+                node.own = [0, 0]
+            for deck, counts in stats.items():
+                self._node(deck).own = [counts["learn"], counts["review"]]
+            self._rollup(self.root)
+
+    def _rollup(self, node):
+        learn, review = node.own
+        for child in node.children.values():
+            self._rollup(child)
+            learn += child.total[0]
+            review += child.total[1]
+        node.total = [learn, review]
+
+    def adjust(self, deck, learn, review):
+        """Apply a count delta to one deck and its ancestors."""
+        with self.lock:
+            node = self._node(deck)
+            node.own[0] += learn
+            node.own[1] += review
+            self._add(node, learn, review)
+
+    def _add(self, node, learn, review):
+        while node is not None:
+            node.total[0] += learn
+            node.total[1] += review
+            node = node.parent
+
+    def children(self, deck=None):
+        """Direct subdecks of ``deck`` (top-level decks when None) with their totals."""
+        with self.lock:
+            node = self.root if deck is None else self.nodes.get(deck)
+            if node is None:
+                return []
+            return [
+                {"full": c.full, "name": c.name, "learn": c.total[0], "review": c.total[1]}
+                for c in node.children.values()
+            ]
+
+    def all_totals(self):
+        """``{deck: (learn, review)}`` rolled-up counts of every deck."""
+        with self.lock:
+            return {full: (node.total[0], node.total[1]) for full, node in self.nodes.items()}
+
+    def totals(self, deck):
+        with self.lock:
+            node = self.nodes.get(deck)
+            return {"learn": node.total[0], "review": node.total[1]} if node else {"learn": 0, "review": 0}
@@ -0,0 +1,148 @@
+import itertools
+import queue
+import threading
+import time
+
+from anki_payload import dumps
+
+
+class EventBus:
+    """Fans server events out to server-sent-event subscribers.
+
+    Each subscriber has a bounded queue; a client too slow to keep up loses
+    its oldest events rather than holding up the publisher. Past
+    ``max_clients``, a new subscriber takes the place of the oldest, whose
+    stream ends: browsers do not always close the streams of pages left.
+    """
+
+    def __init__(self, max_clients=4, max_queue=100):
+        self.max_clients = max_clients
+        self.max_queue = max_queue
+        self.queues = {}  # insertion ordered, oldest first
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        """A new subscriber queue, dropping the oldest when max_clients are connected."""
+        with self.lock:
+            dropped = []
+            while len(self.queues) >= self.max_clients:
+                oldest = next(iter(self.queues))
+                del self.queues[oldest]
+                dropped.append(oldest)
+            q = queue.Queue(self.max_queue)
+            self.queues[q] = None
+        for old in dropped:
+            self._put(old, None)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.queues.pop(q, None)
+
+    def subscribers(self):
+        with self.lock:
+            return len(self.queues)
+
+    def publish(self, event, data, to=None):
+        """Send ``event`` to every subscriber, or only to the queue ``to``."""
+        item = (next(self.ids), event, dumps(data).decode())
+        with self.lock:
+            targets = [to] if to is not None else list(self.queues)
+        for q in targets:
+            self._put(q, item)
+
+    @staticmethod
+    def _put(q, item):
+        # Make room by dropping the oldest event rather than blocking.
+        while True:
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        """Ask every stream to end (their clients reconnect on their own)."""
+        with self.lock:
+            targets = list(self.queues)
+        for q in targets:
+            self._put(q, None)
+
+    def stream(self, q, keepalive=15):
+        """``text/event-stream`` chunks for subscriber ``q``; unsubscribes when closed."""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    item = q.get(timeout=keepalive)
+                except queue.Empty:
+                    # Comment lines keep proxies from timing out and reveal dead clients.
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    return
+                event_id, event, data = item
+                yield f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+        finally:
+            self.unsubscribe(q)
+
+
+class AdaptiveInterval:
+    """How long the stats refresh sleeps between runs.
+
+    ``fast`` while someone is studying (activity in the last
+    ``active_window`` seconds); ``normal`` after a refresh that found
+    changes; otherwise it doubles up to ``slow``, but no further than
+    ``normal`` while a page is watching for updates. ``wake()`` (e.g.
+    grades reaching Anki) brings the next run forward, though never to
+    less than ``min_gap`` after the previous one.
+    """
+
+    def __init__(self, fast=15, normal=60, slow=600, active_window=120, min_gap=3):
+        self.fast = fast
+        self.normal = normal
+        self.slow = slow
+        self.active_window = active_window
+        self.min_gap = min_gap
+        self.interval = normal
+        self.last_activity = 0.0
+        self.last_run = None
+        self._wake = threading.Event()
+
+    def touch(self):
+        self.last_activity = time.time()
+        if self.interval > self.normal:
+            self.wake()
+
+    def wake(self):
+        self._wake.set()
+
+    def active(self):
+        return time.time() - self.last_activity < self.active_window
+
+    def update(self, changed, watching=False):
+        if self.active():
+            self.interval = self.fast
+        elif changed or self.interval < self.normal:
+            self.interval = self.normal
+        else:
+            self.interval = min(self.interval * 2, self.normal if watching else self.slow)
+        return self.interval
+
+    def sleep(self):
+        """Block until the next refresh is due."""
+        if self.last_run is None:
+            self.last_run = time.time()
+        deadline = self.last_run + self.interval
+        while True:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            if self._wake.wait(timeout):
+                self._wake.clear()
+                deadline = min(deadline, self.last_run + self.min_gap)
+        self.last_run = time.time()
@@ -0,0 +1,112 @@
+import html
+import json
+import os
+import re
+
+# A rule per note type (``modelName``), with "*" applying to every type:
+#
+#   {"*":      {"strip_html": true},
+#    "Basic":  {"question": "Front", "answer": "Back"},
+#    "Cloze":  {"question": "Text", "cloze": true}}
+#
+# "question"/"answer" are field names or positions in field order (0 is the
+# first field, -1 the last); the defaults are the first and last field.
+DEFAULT_RULE = {"question": 0, "answer": -1, "strip_html": False, "cloze": False}
+
+_BREAK = re.compile(r"<br\s*/?>|</(?:div|p|li|tr)>", re.I)
+_DROP = re.compile(r"<(style|script)\b.*?</\1>|\[sound:[^\]]*\]", re.I | re.S)
+_TAG = re.compile(r"<[^>]*>")
+_CLOZE = re.compile(r"\{\{c(\d+)::(.*?)(?:::(.*?))?\}\}", re.S)
+
+
+def strip_html(value):
+    """Plain text of a field: tags and media removed, entities decoded."""
+    if "<" not in value and "&" not in value and "[sound:" not in value:
+        return value
+    value = _TAG.sub("", _BREAK.sub("\n", _DROP.sub("", value)))
+    lines = (" ".join(line.split()) for line in html.unescape(value).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def cloze(text, number):
+    """``(question, answer)`` for cloze deletion ``number`` of ``text``.
+
+    The deletion is replaced by ``[...]`` (or ``[hint]``) and becomes the
+    answer; other deletions are shown as plain text.
+    """
+    answers = []
+
+    def replace(m):
+        if int(m.group(1)) != number:
+            return m.group(2)
+        answers.append(m.group(2))
+        return f"[{m.group(3)}]" if m.group(3) else "[...]"
+
+    return _CLOZE.sub(replace, text), ", ".join(answers)
+
+
+class FieldPlan:
+    """Compiled rule for one note type: field names resolved up front."""
+
+    __slots__ = ("question", "answer", "strip", "cloze")
+
+    def __init__(self, question, answer, strip=False, cloze=False):
+        self.question = question
+        self.answer = answer
+        self.strip = strip
+        self.cloze = cloze
+
+    def fits(self, fields):
+        return self.question in fields and (self.cloze or self.answer in fields)
+
+    def extract(self, fields, ord=0):
+        question = fields[self.question]["value"]
+        if self.cloze:
+            question, answer = cloze(question, ord + 1)
+        else:
+            answer = fields[self.answer]["value"]
+        if self.strip:
+            return strip_html(question), strip_html(answer)
+        return question, answer
+
+
+def _resolve(ref, ordered, default):
+    if isinstance(ref, str):
+        if ref in ordered:
+            return ref
+        ref = default
+    try:
+        return ordered[ref]
+    except IndexError:
+        return ordered[default]
+
+
+def compile_plan(field_map, model, fields):
+    rule = {**DEFAULT_RULE, **field_map.get("*", {}), **field_map.get(model, {})}
+    ordered = sorted(fields, key=lambda name: fields[name]["order"])
+    return FieldPlan(
+        _resolve(rule["question"], ordered, 0),
+        _resolve(rule["answer"], ordered, -1),
+        bool(rule["strip_html"]),
+        bool(rule["cloze"]),
+    )
+
+
+def load_field_map(path):
+    """The field mapping from ``path``; empty (first/last field) if absent or invalid."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            field_map = json.load(f)
+        if not all(isinstance(rule, dict) for rule in field_map.values()):
+            raise ValueError("each note type needs an object of options")
+        for model, rule in field_map.items():
+            for key in ("question", "answer"):
+                ref = rule.get(key, 0)
+                if isinstance(ref, bool) or not isinstance(ref, (str, int)):
+                    raise ValueError(f"{model}: {key} must be a field name or position, not {ref!r}")
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Ignoring field mapping {path}: {e}")
+        return {}
+    return field_map
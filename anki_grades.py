@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class GradeQueue:
+    """Grades waiting to be written to Anki, flushed in batches by a worker.
+
+    Every grade is appended to a JSON-lines journal before it is queued, and
+    marked done/failed once Anki has answered, so grades still pending when
+    AnkiConnect is unreachable (or the app exits) are replayed on the next
+    start. Delivery is at-least-once.
+
+    Grades that had to wait (for Anki to come back, or from the journal)
+    are replayed in batches of up to ``replay_batch_size``, and any whose
+    card was modified after the grade was made (reviewed elsewhere, or
+    already answered by a batch whose reply was lost) are set aside as
+    conflicts instead of answering the card twice.
+    """
+
+    def __init__(self, anki, journal_path, batch_size=50, linger=0.2, replay_batch_size=1000,
+                 backoff=1.0, max_backoff=60, keep_failed=100, on_done=None):
+        self.anki = anki
+        self.on_done = on_done  # called with each batch Anki accepted
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.linger = linger
+        self.replay_batch_size = replay_batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cond = threading.Condition()
+        self.pending = deque()
+        self.in_flight = []
+        self.failed = deque(maxlen=keep_failed)
+        self.conflicts = deque(maxlen=keep_failed)
+        self.submitted = 0
+        self.failed_total = 0
+        self.conflicts_total = 0
+        self.replaying = False  # grades have been waiting: check them for conflicts
+        self.retries = 0
+        self.last_error = None
+        self.retry_at = None
+        self.next_id = 1
+        self._stopping = False
+        self._thread = None
+        self._journal = None
+        self._open_journal()
+
+    # ------------------- journal -------------------
+    def _open_journal(self):
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+        entries = {}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    if rec["op"] == "add":
+                        entries[rec["id"]] = rec
+                    else:
+                        for grade_id in rec["ids"]:
+                            entries.pop(grade_id, None)
+        for rec in entries.values():
+            self.pending.append({k: rec[k] for k in ("id", "cardId", "ease", "ts")})
+        if entries:
+            self.next_id = max(entries) + 1
+            self.replaying = True
+            print(f"Replaying {len(entries)} journaled grade(s)")
+        self._rewrite_journal()
+
+    def _rewrite_journal(self):
+        if self._journal:
+            self._journal.close()
+        tmp = self.journal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for g in list(self.in_flight) + list(self.pending):
+                f.write(json.dumps(dict(g, op="add")) + "\n")
+        os.replace(tmp, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _log(self, rec):
+        self._journal.write(json.dumps(rec) + "\n")
+        self._journal.flush()
+
+    # ------------------- public -------------------
+    def submit(self, card_id, ease):
+        with self.cond:
+            grade = {"id": self.next_id, "cardId": card_id, "ease": ease, "ts": time.time()}
+            self.next_id += 1
+            self._log(dict(grade, op="add"))
+            self.pending.append(grade)
+            self.cond.notify()
+        return grade["id"]
+
+    def status(self):
+        with self.cond:
+            return {
+                "pending": len(self.pending) + len(self.in_flight),
+                "submitted": self.submitted,
+                "failed": self.failed_total,
+                "conflicts": self.conflicts_total,
+                "retries": self.retries,
+                "last_error": self.last_error,
+                "retry_in": max(0, round(self.retry_at - time.time(), 1)) if self.retry_at else None,
+                "recent_failures": list(self.failed),
+                "recent_conflicts": list(self.conflicts),
+            }
+
+    def card_ids(self):
+        """Cards with a grade not yet written to Anki."""
+        with self.cond:
+            return {g["cardId"] for g in self.in_flight} | {g["cardId"] for g in self.pending}
+
+    def retry_now(self):
+        """Cut a failed batch's backoff short (e.g. Anki has just come back)."""
+        with self.cond:
+            if self.retry_at is not None:
+                self.retry_at = time.time()
+                self.cond.notify_all()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="grade-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        with self.cond:
+            self._stopping = True
+            self.cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # ------------------- worker -------------------
+    def _take_batch(self):
+        with self.cond:
+            while not self.pending and not self._stopping:
+                self.cond.wait()
+            if self._stopping:
+                return None
+            if self.replaying:
+                size = self.replay_batch_size
+            else:
+                size = self.batch_size
+                # Give a fast typist's next few grades a moment to join the batch.
+                deadline = time.time() + self.linger
+                while len(self.pending) < size and not self._stopping:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            while self.pending and len(self.in_flight) < size:
+                self.in_flight.append(self.pending.popleft())
+            return list(self.in_flight), self.replaying
+
+    def _run(self):
+        delay = self.backoff
+        while True:
+            taken = self._take_batch()
+            if taken is None:
+                return
+            batch, replaying = taken
+            try:
+                if replaying:
+                    batch = self._drop_conflicts(batch)
+                results = self.anki.invoke(
+                    "answerCards", answers=[{"cardId": g["cardId"], "ease": g["ease"]} for g in batch]
+                ) if batch else []
+            except Exception as e:
+                with self.cond:
+                    self.pending.extendleft(reversed(self.in_flight))
+                    self.in_flight = []
+                    self.replaying = True
+                    self.retries += 1
+                    self.last_error = str(e)
+                    self.retry_at = time.time() + delay
+                    print(f"Grade submission failed, retrying in {delay:g}s:", e)
+                    while not self._stopping and time.time() < self.retry_at:
+                        self.cond.wait(self.retry_at - time.time())
+                    self.retry_at = None
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            delay = self.backoff
+            if not isinstance(results, list):
+                results = [bool(results)] * len(batch)
+            done = self._finish(batch, results)
+            if done and self.on_done:
+                try:
+                    self.on_done(done)
+                except Exception as e:
+                    print("Grade callback failed:", e)
+
+    def _drop_conflicts(self, batch):
+        """``batch`` without grades whose card Anki modified after they were made."""
+        mods = {c["cardId"]: c["mod"] for c in self.anki.invoke(
+            "cardsModTime", cards=list({g["cardId"] for g in batch}))}
+        conflicts = [g for g in batch if mods.get(g["cardId"], 0) > g["ts"]]
+        if not conflicts:
+            return batch
+        with self.cond:
+            self._log({"op": "conflict", "ids": [g["id"] for g in conflicts]})
+            self.conflicts.extend(dict(g, mod=mods[g["cardId"]]) for g in conflicts)
+            self.conflicts_total += len(conflicts)
+            ids = {g["id"] for g in conflicts}
+            self.in_flight = [g for g in self.in_flight if g["id"] not in ids]
+        print(f"Skipped {len(conflicts)} grade(s) for cards reviewed since")
+        return [g for g in batch if g["id"] not in ids]
+
+    def _finish(self, batch, results):
+        with self.cond:
+            done, failed = [], []
+            for grade, ok in zip(batch, results):
+                (done if ok else failed).append(grade)
+            if done:
+                self._log({"op": "done", "ids": [g["id"] for g in done]})
+            if failed:
+                self._log({"op": "fail", "ids": [g["id"] for g in failed]})
+                self.failed.extend(failed)
+                print(f"Anki rejected {len(failed)} grade(s)")
+            self.submitted += len(done)
+            self.failed_total += len(failed)
+            self.last_error = None
+            self.in_flight = []
+            if not self.pending:
+                self.replaying = False
+                self._rewrite_journal()
+        return done
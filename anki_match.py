@@ -0,0 +1,124 @@
+from difflib import SequenceMatcher
+
+# How a typed answer is compared with the expected one:
+#   exact       identical, including surrounding whitespace
+#   case        identical after trimming (commands are case-sensitive)
+#   ignore_case case-insensitive after trimming
+#   whitespace  runs of whitespace count as one space
+#   edit        whitespace-normalized, within a few typos (edit distance)
+#   tokens      whitespace-normalized, compared word by word with a diff
+MODES = ("exact", "case", "ignore_case", "whitespace", "edit", "tokens")
+DEFAULT_EASES = {"exact": 3, "close": 2, "wrong": 1}
+
+
+def _normalize(mode, text):
+    if mode == "exact":
+        return text
+    if mode == "case":
+        return text.strip()
+    if mode == "ignore_case":
+        return text.strip().casefold()
+    return " ".join(text.split())
+
+
+def bounded_distance(a, b, limit):
+    """Levenshtein distance of ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``.
+
+    Only a band of ``2 * limit + 1`` cells per row is computed, so the cost
+    is O(len(a) * limit).
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    over = limit + 1
+    prev = {j: j for j in range(min(len(b), limit) + 1)}
+    for i in range(1, len(a) + 1):
+        lo, hi = max(0, i - limit), min(len(b), i + limit)
+        row = {}
+        best = over
+        for j in range(lo, hi + 1):
+            if j == 0:
+                d = i
+            else:
+                d = min(
+                    prev.get(j, over) + 1,
+                    row.get(j - 1, over) + 1,
+                    prev.get(j - 1, over) + (a[i - 1] != b[j - 1]),
+                )
+            row[j] = d
+            best = min(best, d)
+        if best > limit:
+            return over
+        prev = row
+    return min(prev.get(len(b), over), over)
+
+
+def token_diff(expected, typed):
+    """Word-level opcodes turning ``expected`` into ``typed``, plus their similarity."""
+    matcher = SequenceMatcher(None, expected, typed, autojunk=False)
+    ops = [
+        {"op": op, "expected": expected[i1:i2], "typed": typed[j1:j2]}
+        for op, i1, i2, j1, j2 in matcher.get_opcodes()
+    ]
+    return ops, matcher.ratio()
+
+
+class Matcher:
+    """Scores typed answers and maps the result to an Anki ease.
+
+    ``prepare`` gives the normalized form of an answer in the default mode;
+    it is computed once when a card is cached and passed back to ``check``.
+    """
+
+    def __init__(self, mode="case", max_distance=2, min_token_ratio=0.8, eases=None):
+        if mode not in MODES:
+            raise ValueError(f"unknown match mode: {mode!r} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.max_distance = max_distance
+        self.min_token_ratio = min_token_ratio
+        self.eases = {**DEFAULT_EASES, **(eases or {})}
+
+    def prepare(self, answer):
+        return _normalize(self.mode, answer)
+
+    def check(self, typed, answer, prepared=None, mode=None):
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"unknown match mode: {mode!r}")
+        expected = prepared if prepared is not None and mode == self.mode else _normalize(mode, answer)
+        typed = _normalize(mode, typed)
+        result = {"mode": mode, "expected": answer}
+        if typed == expected:
+            quality, score = "exact", 1.0
+        elif mode == "edit":
+            # A quarter of the answer, at most max_distance: "ls" must be typed exactly.
+            limit = min(self.max_distance, len(expected) // 4)
+            distance = bounded_distance(expected, typed, limit)
+            if distance <= limit:
+                result["distance"] = distance
+                quality, score = "close", 1 - distance / len(expected)
+            else:
+                quality, score = "wrong", 0.0
+        elif mode == "tokens":
+            ops, score = token_diff(expected.split(), typed.split())
+            result["diff"] = ops
+            quality = "close" if score >= self.min_token_ratio else "wrong"
+        else:
+            quality, score = "wrong", 0.0
+        result.update(quality=quality, correct=quality != "wrong", score=score,
+                      ease=self.eases[quality])
+        return result
+
+
+def summarize(results):
+    """Counts per quality and the mean score of a batch of check results."""
+    summary = {"exact": 0, "close": 0, "wrong": 0, "checked": 0, "score": 0.0}
+    for r in results:
+        if "quality" in r:
+            summary[r["quality"]] += 1
+            summary["checked"] += 1
+            summary["score"] += r["score"]
+    if summary["checked"]:
+        summary["score"] /= summary["checked"]
+    return summary
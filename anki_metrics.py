@@ -0,0 +1,254 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", r"\\").replace('"', r"\"")) for k, v in key)
+    return "{" + body + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _labels(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def to_json(self):
+        with self.lock:
+            return {_format_labels(key): value for key, value in self.values.items()}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, series in self.series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    out.append((self.name + "_bucket", key + (("le", le),), cumulative))
+                out.append((self.name + "_sum", key, series[-2]))
+                out.append((self.name + "_count", key, series[-1]))
+        return out
+
+    def quantile(self, series, q):
+        """Upper bucket bound holding the ``q`` quantile (bucket resolution)."""
+        target, seen = q * series[-1], 0
+        for bound, count in zip(self.buckets, series):
+            seen += count
+            if seen >= target:
+                return bound
+        return None  # above the largest bucket
+
+    def to_json(self):
+        with self.lock:
+            return {
+                _format_labels(key): {
+                    "count": series[-1],
+                    "sum": round(series[-2], 6),
+                    "avg": round(series[-2] / series[-1], 6) if series[-1] else None,
+                    "p50": self.quantile(series, 0.5),
+                    "p95": self.quantile(series, 0.95),
+                    "p99": self.quantile(series, 0.99),
+                }
+                for key, series in self.series.items()
+            }
+
+
+class Gauge:
+    """A value read when metrics are collected.
+
+    ``fn()`` returns a number, or ``(labels, number)`` pairs for a labelled gauge.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def _values(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return {}
+        if isinstance(value, (int, float)):
+            return {(): value}
+        return {_labels(labels): v for labels, v in value}
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self._values().items()]
+
+    def to_json(self):
+        return {_format_labels(key): value for key, value in self._values().items()}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self._add(Counter(name, help))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def gauge(self, name, help, fn):
+        with self.lock:
+            metric = self.metrics[name] = Gauge(name, help, fn)  # latest app wins
+            return metric
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return {name: metric.to_json() for name, metric in list(self.metrics.items())}
+
+
+metrics = Registry()
+
+
+def _collapse(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at an interval while enabled.
+
+    Stacks are tallied in collapsed form (``outer;...;inner``, the input of
+    flamegraph tools), so the overhead is one frame walk per thread per
+    sample and nothing when stopped.
+    """
+
+    def __init__(self):
+        self.stacks = _Tally()
+        self.samples = 0
+        self.interval = 0.01
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.01, reset=True):
+        with self.lock:
+            if self.running:
+                return False
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+            self.interval = max(interval, 0.001)
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                self.samples += 1
+                for ident, frame in frames.items():
+                    if ident == me:
+                        continue
+                    self.stacks[_collapse(frame)] += 1
+
+    def report(self, top=30):
+        with self.lock:
+            return {
+                "running": self.running,
+                "interval": self.interval,
+                "samples": self.samples,
+                "started_at": self.started_at,
+                "top": [{"stack": s, "count": c} for s, c in self.stacks.most_common(top)],
+            }
+
+    def collapsed(self):
+        with self.lock:
+            return "".join(f"{s} {c}\n" for s, c in self.stacks.items())
+
+
+profiler = SamplingProfiler()
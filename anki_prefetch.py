@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Keyed loads shared between request threads and a background pool.
+
+    ``run`` performs a load in the calling thread, or waits for the same
+    key if it is already in flight; ``submit`` queues it on the pool. A
+    request arriving for a load that is still queued takes it over rather
+    than waiting behind the queue.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.executor = None
+        self.inflight = {}  # key -> [future, started]
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def run(self, key, fn):
+        with self.lock:
+            slot = self.inflight.get(key)
+            if slot is None:
+                slot = self.inflight[key] = [Future(), True]
+            elif not slot[1]:
+                slot[1] = True
+            else:
+                slot = None
+                future = self.inflight[key][0]
+        if slot is None:
+            return future.result()
+        return self._execute(key, slot[0], fn)
+
+    def submit(self, key, fn):
+        """Load ``key`` in the background; False if it is already in flight."""
+        with self.lock:
+            if self.closed or key in self.inflight:
+                return False
+            slot = self.inflight[key] = [Future(), False]
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="prefetch")
+        self.executor.submit(self._background, key, slot, fn)
+        return True
+
+    def _background(self, key, slot, fn):
+        with self.lock:
+            if slot[1]:
+                return  # a request took it over
+            if self.closed:
+                del self.inflight[key]
+                slot[0].set_result(None)
+                return
+            slot[1] = True
+        try:
+            self._execute(key, slot[0], fn)
+        except Exception as e:
+            print(f"Prefetch of {key!r} failed:", e)
+
+    def _execute(self, key, future, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def wait(self, key, timeout=None):
+        """Block until an in-flight load of ``key`` (if any) has finished."""
+        with self.lock:
+            slot = self.inflight.get(key)
+        if slot is not None and slot[1]:
+            try:
+                slot[0].result(timeout)
+            except Exception:
+                pass
+
+    def pending(self):
+        with self.lock:
+            return len(self.inflight)
+
+    def shutdown(self):
+        """Refuse new loads and drop the queued ones; loads already running finish."""
+        with self.lock:
+            self.closed = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
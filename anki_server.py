@@ -1,764 +1,1103 @@
-import subprocess
 import time
-import psutil
+PROCESS_START = time.perf_counter()
+
 import os
+import hashlib
+import sys
 import threading
-import webview
-from flask import Flask, render_template_string, jsonify
-import requests
-import win32gui
-import win32con
 import tempfile
-from collections import defaultdict
+import atexit
+import uuid
+from contextlib import contextmanager
+from flask import Blueprint, Flask, Response, g, render_template, jsonify, request
+from anki_backend import default_backend_name, make_backend
+from anki_cache import DeckCache
+from anki_cards import NoteStore, to_columns, to_dicts, to_rows
+from anki_decks import DeckIndex
+from anki_events import AdaptiveInterval, EventBus
+from anki_fields import load_field_map
+from anki_connect import AnkiConnect, AnkiConnectCancelled, AnkiConnectUnavailable
+from anki_grades import GradeQueue
+from anki_match import Matcher, summarize
+from anki_metrics import SIZE_BUCKETS, metrics, profiler
+from anki_payload import MIN_COMPRESS, compress, dumps, encodings
+from anki_prefetch import Prefetcher
+from anki_shared import make_shared
+from anki_snapshot import SnapshotStore, collection_mtime
+from anki_stats import StatsTracker
+from anki_telemetry import TelemetryStore
+from anki_supervisor import AnkiSupervisor
 
 # ------------------- CONFIG -------------------
-ANKI_CONNECT_URL = "http://localhost:8765"
+ANKI_CONNECT_URL = os.environ.get("ANKI_CONNECT_URL", "http://localhost:8765")
 ANKI_VERSION = 6
-ANKI_PATH = os.path.join(os.environ["USERPROFILE"], "AppData", "Local", "Programs", "Anki", "anki.exe")
-
-app = Flask(__name__)
-
-deck_cache = {}
+ANKI_MAX_INFLIGHT = 4  # AnkiConnect requests in flight at once
+ANKI_CHUNK_SIZE = 500  # cardsInfo/notesInfo lists longer than this are split into parallel requests
+ANKI_TIMEOUT = 60      # seconds before an AnkiConnect call is given up on
+ANKI_PROBE_TIMEOUT = 1 # seconds a readiness probe waits for AnkiConnect
+ANKI_START_TIMEOUT = 15  # seconds startup waits for AnkiConnect before carrying on without it
+ANKI_WATCH_INTERVAL = 10 # seconds between liveness checks when nothing else reached Anki
+ANKI_PATH = os.path.join(os.environ.get("USERPROFILE", os.path.expanduser("~")),
+                         "AppData", "Local", "Programs", "Anki", "anki.exe")
+DECK_CACHE_SIZE = 32   # decks kept in memory (least recently used evicted first)
+DECK_CACHE_TTL = 600   # seconds before a cached deck is reloaded from Anki
+DECK_CACHE_MAX_CARDS = 200_000  # cards kept across all cached decks
+MAX_PAGE_SIZE = 500    # cards per /api/cards page
+PREFETCH_WORKERS = 2   # background threads warming the deck cache
+PREFETCH_DECKS = 4     # decks warmed after startup and each stats refresh
+PREFETCH_MAX_CARDS = 20_000  # due cards those decks may add to the cache
+RECENT_DECKS = 8       # recently studied decks remembered across runs
+REFRESH_FAST, REFRESH_NORMAL, REFRESH_SLOW = 15, 60, 600  # stats refresh interval bounds (s)
+MAX_EVENT_CLIENTS = 4  # open /api/events streams; each holds a server thread
+MATCH_MODE = "case"    # answer checking: exact, case, ignore_case, whitespace, edit or tokens
+MATCH_MAX_DISTANCE = 2 # typos accepted as "close" by the edit mode
+MAX_CHECK_BATCH = 5000 # answers per /api/check/batch request
+MAX_TYPING_BATCH = 200 # attempts per /api/typing/events upload
+MAX_TYPING_KEYS = 2000 # keystrokes kept per attempt
+COMPRESS_LOOPBACK = False  # compress JSON for local clients too (costs CPU, saves nothing over loopback)
+STARTUP_WAIT = 20      # seconds the first page waits for Anki when there is no snapshot
+DATA_DIR = os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), "AnkiTypist")
+FIELD_MAP_FILE = "fields.json"  # per note type question/answer fields, in the data dir
+ANKI_BASE = os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), "Anki2")
+HOST, PORT = "127.0.0.1", 5000
+LOOPBACK = ("127.0.0.1", "::1")
+# /debug/* (profiler switch included) answers local clients only unless this is set.
+DEBUG_REMOTE = os.environ.get("ANKITYPIST_DEBUG_REMOTE") == "1"
+STATIC_MAX_AGE = 365 * 86400  # asset URLs carry a content hash, so they can be cached for good
+BACKEND = os.environ.get("ANKITYPIST_BACKEND") or default_backend_name()
+# "sqlite" lets several worker processes share one data dir: one of them polls
+# Anki and the others read its results (see README, "Multiple workers").
+SHARED_CACHE = os.environ.get("ANKITYPIST_SHARED", "local")
+SHARED_POLL = 1        # seconds between a worker's looks at the shared cache
+SHARED_LEASE = 10      # seconds the refresher's lease lasts without renewal
+
+bp = Blueprint("ankitypist", __name__)
+
+# Set up by create_app(); nothing here touches Anki or the disk at import.
+backend = None
+anki = None
+supervisor = None
+grade_queue = None
+shared = None
+shared_sync = None
+snapshot = None
+telemetry = None
+restored_decks = []
+
+stats_tracker = StatsTracker()
+deck_cache = DeckCache(DECK_CACHE_SIZE, DECK_CACHE_TTL, DECK_CACHE_MAX_CARDS)
+matcher = Matcher(MATCH_MODE, MATCH_MAX_DISTANCE)
+note_store = NoteStore(prepare=matcher.prepare)
+prefetcher = Prefetcher(PREFETCH_WORKERS)
+recent_decks = []
+events = EventBus(MAX_EVENT_CLIENTS)
+refresh_schedule = AdaptiveInterval(REFRESH_FAST, REFRESH_NORMAL, REFRESH_SLOW)
+pushed_totals = {}
+deck_viewers = {}  # deck -> pages waiting on /api/cards for it
 deck_list_cache = None
-cache_data = {"stats": ({}, 0, 0), "timestamp": 0}
+deck_index = DeckIndex()
+cache_data = {"stats": ({}, 0, 0), "timestamp": 0, "version": 0}
+deck_list_version = 0
+render_cache = (None, {})  # (version, pages), swapped as a whole
+state_lock = threading.Lock()  # publishing the deck list/stats, recent_decks
+asset_versions = {}
+dirty_decks = set()
+# Deck versions restart with the process; this keeps their ETags from matching a previous
+# run's, or another worker's (so with several workers, 304s only come from the same one).
+etag_prefix = uuid.uuid4().hex[:8]
+offline_decks = set()  # decks served from stale copies while Anki was away
+anki_ready = threading.Event()
+refresher = threading.Event()  # set while this worker is the one polling Anki
+
+# ------------------- Metrics -------------------
+CACHE_LOOKUPS = metrics.counter("cache_lookups_total", "Cache lookups by cache and result (hit/miss)")
+STATS_REFRESH = metrics.histogram("stats_refresh_seconds", "Stats refresh duration by sync mode")
+RENDER_SECONDS = metrics.histogram("render_seconds", "Template render time on a render-cache miss")
+HTTP_SECONDS = metrics.histogram("http_request_seconds", "Request handling time by endpoint and status")
+GRADE_REQUESTS = metrics.counter("grade_requests_total", "Grade requests by outcome")
+ERRORS = metrics.counter("errors_total", "Errors caught by the server, by where they happened")
+ENCODE_SECONDS = metrics.histogram("response_encode_seconds",
+                                   "JSON encoding and compression time by endpoint and content coding")
+BODY_BYTES = metrics.histogram("response_body_bytes", "JSON response size by endpoint and content coding",
+                               SIZE_BUCKETS)
+NOT_MODIFIED = metrics.counter("not_modified_total", "Conditional requests answered 304, by endpoint")
+metrics.gauge("deck_cache_decks", "Decks in the deck cache", lambda: len(deck_cache.entries))
+metrics.gauge("deck_cache_cards", "Cards in the deck cache", lambda: deck_cache.card_count())
+metrics.gauge("ankiconnect_up", "1 while AnkiConnect answers", lambda: int(supervisor.is_up()))
+metrics.gauge("ankiconnect_outages", "Times AnkiConnect was lost since start",
+              lambda: supervisor.status()["outages"])
+metrics.gauge("refresher", "1 in the worker that polls Anki for the others", lambda: int(refresher.is_set()))
+metrics.gauge("ankiconnect_inflight", "AnkiConnect requests in flight", lambda: anki.in_flight())
+metrics.gauge("prefetch_inflight", "Deck and page loads in flight", lambda: prefetcher.pending())
+metrics.gauge("event_clients", "Open /api/events streams", lambda: events.subscribers())
+metrics.gauge("stats_refresh_interval_seconds", "Current stats refresh interval",
+              lambda: refresh_schedule.interval)
+metrics.gauge("grade_queue_pending", "Grades not yet written to Anki",
+              lambda: grade_queue.status()["pending"])
+metrics.gauge("grade_queue_grades", "Grades handled by the queue since start, by outcome", lambda: [
+    ({"outcome": k}, grade_queue.status()[k]) for k in ("submitted", "failed", "conflicts", "retries")])
+
+def log_error(where, message, e):
+    ERRORS.inc(where=where)
+    print(message, e)
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+# ------------------- Startup timing -------------------
+class StartupTimer:
+    """Start offset and duration of each startup phase, relative to process start."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (start - PROCESS_START, time.perf_counter() - start)
 
-# ------------------- Helpers -------------------
-def is_anki_running():
-    return any(
-        "anki" in proc.info['name'].lower()
-        for proc in psutil.process_iter(['name'])
-        if proc.info['name']
-    )
-
-def start_anki_silently():
-    if is_anki_running():
-        print("Anki already running")
-        return
+    def mark(self, name):
+        self.phases[name] = (time.perf_counter() - PROCESS_START, 0.0)
 
-    print("Starting Anki in background...")
-    si = subprocess.STARTUPINFO()
-    si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    subprocess.Popen(
-        [ANKI_PATH],
-        startupinfo=si,
-        creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NO_WINDOW
-    )
-    time.sleep(5)
-    print("AnkiConnect ready")
-
-def hide_anki_window(title_substring="anki", timeout=10):
-    start = time.time()
-    while time.time() - start < timeout:
-        found = False
-        def enumHandler(hwnd, lParam):
-            nonlocal found
-            if title_substring.lower() in win32gui.GetWindowText(hwnd).lower():
-                win32gui.ShowWindow(hwnd, win32con.SW_HIDE)
-                found = True
-        win32gui.EnumWindows(enumHandler, None)
-        if found:
-            return True
-        time.sleep(0.5)
-    return False
+    def report(self):
+        rows = sorted(self.phases.items(), key=lambda kv: kv[1][0])
+        return {name: {"start": round(start, 4), "seconds": round(secs, 4)} for name, (start, secs) in rows}
 
-def wait_for_ankiconnect(timeout=15):
-    start = time.time()
-    while time.time() - start < timeout:
-        try:
-            r = requests.post(ANKI_CONNECT_URL, json={"action": "version", "version": ANKI_VERSION})
-            if r.ok:
-                print("AnkiConnect ready")
-                return True
-        except requests.exceptions.RequestException:
-            pass
-        time.sleep(0.5)
-    print("[!] Timeout waiting for AnkiConnect")
-    return False
+    def print_report(self):
+        print("Startup timings (offset from launch, duration):")
+        for name, t in self.report().items():
+            print(f"  {name:<22} +{t['start']:7.3f}s {t['seconds']:7.3f}s")
 
-def invoke(action, **params):
-    r = requests.post(ANKI_CONNECT_URL, json={"action": action, "version": ANKI_VERSION, "params": params})
-    r.raise_for_status()
-    return r.json()["result"]
+startup_timer = StartupTimer()
 
+# ------------------- Helpers -------------------
 def get_cached_decks():
-    global deck_list_cache
+    cache_lookup("deck_list", deck_list_cache is not None)
     if deck_list_cache is None:
-        deck_list_cache = invoke("deckNames")
+        publish_deck_list(anki.invoke("deckNames"))
     return deck_list_cache
 
+def due_query(deck):
+    return f'deck:"{deck}" is:due'
+
 def preload_deck(deck):
-    card_ids = invoke("findCards", query=f'deck:"{deck}" is:due')
+    query = due_query(deck)
+    card_ids, note_ids = anki.multi([
+        ("findCards", {"query": query}),
+        ("findNotes", {"query": query}),
+    ])
+    if not card_ids:
+        return []
+    # Separate requests, chunked, so the two large replies arrive in parallel.
+    cards_info, notes_info = anki.gather([
+        ("cardsInfo", {"cards": card_ids}),
+        ("notesInfo", {"notes": note_ids}),
+    ])
+    return note_store.build(cards_info, notes_info)
+
+def load_cards(card_ids):
     if not card_ids:
         return []
-    cards_info = invoke("cardsInfo", cards=card_ids)
-    note_ids = [c["note"] for c in cards_info]
-    notes_info = invoke("notesInfo", notes=note_ids)
-    note_map = {n["noteId"]: n for n in notes_info}
-    return [
-        {
-            "card_id": c["cardId"],
-            "question": list(note_map[c["note"]]["fields"].values())[0]["value"],
-            "answer": list(note_map[c["note"]]["fields"].values())[-1]["value"]
-        } for c in cards_info
-    ]
+    cards_info = anki.invoke("cardsInfo", cards=card_ids)
+    notes_info = anki.invoke("notesInfo", notes=list({c["note"] for c in cards_info}))
+    return note_store.build(cards_info, notes_info)
 
 def get_cached_deck(deck):
-    if deck not in deck_cache:
-        deck_cache[deck] = preload_deck(deck)
-    return deck_cache[deck]
-
-def build_deck_tree(decks):
-    tree = defaultdict(dict)
+    if not supervisor.is_up():
+        return offline_deck(deck)
+    cards = deck_cache.get(deck)
+    cache_lookup("deck", cards is not None)
+    if cards is None:
+        # Concurrent requests (and a prefetch) for the deck share one load.
+        cards = prefetcher.run(("deck", deck), lambda: load_deck(deck))
+        if cards is None:  # joined a prefetch that backed off for a paged load
+            cards = load_deck(deck)
+    return cards
+
+def load_deck(deck):
+    cards = deck_cache.get(deck) or load_shared_deck(deck)
+    if cards is None:
+        with anki.group(deck):
+            cards = preload_deck(deck)
+        graded = grade_queue.card_ids()  # answered here but not in Anki yet
+        cards = deck_cache.put(deck, [c for c in cards if c[0] not in graded])
+        save_deck(deck, cards)
+    return cards
+
+def get_deck_page(deck, cursor, limit):
+    """One page of a deck's due cards, fetching only that slice from Anki.
+
+    The following page is then loaded in the background.
+    """
+    if not supervisor.is_up():
+        return offline_page(deck, cursor, limit)
+    prefetcher.wait(("deck", deck))
+    entry = deck_cache.entry(deck)
+    if entry is None:
+        entry = prefetcher.run(("ids", deck), lambda: begin_deck(deck))
+    # The version is read before the cards, so a concurrent change can only make it older.
+    version = entry.version
+    cards = entry.page(cursor, limit)
+    cache_lookup("deck_page", cards is not None)
+    if cards is None:
+        prefetcher.run(("page", deck, cursor), lambda: load_page(deck, entry, cursor, limit))
+        version = entry.version
+        cards = entry.page(cursor, limit)
+    end = cursor + limit
+    if end < len(entry.ids) and entry.page(end, limit) is None:
+        prefetcher.submit(("page", deck, end), lambda: load_page(deck, entry, end, limit))
+    return cards, (end if end < len(entry.ids) else None), len(entry.ids), version
+
+def begin_deck(deck):
+    entry = deck_cache.entry(deck)
+    if entry is None and load_shared_deck(deck) is not None:
+        entry = deck_cache.entry(deck)
+    if entry is None:
+        with anki.group(deck):
+            ids = anki.invoke("findCards", query=due_query(deck))
+        graded = grade_queue.card_ids()
+        entry = deck_cache.begin(deck, [i for i in ids if i not in graded])
+    return entry
+
+def load_page(deck, entry, cursor, limit):
+    ids = [i for i in entry.ids[cursor:cursor + limit] if i in entry.missing]
+    if ids:
+        with anki.group(deck):
+            cards = load_cards(ids)
+        deck_cache.add_page(deck, entry, ids, cards)
+        if entry.complete:
+            save_deck(deck, entry.cards())
+
+# ------------------- Offline -------------------
+def offline_entry(deck):
+    """The deck as last seen, for practice while Anki is unreachable.
+
+    That is the cached entry however old it is, or else the snapshot's
+    rows less the cards with grades still waiting for Anki.
+    """
+    entry = deck_cache.entry(deck, expire=False)
+    if entry is None:
+        rows = snapshot.load_deck(deck)
+        if rows is None:
+            return None
+        graded = grade_queue.card_ids()
+        deck_cache.put(deck, note_store.from_rows([r for r in rows if r[0] not in graded]))
+        entry = deck_cache.entry(deck, expire=False)
+    with state_lock:
+        offline_decks.add(deck)
+    return entry
+
+def offline_deck(deck):
+    entry = offline_entry(deck)
+    cache_lookup("offline_deck", entry is not None)
+    return entry.cards() if entry else []
+
+def offline_page(deck, cursor, limit):
+    entry = offline_entry(deck)
+    cache_lookup("offline_deck", entry is not None)
+    if entry is None:
+        return [], None, 0, None
+    version = entry.version
+    end = cursor + limit
+    return (entry.page(cursor, limit, partial=True), (end if end < len(entry.ids) else None),
+            len(entry.ids), version)
+
+def drop_offline_decks():
+    """Anki is back: reload what was served from stale copies meanwhile."""
+    with state_lock:
+        decks = list(offline_decks)
+        offline_decks.clear()
     for deck in decks:
-        parts = deck.split("::")
-        current = tree
-        for part in parts[:-1]:
-            current = current.setdefault(part, {})
-        current[parts[-1]] = {}
-    return tree
+        deck_cache.invalidate(deck)
+
+# ------------------- Prefetch -------------------
+def note_recent(deck):
+    if recent_decks[:1] == [deck]:
+        return
+    with state_lock:
+        if deck in recent_decks:
+            recent_decks.remove(deck)
+        recent_decks.insert(0, deck)
+        del recent_decks[RECENT_DECKS:]
+
+def prefetch_decks():
+    """Warm the cache for recently studied decks, then those with the most due cards.
+
+    Only decks that fit in what is left of the prefetch budget and of the
+    deck cache are loaded, so prefetching never evicts a deck in use.
+    """
+    stats = cache_data["stats"][0]
+    by_due = sorted(stats, key=lambda d: stats[d]["learn"] + stats[d]["review"], reverse=True)
+    slots = min(PREFETCH_DECKS, deck_cache.max_decks - len(deck_cache.entries))
+    budget = PREFETCH_MAX_CARDS
+    if deck_cache.max_cards is not None:
+        budget = min(budget, deck_cache.max_cards - deck_cache.card_count())
+    for deck in dict.fromkeys(recent_decks + by_due):
+        if slots <= 0:
+            break
+        totals = deck_index.totals(deck)
+        due = totals["learn"] + totals["review"]
+        if not due or due > budget or deck_cache.entry(deck) is not None:
+            continue
+        if prefetcher.submit(("deck", deck), lambda deck=deck: prefetch_deck(deck)):
+            slots -= 1
+            budget -= due
+
+def prefetch_deck(deck):
+    # A paged load may have started since this was queued; don't replace it.
+    if deck_cache.entry(deck) is None:
+        return load_deck(deck)
+
+# cache_data is never modified in place: publishers swap in a new dict, so a
+# reader that takes ``data = cache_data`` sees one consistent version.
+def publish_stats(stats, rollup=True, timestamp=None):
+    global cache_data
+    with state_lock:
+        data = cache_data
+        if stats != data["stats"]:
+            if rollup:
+                deck_index.set_stats(stats[0])
+            data = {**data, "stats": stats, "version": data["version"] + 1}
+        if timestamp is not None:
+            data = {**data, "timestamp": timestamp}
+        changed = data["version"] != cache_data["version"]
+        cache_data = data
+        if changed:
+            push_stats()
+
+def stats_event(totals):
+    _, learn_today, review_today = cache_data["stats"]
+    return {
+        "version": cache_data["version"],
+        "learn_today": learn_today,
+        "review_today": review_today,
+        "decks": {deck: {"learn": t[0], "review": t[1]} for deck, t in totals.items()},
+    }
+
+def push_stats():
+    """Send open pages the decks whose rolled-up counts changed since the last push."""
+    global pushed_totals
+    totals = deck_index.all_totals()
+    changed = {deck: t for deck, t in totals.items() if pushed_totals.get(deck) != t}
+    pushed_totals = totals
+    if changed and events.subscribers():
+        events.publish("stats", stats_event(changed))
+
+def publish_deck_list(decks):
+    global deck_list_cache, deck_list_version
+    with state_lock:
+        if decks != deck_list_cache:
+            deck_index.update(decks)
+            changed = deck_list_cache is not None
+            deck_list_cache = decks
+            deck_list_version += 1
+            if changed:
+                events.publish("decks", {"version": deck_list_version})
+
+def refresh_stats():
+    start = time.perf_counter()
+    *results, decks = anki.multi(stats_tracker.sync_actions() + [("deckNames", {})])
+    publish_deck_list(decks)
+    publish_stats(stats_tracker.sync(anki, results), timestamp=time.time())
+    STATS_REFRESH.observe(time.perf_counter() - start, mode=stats_tracker.last_mode)
+    snapshot.save_overview(deck_list_cache, cache_data["stats"])
 
 def preload_stats_loop():
+    # The first refresh already ran during startup (if Anki was up by then).
+    while True:
+        refresh_schedule.sleep()
+        refresher.wait()      # another worker polls Anki for us
+        supervisor.wait_up()  # paused while Anki is away
+        version = cache_data["version"]
+        try:
+            refresh_stats()
+            if restored_decks:
+                revalidate_snapshot(restored_decks)
+            flush_snapshot()
+            prefetch_decks()
+        except AnkiConnectUnavailable:
+            pass  # the supervisor has been told and pauses us until Anki is back
+        except Exception as e:
+            log_error("stats_refresh", "Error refreshing stats:", e)
+        refresh_schedule.update(cache_data["version"] != version, watching=events.subscribers() > 0)
+
+# ------------------- Shared cache -------------------
+def load_shared_deck(deck):
+    """A deck another worker loaded, minus cards answered since; None if there is none."""
+    found = shared.get_deck(deck, DECK_CACHE_TTL)
+    cache_lookup("shared_deck", found is not None)
+    if found is None:
+        return None
+    rows, answered = found
+    return deck_cache.put(deck, note_store.from_rows([r for r in rows if r[0] not in answered]))
+
+class SharedSync:
+    """What this worker has seen of the shared cache, and one round of syncing it.
+
+    Every worker drops cards answered elsewhere. The refresher (whoever
+    holds the lease) counts those grades, publishes the deck list and
+    stats, and reacts to the others' activity; the rest adopt what it
+    publishes.
+    """
+
+    def __init__(self):
+        self.leading = None
+        self.answer = shared.last_answer()
+        self.overview = 0
+        self.published = None
+        self.activity = 0
+        self.shared_activity = 0.0
+        self.wake = 0
+        self.submitted = 0
+        self.pruned = 0.0
+
+    def run(self):
+        leading = shared.acquire("refresher", SHARED_LEASE)
+        if leading != self.leading:
+            self.switch(leading)
+        for seq, worker, card_id, ease in shared.answers_since(self.answer):
+            self.answer = seq
+            if worker != shared.worker:
+                if leading:
+                    apply_answer(card_id, ease)
+                else:
+                    dirty_decks.update(deck_cache.remove_card(card_id))
+        if leading:
+            self.lead()
+        else:
+            self.follow()
+
+    def switch(self, leading):
+        if leading:
+            refresher.set()
+            if self.leading is not None:  # taking over from a worker that went away
+                print("This worker now refreshes from Anki")
+                refresh_schedule.wake()
+        else:
+            refresher.clear()
+        self.leading = leading
+        supervisor.watch = leading
+
+    def lead(self):
+        data = cache_data
+        version = (deck_list_version, data["version"])
+        if version != self.published:
+            shared.put("overview", {"decks": deck_list_cache, "stats": data["stats"],
+                                    "timestamp": data["timestamp"]})
+            self.published = version
+        found = shared.get("activity", self.activity)
+        if found:
+            self.activity, activity = found
+            refresh_schedule.touch()
+            for deck in reversed(activity["recent"]):
+                note_recent(deck)
+        found = shared.get("wake", self.wake)
+        if found:
+            self.wake = found[0]
+            refresh_schedule.wake()
+        now = time.time()
+        if now - self.pruned > DECK_CACHE_TTL:
+            shared.prune(DECK_CACHE_TTL)
+            self.pruned = now
+
+    def follow(self):
+        found = shared.get("overview", self.overview)
+        if found:
+            self.overview, overview = found
+            if overview["decks"] is not None:
+                publish_deck_list(overview["decks"])
+            publish_stats(tuple(overview["stats"]), timestamp=overview["timestamp"])
+        # Let the refresher know someone is studying here, and that grades went in.
+        if refresh_schedule.last_activity > self.shared_activity:
+            self.shared_activity = refresh_schedule.last_activity
+            shared.put("activity", {"at": self.shared_activity, "recent": recent_decks})
+        submitted = grade_queue.status()["submitted"]
+        if submitted != self.submitted:
+            self.submitted = submitted
+            shared.put("wake", submitted)
+
+def shared_sync_loop(sync):
     while True:
+        time.sleep(SHARED_POLL)
         try:
-            new_cards = invoke("findCards", query="is:new")
-            review_cards = invoke("findCards", query="is:review")
-            all_cards = list(set(new_cards + review_cards))
-            cards = invoke("cardsInfo", cards=all_cards)
-            stats = {}
-            for c in cards:
-                d = c["deckName"]
-                stats.setdefault(d, {"learn": 0, "review": 0})
-                if c["cardId"] in new_cards: stats[d]["learn"] += 1
-                if c["cardId"] in review_cards: stats[d]["review"] += 1
-            cache_data["stats"] = (stats, len(new_cards), len(review_cards))
-            cache_data["timestamp"] = time.time()
+            sync.run()
         except Exception as e:
-            print("Error refreshing stats:", e)
-        time.sleep(60)
+            log_error("shared", "Error syncing the shared cache:", e)
+
+# ------------------- Snapshot -------------------
+def snapshot_mtime():
+    return collection_mtime(snapshot.get_meta("profile_dir"))
+
+def restore_snapshot():
+    """Fill the caches from the last run's snapshot; returns the restored deck names."""
+    decks, stats, deck_cards = snapshot.load(snapshot_mtime())
+    if snapshot.get_meta("field_map") != note_store.field_map:
+        # Card text was extracted with a different field mapping.
+        snapshot.drop_decks()
+        snapshot.set_meta("field_map", note_store.field_map)
+        deck_cards = {}
+    if decks:
+        publish_deck_list(decks)
+    if stats:
+        publish_stats(stats)
+    for deck, rows in deck_cards.items():
+        deck_cache.put(deck, note_store.from_rows(rows))
+    recent_decks[:] = snapshot.get_meta("recent_decks") or []
+    return list(deck_cards)
+
+def revalidate_snapshot(restored):
+    """Drop restored decks whose due cards no longer match Anki."""
+    profile = anki.invoke("getActiveProfile")
+    snapshot.set_meta("profile_dir", os.path.join(ANKI_BASE, profile))
+    if not restored:
+        return
+    due_ids = anki.multi([("findCards", {"query": due_query(d)}) for d in restored])
+    for deck, ids in zip(restored, due_ids):
+        entry = deck_cache.entry(deck)
+        if entry is not None and set(ids) != set(entry.notes):
+            deck_cache.invalidate(deck)
+            snapshot.drop_decks([deck])
+    del restored[:]  # done; the stats loop retries it if startup couldn't
+
+def save_deck(deck, cards):
+    """Keep a loaded deck for the next start and for the other workers."""
+    rows = to_rows(cards)
+    try:
+        snapshot.save_deck(deck, rows, snapshot_mtime())
+        shared.put_deck(deck, rows)
+    except Exception as e:
+        log_error("snapshot", "Error saving snapshot:", e)
+
+def flush_snapshot():
+    """Re-save decks changed by grading since the last flush."""
+    snapshot.set_meta("recent_decks", recent_decks)
+    while dirty_decks:
+        deck = dirty_decks.pop()
+        cards = deck_cache.get(deck)
+        if cards is None:
+            snapshot.drop_decks([deck])
+        else:
+            save_deck(deck, cards)
 
 # ------------------- STARTUP -------------------
-if not is_anki_running():
-    start_anki_silently()
-hide_anki_window("anki")
-wait_for_ankiconnect()
-
-# Preload stats before opening UI
-try:
-    new_cards = invoke("findCards", query="is:new")
-    review_cards = invoke("findCards", query="is:review")
-    all_cards = list(set(new_cards + review_cards))
-    cards = invoke("cardsInfo", cards=all_cards)
-    stats = {}
-    for c in cards:
-        d = c["deckName"]
-        stats.setdefault(d, {"learn": 0, "review": 0})
-        if c["cardId"] in new_cards: stats[d]["learn"] += 1
-        if c["cardId"] in review_cards: stats[d]["review"] += 1
-    cache_data["stats"] = (stats, len(new_cards), len(review_cards))
-    cache_data["timestamp"] = time.time()
-except Exception as e:
-    print("[!] Initial preload failed:", e)
+def connect_anki(timer=startup_timer):
+    """Bring up the backend, wait for AnkiConnect and load the first stats."""
+    try:
+        # Anki that already answers needs no launch (and no process scan).
+        backend.start(timer, running=supervisor.probe())
+        with timer.phase("ankiconnect_ready"):
+            ready = supervisor.wait_ready(ANKI_START_TIMEOUT)
+        if not ready:
+            return  # the stats loop picks up from here once Anki answers
+        if not refresher.is_set():
+            return  # stats come from the refresher through the shared cache
+        try:
+            with timer.phase("stats_preload"):
+                refresh_stats()
+            with timer.phase("snapshot_revalidate"):
+                revalidate_snapshot(restored_decks)
+            prefetch_decks()
+        except Exception as e:
+            log_error("startup", "[!] Initial preload failed:", e)
+    finally:
+        anki_ready.set()
+
+def start_background(timer=startup_timer):
+    """Connect to Anki, then start the stats loop, grade queue and supervisor."""
+    def run():
+        connect_anki(timer)
+        supervisor.start()
+        if shared.multi_process:
+            threading.Thread(target=shared_sync_loop, args=(shared_sync,), name="shared-sync",
+                             daemon=True).start()
+        threading.Thread(target=preload_stats_loop, daemon=True).start()
+        grade_queue.start()
+        timer.print_report()
+    threading.Thread(target=run, name="startup", daemon=True).start()
+
+def shutdown():
+    """At exit: don't hold the process up for decks that were only queued for warming."""
+    prefetcher.shutdown()
+    events.close()  # end open /api/events streams so their server threads can finish
+    shared.release("refresher")  # another worker takes over now, not when the lease runs out
+
+def create_app(data_dir=None, backend_name=None, start=False, shared_cache=None):
+    """Build the Flask app and its stores; Anki itself is contacted later.
+
+    WSGI servers should pass ``start=True`` so the background startup and
+    refresh threads run in the serving process, e.g.
+    ``gunicorn -w 1 "anki_server:create_app(backend_name='remote', start=True)"``.
+    More workers need ``shared_cache="sqlite"`` (or ANKITYPIST_SHARED=sqlite).
+    """
+    global backend, anki, supervisor, grade_queue, snapshot, telemetry, restored_decks, shared, shared_sync
+    data_dir = data_dir or DATA_DIR
+    with startup_timer.phase("create_app"):
+        shared = make_shared(shared_cache or SHARED_CACHE, os.path.join(data_dir, "shared.db"))
+        # Each live worker journals its grades in a file of its own.
+        slot = shared.claim_slot()
+        journal = "grades.jsonl" if slot == 0 else f"grades-{slot}.jsonl"
+        backend = make_backend(backend_name or BACKEND, ANKI_CONNECT_URL, ANKI_PATH)
+        anki = AnkiConnect(backend.url, ANKI_VERSION, timeout=ANKI_TIMEOUT,
+                           max_inflight=ANKI_MAX_INFLIGHT, chunk_size=ANKI_CHUNK_SIZE)
+        supervisor = AnkiSupervisor(anki, backend, ANKI_PROBE_TIMEOUT, ANKI_WATCH_INTERVAL)
+        # Grades that reached Anki change its counts: refresh soon to push them.
+        grade_queue = GradeQueue(anki, os.path.join(data_dir, journal),
+                                 on_done=lambda grades: refresh_schedule.wake())
+        # Anki is back: catch up on stats and grades now rather than after their backoff.
+        supervisor.on_up += [refresh_schedule.wake, grade_queue.retry_now, drop_offline_decks]
+        snapshot = SnapshotStore(os.path.join(data_dir, "snapshot.db"))
+        telemetry = TelemetryStore(os.path.join(data_dir, "telemetry.db"))
+        note_store.configure(load_field_map(os.path.join(data_dir, FIELD_MAP_FILE)))
+        restored_decks = restore_snapshot()
+        atexit.register(flush_snapshot)
+        atexit.register(shutdown)  # runs first
+        # Elect the refresher now, so only it does the startup preload.
+        shared_sync = SharedSync()
+        shared_sync.run()
+        app = Flask(__name__)
+        app.config["SEND_FILE_MAX_AGE_DEFAULT"] = STATIC_MAX_AGE
+        app.register_blueprint(bp)
+        app.jinja_env.globals["asset_url"] = asset_url
+        hash_assets(app.static_folder)
+        # Compile every template now rather than on the first request.
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+    if start:
+        start_background()
+    return app
 
 # ------------------- FLASK APP -------------------
 
-@app.route("/")
+# ------------------- Rendering -------------------
+def render_cached(key, template, context):
+    """Render once per deck list + stats version; ``context`` is only called on a miss."""
+    global render_cache
+    version = (deck_list_version, cache_data["version"])
+    cached_version, pages = render_cache
+    if cached_version != version:
+        pages = {}
+        render_cache = (version, pages)
+    html = pages.get(key)
+    cache_lookup("render", html is not None)
+    if html is None:
+        with RENDER_SECONDS.time(template=template):
+            html = pages[key] = render_template(template, **context())
+    return html
+
+def json_response(data, etag=None):
+    """JSON, compressed if the client accepts it, from ``data()``.
+
+    With an ``etag`` (a version of what ``data`` reads), a client already
+    holding that version gets a 304 and ``data`` isn't called at all.
+    """
+    if etag and request.if_none_match.contains_weak(etag):
+        NOT_MODIFIED.inc(endpoint=request.endpoint)
+        response = Response(status=304)
+    else:
+        start = time.perf_counter()
+        body = dumps(data())
+        encoding = None
+        if len(body) >= MIN_COMPRESS and (COMPRESS_LOOPBACK or request.remote_addr not in LOOPBACK):
+            encoding = request.accept_encodings.best_match(encodings())
+        body = compress(body, encoding)
+        coding = encoding or "identity"
+        ENCODE_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint, coding=coding)
+        BODY_BYTES.observe(len(body), endpoint=request.endpoint, coding=coding)
+        response = Response(body, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True  # revalidate every time, which is what the ETag is for
+    return response
+
+def asset_url(filename):
+    return f"/static/{filename}?v={asset_versions.get(filename, '0')}"
+
+def hash_assets(static_dir):
+    for name in os.listdir(static_dir):
+        with open(os.path.join(static_dir, name), "rb") as f:
+            asset_versions[name] = hashlib.sha1(f.read()).hexdigest()[:10]
+
+@bp.route("/")
 def home():
     # Always use cached decks and stats to make UI instant
-    stats, learn_today, review_today = cache_data.get("stats", ({}, 0, 0))
-    decks = deck_list_cache or []  # No waiting for invoke()
-    if not decks:
+    # (without a snapshot, the very first render waits for Anki to come up)
+    if not deck_list_cache:
+        anki_ready.wait(STARTUP_WAIT)
         try:
-            decks = get_cached_decks()
+            get_cached_decks()
         except Exception:
-            decks = []
-    deck_tree = build_deck_tree(decks)
-
-    return render_template_string(
-        DECK_SELECT_TEMPLATE,
-        deck_tree=deck_tree,
-        stats=stats,
-        learn_today=learn_today,
-        review_today=review_today
-    )
-
-@app.route("/deck/<deck>")
+            pass
+
+    def context():
+        _, learn_today, review_today = cache_data["stats"]
+        return {
+            "decks": deck_index.children(),
+            "learn_today": learn_today,
+            "review_today": review_today,
+        }
+    return render_cached("home", "deck_select.html", context)
+
+@bp.route("/deck/<deck>")
 def deck_view(deck):
-    decks = get_cached_decks()
-    subdecks = [d for d in decks if d.startswith(deck + "::")]
+    get_cached_decks()
+    subdecks = deck_index.children(deck)
 
     if subdecks:
-        sub_stats = cache_data["stats"][0] if cache_data["stats"] else {}
-        return render_template_string(SUBDECK_TEMPLATE, deck=deck, subdecks=subdecks, stats=sub_stats)
+        return render_cached(("deck", deck), "subdeck.html",
+                             lambda: {"deck": deck, "subdecks": subdecks})
     else:
         # Don't preload cards here — render instantly, JS will fetch later
-        return render_template_string(DECK_TEMPLATE, deck=deck, total=0)
+        return render_cached(("deck", deck), "deck.html", lambda: {"deck": deck, "total": 0})
 
 
-@app.route("/api/cards/<deck>")
+@bp.route("/api/cards/<deck>")
 def api_cards(deck):
-    if deck in deck_cache:
-        return jsonify(deck_cache[deck])
-
+    limit = request.args.get("limit", type=int)
+    if "limit" in request.args and (limit is None or limit <= 0):
+        return {"ok": False, "error": "limit must be a positive integer"}, 400
+    note_recent(deck)
+    refresh_schedule.touch()
+    # Pages identify themselves so /api/cancel from one tab can't stop another's load.
+    view = request.args.get("view") or object()
+    with state_lock:
+        deck_viewers.setdefault(deck, set()).add(view)
     try:
-        cards = preload_deck(deck)
-        deck_cache[deck] = cards
+        return cards_response(deck, limit)
+    finally:
+        with state_lock:
+            viewers = deck_viewers.get(deck, set())
+            viewers.discard(view)
+            if not viewers:
+                deck_viewers.pop(deck, None)
+
+def cards_response(deck, limit):
+    fmt = "columns" if request.args.get("format") == "columns" else "rows"
+    encode = to_columns if fmt == "columns" else to_dicts
+    if limit:
+        cursor = max(request.args.get("cursor", 0, type=int), 0)
+        limit = min(limit, MAX_PAGE_SIZE)
+        try:
+            cards, next_cursor, total, version = get_deck_page(deck, cursor, limit)
+        except AnkiConnectCancelled:
+            cards, next_cursor, total, version = [], None, 0, None
+        except AnkiConnectUnavailable:
+            cards, next_cursor, total, version = offline_page(deck, cursor, limit)
+        except Exception as e:
+            log_error("cards", "Error loading cards:", e)
+            cards, next_cursor, total, version = [], None, 0, None
+        offline = not supervisor.is_up()
+        etag = f"{etag_prefix}.{version}.{cursor}.{limit}.{fmt}.{int(offline)}" if version else None
+        return json_response(lambda: {"cards": encode(cards), "next": next_cursor, "total": total,
+                                      "offline": offline}, etag)
+
+    version = deck_cache.version(deck)
+    try:
+        cards = get_cached_deck(deck)
+    except AnkiConnectCancelled:
+        cards = []
+    except AnkiConnectUnavailable:
+        cards = offline_deck(deck)
     except Exception as e:
-        print("Error loading cards:", e)
+        log_error("cards", "Error loading cards:", e)
         cards = []
-    return jsonify(cards)
-
-@app.route("/api/grade/<int:card_id>/<int:ease>")
+    # Read before the cards, so a concurrent change can only make the tag older. A deck
+    # this request has to (re)load, or serves offline, has none: it is tagged next time.
+    etag = f"{etag_prefix}.{version}.all.{fmt}" if version else None
+    return json_response(lambda: encode(cards), etag)
+
+@bp.route("/api/cancel/<deck>", methods=["POST"])
+def api_cancel(deck):
+    """Sent (as a beacon) by a deck page being left: stop loading the deck if nobody else wants it."""
+    view = request.args.get("view")
+    with state_lock:
+        viewers = deck_viewers.get(deck, set())
+        viewers.discard(view)
+        if viewers:
+            return {"ok": True, "cancelled": 0}
+        deck_viewers.pop(deck, None)
+    return {"ok": True, "cancelled": anki.cancel(deck)}
+
+def find_notes(card_ids, deck=None):
+    """Notes for ``card_ids`` from the deck cache, fetching any not cached from Anki."""
+    notes = {card_id: deck_cache.note(card_id, deck) for card_id in card_ids}
+    missing = [card_id for card_id, note in notes.items() if note is None]
+    if missing:
+        notes.update(load_cards(missing))
+    return notes
+
+def check_answer(note, typed, mode=None):
+    return matcher.check(typed, note.answer, note.match_key, mode)
+
+@bp.route("/api/check", methods=["POST"])
+def api_check():
+    """Check one typed answer: ``{"card_id", "answer", "deck"?, "mode"?}``."""
+    body = request.get_json(silent=True) or {}
+    card_id, typed = body.get("card_id"), body.get("answer")
+    if not isinstance(card_id, int) or not isinstance(typed, str):
+        return {"ok": False, "error": "card_id (int) and answer (str) are required"}, 400
+    try:
+        note = find_notes([card_id], body.get("deck")).get(card_id)
+    except Exception as e:
+        log_error("check", "Error loading card:", e)
+        return {"ok": False, "error": "card could not be loaded"}, 503
+    if note is None:
+        return {"ok": False, "error": "unknown card"}, 404
+    try:
+        return {"ok": True, **check_answer(note, typed, body.get("mode"))}
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}, 400
+
+@bp.route("/api/check/batch", methods=["POST"])
+def api_check_batch():
+    """Score a recorded session offline.
+
+    ``{"mode"?, "items": [{"card_id" or "expected", "answer"}, ...]}``; items
+    with ``expected`` are checked against that text and never touch Anki.
+    """
+    body = request.get_json(silent=True) or {}
+    items, mode = body.get("items"), body.get("mode")
+    if not isinstance(items, list) or len(items) > MAX_CHECK_BATCH:
+        return {"ok": False, "error": f"items must be a list of at most {MAX_CHECK_BATCH}"}, 400
+    card_ids = {i["card_id"] for i in items
+                if isinstance(i, dict) and "expected" not in i and isinstance(i.get("card_id"), int)}
+    try:
+        notes = find_notes(card_ids) if card_ids else {}
+    except Exception as e:
+        log_error("check", "Error loading cards:", e)
+        notes = {}
+    results = []
+    for item in items:
+        typed = item.get("answer") if isinstance(item, dict) else None
+        if not isinstance(typed, str):
+            results.append({"error": "answer (str) is required"})
+            continue
+        card_id, expected = item.get("card_id"), item.get("expected")
+        try:
+            if isinstance(expected, str):
+                results.append(matcher.check(typed, expected, mode=mode))
+            elif "expected" in item or not isinstance(card_id, int):
+                results.append({"error": "card_id (int) or expected (str) is required"})
+            elif notes.get(card_id) is not None:
+                results.append(check_answer(notes[card_id], typed, mode))
+            else:
+                results.append({"error": "unknown card"})
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}, 400
+    return jsonify({"ok": True, "results": results, "summary": summarize(results)})
+
+@bp.route("/api/grade/<int:card_id>/<int:ease>")
 def api_grade(card_id, ease):
+    if not 1 <= ease <= 4:
+        GRADE_REQUESTS.inc(outcome="invalid")
+        return {"ok": False, "error": "ease must be 1-4"}, 400
+    try:
+        grade_queue.submit(card_id, ease)
+    except Exception as e:
+        GRADE_REQUESTS.inc(outcome="error")
+        log_error("grade", "Error queueing grade:", e)
+        return {"ok": False, "error": "grade could not be saved"}, 500
+    GRADE_REQUESTS.inc(outcome="queued")
+    refresh_schedule.touch()
+    apply_answer(card_id, ease)
     try:
-        invoke("answerCards", answers=[{"cardId": card_id, "ease": ease}])
-    except:
-        pass
+        shared.add_answer(card_id, ease)
+    except Exception as e:
+        log_error("shared", "Error sharing grade:", e)
     return {"ok": True}
 
-# ------------------- TEMPLATES -------------------
-
-SUBDECK_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<title>{{ deck }} - Subdecks</title>
-<style>
-  :root {
-    --bg: #0b0c10;
-    --card-bg: #101217;
-    --primary: #00eaff;
-    --text: #e6e6e6;
-    --accent: #0ff;
-    --good: #00ff9f;
-    --hard: #ffb347;
-    --again: #ff4b4b;
-    --easy: #00c8ff;
-    --shadow: 0 0 20px rgba(0, 238, 255, 0.15);
-  }
-
-  * {
-    box-sizing: border-box;
-    transition: all 0.15s ease-in-out;
-  }
-
-  body {
-    font-family: 'Segoe UI', 'Inter', sans-serif;
-    background: radial-gradient(circle at top, #0b0c10, #050608);
-    color: var(--text);
-    min-height: 100vh;
-    margin: 0;
-    padding: 40px 25px;
-    display: flex;
-    flex-direction: column;
-    align-items: center;
-    overflow-x: hidden;
-  }
-
-  h1 {
-    color: #0ff;
-    text-align: center;
-    margin-bottom: 30px;
-  }
-
-  .deck-container {
-    max-width: 800px;
-    margin: 0 auto;
-  }
-
-  .deck-header {
-    display: grid;
-    grid-template-columns: 1fr 100px 100px;
-    color: #0ff;
-    font-weight: bold;
-    border-bottom: 2px solid #0ff;
-    padding-bottom: 5px;
-    margin-bottom: 10px;
-  }
-
-  .deck-button {
-    display: grid;
-    grid-template-columns: 1fr 100px 100px;
-    align-items: center;
-    background: #111;
-    color: #0ff;
-    padding: 15px 20px;
-    border-radius: 15px;
-    text-decoration: none;
-    margin-bottom: 10px;
-    transition: background 0.2s ease, transform 0.2s ease;
-  }
-
-  .deck-button:hover {
-    background: #0ff;
-    color: #000;
-    transform: translateY(-3px);
-  }
-
-  .stats-col { text-align: center; font-weight: bold; }
-  a.back { display:block; text-align:center; margin-top:30px; color:#0ff; }
-</style>
-</head>
-<body>
-
-<h1>{{ deck }}</h1>
-<div class="deck-container">
-  <div class="deck-header">
-    <div>Subdeck</div>
-    <div>Learn</div>
-    <div>Review</div>
-  </div>
-
-  {% for sub in subdecks %}
-    <a class="deck-button" href="/deck/{{ sub }}">
-      <span>{{ sub.split('::')[-1] }}</span>
-      <span class="stats-col">{{ stats[sub].learn }}</span>
-      <span class="stats-col">{{ stats[sub].review }}</span>
-    </a>
-  {% endfor %}
-</div>
-
-<a class="back" href="/">⬅ Back to Main Decks</a>
-</body>
-</html>
-"""
-
-
-
-DECK_SELECT_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<title>Decks Overview</title>
-<style>
-  :root {
-    --bg: #0b0c10;
-    --card-bg: #11141a;
-    --primary: #00eaff;
-    --text: #e6e6e6;
-    --accent: #0ff;
-    --good: #00ff9f;
-    --hard: #ffb347;
-    --again: #ff4b4b;
-    --easy: #00c8ff;
-    --shadow: 0 0 25px rgba(0, 238, 255, 0.15);
-    --transition: 0.2s cubic-bezier(0.25, 0.8, 0.25, 1);
-  }
-
-  * { box-sizing: border-box; transition: all var(--transition); }
-
-  body {
-    font-family: 'Inter', 'Segoe UI', sans-serif;
-    background: radial-gradient(circle at top, #0b0c10, #050608 80%);
-    color: var(--text);
-    min-height: 100vh;
-    margin: 0;
-    padding: 40px 25px;
-    display: flex;
-    flex-direction: column;
-    align-items: center;
-    overflow-x: hidden;
-  }
-
-  h1 {
-    display: flex;
-    justify-content: space-between;
-    align-items: center;
-    color: var(--primary);
-    font-size: 2.3rem;
-    text-shadow: 0 0 10px rgba(0,255,255,0.2);
-  }
-
-  h1 span.stats-bar {
-    font-size: 1rem;
-    background: rgba(0,255,255,0.1);
-    padding: 10px 16px;
-    border-radius: 10px;
-    box-shadow: 0 0 10px rgba(0,255,255,0.15);
-  }
-
-  .deck-container {
-    display: flex;
-    flex-direction: column;
-    gap: 15px;
-    max-width: 800px;
-    width: 100%;
-    margin-top: 30px;
-  }
-
-  .deck-header {
-    display: grid;
-    grid-template-columns: 1fr 100px 100px;
-    color: var(--primary);
-    font-weight: bold;
-    margin-bottom: 10px;
-    border-bottom: 2px solid var(--primary);
-    padding-bottom: 5px;
-  }
-
-  .deck-button, .deck-group {
-    display: grid;
-    grid-template-columns: 1fr 100px 100px;
-    align-items: center;
-    background: var(--card-bg);
-    color: var(--primary);
-    padding: 18px 22px;
-    border-radius: 16px;
-    text-decoration: none;
-    box-shadow: var(--shadow);
-    border: 1px solid rgba(0,255,255,0.1);
-    font-weight: 500;
-    transition: transform 0.2s ease, box-shadow 0.3s ease, background 0.3s ease;
-  }
-
-  .deck-button:hover, .deck-group:hover {
-    transform: translateY(-4px) scale(1.01);
-    background: linear-gradient(90deg, var(--primary), #00ffc6);
-    color: #000;
-    box-shadow: 0 0 20px rgba(0,255,255,0.35);
-  }
-
-  .stats-col {
-    text-align: center;
-    font-weight: bold;
-    color: var(--text);
-  }
-
-  .subdeck-container {
-    display: none;
-    margin-left: 30px;
-  }
-
-  /* Floating subtle glow effect for cards */
-  @keyframes floatGlow {
-    0%,100% { box-shadow: 0 0 20px rgba(0,238,255,0.15); }
-    50% { box-shadow: 0 0 30px rgba(0,238,255,0.25); }
-  }
-
-  .deck-button {
-    animation: floatGlow 4s ease-in-out infinite;
-  }
-
-  /* Mobile-friendly adjustments */
-  @media (max-width: 600px) {
-    h1 { font-size: 1.8rem; flex-direction: column; gap: 10px; }
-    h1 span.stats-bar { font-size: 0.95rem; padding: 8px 12px; }
-    .deck-header { grid-template-columns: 1fr 80px 80px; }
-    .deck-button, .deck-group { grid-template-columns: 1fr 80px 80px; padding: 14px 18px; }
-  }
-</style>
-</head>
-<body>
-
-<h1>My Decks</h1>
-
-<div class="deck-container">
-  <div class="deck-header">
-    <div>Deck Name</div>
-    <div>Learn</div>
-    <div>Review</div>
-  </div>
-
-  {% for main, subs in deck_tree.items() if '::' not in main %}
-    <a class="deck-button" href="/deck/{{ main }}">
-      <span>{{ main }}</span>
-      <span class="stats-col">{{ stats[main].learn if main in stats else 0 }}</span>
-      <span class="stats-col">{{ stats[main].review if main in stats else 0 }}</span>
-    </a>
-  {% endfor %}
-</div>
-
-</body>
-</html>
-"""
-
-DECK_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<title>Deck: {{ deck }}</title>
-<style>
-  :root {
-    --bg: #0b0c10;
-    --card-bg: #11141a;
-    --primary: #00eaff;
-    --text: #e6e6e6;
-    --accent: #0ff;
-    --good: #00ff9f;
-    --hard: #ffb347;
-    --again: #ff4b4b;
-    --easy: #00c8ff;
-    --shadow: 0 0 25px rgba(0, 238, 255, 0.15);
-    --transition: 0.2s cubic-bezier(0.25, 0.8, 0.25, 1);
-  }
-
-  * { box-sizing: border-box; transition: all var(--transition); }
-
-  body {
-    font-family: 'Inter', 'Segoe UI', sans-serif;
-    background: radial-gradient(circle at top, #0b0c10, #050608 80%);
-    color: var(--text);
-    min-height: 100vh;
-    margin: 0;
-    padding: 40px 25px;
-    display: flex;
-    flex-direction: column;
-    align-items: center;
-    overflow-x: hidden;
-  }
-
-  .card {
-    background: linear-gradient(145deg, var(--card-bg), #0d0f14);
-    padding: 40px;
-    border-radius: 22px;
-    width: 100%;
-    max-width: 700px;
-    text-align: center;
-    margin-bottom: 40px;
-    box-shadow: 0 8px 25px rgba(0,0,0,0.65), var(--shadow);
-    border: 1px solid rgba(255, 255, 255, 0.05);
-    animation: floatGlow 4s ease-in-out infinite;
-  }
-
-  .card:hover {
-    transform: translateY(-6px) scale(1.01);
-    box-shadow: 0 15px 40px rgba(0,0,0,0.75), 0 0 25px rgba(0, 238, 255, 0.1);
-  }
-
-  #progress {
-    width: 100%;
-    height: 14px;
-    background: #1a1d24;
-    border-radius: 10px;
-    margin-bottom: 30px;
-    overflow: hidden;
-    position: relative;
-  }
-
-  #progress-bar {
-    height: 100%;
-    width: 0%;
-    background: linear-gradient(90deg, var(--primary), var(--good));
-    border-radius: 10px;
-    box-shadow: 0 0 10px var(--primary);
-    transition: width var(--transition);
-  }
-
-  h2 {
-    margin-bottom: 18px;
-    font-size: 2.3rem;
-    letter-spacing: 1.2px;
-    color: var(--primary);
-    text-shadow: 0 0 10px rgba(0,238,255,0.2);
-  }
-
-  h3 {
-    margin-bottom: 28px;
-    font-size: 1.45rem;
-    word-wrap: break-word;
-    line-height: 1.6;
-    color: #f1f1f1;
-    min-height: 60px;
-  }
-
-  input[type=text] {
-    width: 90%;
-    max-width: 600px;
-    padding: 15px 18px;
-    font-size: 1.15rem;
-    border-radius: 12px;
-    border: 1px solid rgba(255,255,255,0.08);
-    margin-bottom: 22px;
-    outline: none;
-    background: #1a1c22;
-    color: var(--text);
-    transition: all 0.2s ease;
-  }
-
-  input[type=text]:focus {
-    border-color: var(--primary);
-    box-shadow: 0 0 12px rgba(0,238,255,0.5);
-  }
-
-  .buttons {
-    display: flex;
-    flex-wrap: wrap;
-    justify-content: center;
-    gap: 14px;
-    margin-bottom: 25px;
-  }
-
-  .buttons button {
-    padding: 12px 25px;
-    font-size: 1rem;
-    border-radius: 12px;
-    border: none;
-    cursor: pointer;
-    font-weight: 600;
-    color: #000;
-    box-shadow: 0 3px 10px rgba(0,0,0,0.3);
-    transition: all 0.15s ease;
-  }
-
-  .buttons button:hover {
-    transform: translateY(-4px) scale(1.05);
-    filter: brightness(1.15);
-  }
-
-  .again { background: var(--again); }
-  .hard { background: var(--hard); }
-  .good { background: var(--good); }
-  .easy { background: var(--easy); }
-
-  .correct, .wrong {
-    font-weight: bold;
-    font-size: 1.2rem;
-    animation: pop 0.25s ease-out;
-  }
-
-  .correct { color: var(--good); }
-  .wrong { color: var(--again); }
-
-  a {
-    color: var(--primary);
-    margin-top: 25px;
-    display: inline-block;
-    text-decoration: none;
-    font-weight: 600;
-    letter-spacing: 0.5px;
-    transition: all 0.2s ease;
-  }
-
-  a:hover {
-    color: var(--accent);
-    text-shadow: 0 0 8px var(--accent);
-  }
-
-  @keyframes pop {
-    0% { transform: scale(0.8); opacity: 0; }
-    60% { transform: scale(1.05); opacity: 1; }
-    100% { transform: scale(1); }
-  }
-
-  @keyframes floatGlow {
-    0%,100% { box-shadow: 0 0 20px rgba(0,238,255,0.15); }
-    50% { box-shadow: 0 0 30px rgba(0,238,255,0.25); }
-  }
-
-  /* Mobile adjustments */
-  @media (max-width: 600px) {
-    .card { padding: 28px; border-radius: 18px; }
-    h2 { font-size: 1.8rem; }
-    h3 { font-size: 1.25rem; }
-    input[type=text] { font-size: 1rem; padding: 12px; }
-    .buttons button { padding: 10px 20px; font-size: 0.95rem; }
-  }
-</style>
-</head>
-<body>
-
-<div class="card">
-  <div id="progress"><div id="progress-bar"></div></div>
-  <h2 id="deck-title">Deck: {{ deck }}</h2>
-  <h3 id="question">Loading...</h3>
-  <input type="text" id="answer" placeholder="Type your answer..." autofocus>
-  <div class="buttons" id="grade-buttons" style="display:none;">
-    <button class="again" onclick="gradeCard(1)">Again</button>
-    <button class="hard" onclick="gradeCard(2)">Hard</button>
-    <button class="good" onclick="gradeCard(3)">Good</button>
-    <button class="easy" onclick="gradeCard(4)">Easy</button>
-  </div>
-  <div id="feedback" style="margin-top:15px;font-size:1rem;"></div>
-  <a href="/">⬅ Change deck</a>
-</div>
-
-<script>
-let cards=[], total=0, currentIndex=0, currentCard=null;
-
-async function loadCards(){
-    const res = await fetch("/api/cards/{{ deck }}");
-    cards = await res.json();
-    total = cards.length;
-    loadNextCard();
-}
-
-function updateProgress(){
-    document.getElementById("progress-bar").style.width = ((currentIndex/total)*100)+"%";
-}
-
-function loadNextCard(){
-    if(currentIndex >= total){
-        document.getElementById("question").textContent = "Finished all cards!";
-        document.getElementById("answer").style.display="none";
-        document.getElementById("grade-buttons").style.display="none";
-        document.getElementById("feedback").textContent = "Redirecting to main deck list...";
-        setTimeout(() => {
-            window.location.href = "/";
-        }, 1000); // wait 2 seconds before redirect
-        return;
-    }
-
-    currentCard = cards[currentIndex];
-    document.getElementById("question").textContent = currentCard.question;
-    document.getElementById("answer").value = "";
-    document.getElementById("answer").style.display = "inline-block";
-    document.getElementById("grade-buttons").style.display="none";
-    document.getElementById("feedback").textContent = "";
-    document.getElementById("answer").focus();
-    updateProgress();
-}
-
-
-function fuzzyMatch(a,b){ return a.toLowerCase().trim()===b.toLowerCase().trim(); }
-
-function checkAnswer(){
-    const typed = document.getElementById("answer").value.trim();
-    if(!typed) return;
-    if(fuzzyMatch(typed,currentCard.answer)){
-        document.getElementById("feedback").innerHTML = "<span class='correct'>Correct!</span>";
-        gradeCard(3);
-    } else {
-        document.getElementById("feedback").innerHTML = "<span class='wrong'>Wrong. Correct: "+currentCard.answer+"</span>";
-        document.getElementById("grade-buttons").style.display="flex";
-    }
-}
-
-function gradeCard(ease){
-    fetch(`/api/grade/${currentCard.card_id}/${ease}`);
-    currentIndex++;
-    loadNextCard();
-}
-
-document.getElementById("answer").addEventListener("keyup", e => {
-    if(e.key==="Enter") checkAnswer();
-});
-
-document.getElementById("answer").addEventListener("keydown", e => {
-    if(document.getElementById("grade-buttons").style.display==="flex"){
-        if(["1","2","3","4"].includes(e.key)){
-            e.preventDefault();
-            gradeCard(parseInt(e.key));
-        }
-    }
-});
-
-loadCards();
-</script>
-</body>
-</html>
-
-"""
-def start_flask():
-    app.run(debug=False, threaded=True)
-
-if __name__ == "__main__":
-    threading.Thread(target=preload_stats_loop, daemon=True).start()
-    threading.Thread(target=start_flask, daemon=True).start()
+def apply_answer(card_id, ease):
+    """Drop an answered card from the deck cache and count it in the stats."""
+    dirty_decks.update(deck_cache.remove_card(card_id))
+    delta = stats_tracker.record_answer(card_id, ease)
+    if delta:
+        deck_index.adjust(*delta)
+        publish_stats(stats_tracker.snapshot(), rollup=False)
+
+@bp.route("/api/grades")
+def api_grades():
+    return jsonify(grade_queue.status())
+
+@bp.route("/api/anki")
+def api_anki():
+    return jsonify(supervisor.status())
+
+@bp.route("/api/typing/events", methods=["POST"])
+def api_typing_events():
+    """Keystrokes of attempts typed on a deck page, sent in batches.
+
+    ``{"deck", "attempts": [{"card", "keys", "dt", "at", "answer"}, ...]}``:
+    ``keys`` holds one character per key (``"\\b"`` for Backspace), ``dt``
+    the milliseconds before each key, ``at`` the epoch milliseconds of the
+    attempt and ``answer`` the expected answer the page showed.
+    """
+    body = request.get_json(silent=True) or {}
+    deck, attempts = body.get("deck"), body.get("attempts")
+    if not isinstance(deck, str) or not isinstance(attempts, list) or len(attempts) > MAX_TYPING_BATCH:
+        return {"ok": False, "error": f"deck (str) and at most {MAX_TYPING_BATCH} attempts are required"}, 400
+    rows = []
+    for a in attempts:
+        if not isinstance(a, dict):
+            continue
+        card_id, keys, times, at = a.get("card"), a.get("keys"), a.get("dt"), a.get("at")
+        if (not isinstance(card_id, int) or not isinstance(keys, str) or not isinstance(times, list)
+                or len(times) != len(keys) or not all(isinstance(t, (int, float)) for t in times)):
+            continue
+        # By upload time the card has usually been graded and dropped from the
+        # deck cache, hence the page's copy of the answer; without either the
+        # attempt is still timed.
+        expected = a.get("answer")
+        if not isinstance(expected, str):
+            note = deck_cache.note(card_id, deck)
+            expected = note.answer if note is not None else None
+        at = at / 1000 if isinstance(at, (int, float)) else time.time()
+        rows.append((card_id, keys[:MAX_TYPING_KEYS], times[:MAX_TYPING_KEYS], at,
+                     expected[:MAX_TYPING_KEYS] if expected is not None else None))
+    try:
+        accepted = telemetry.record(deck, rows)
+    except Exception as e:
+        log_error("typing", "Error storing typing events:", e)
+        return {"ok": False, "error": "typing events could not be saved"}, 500
+    return {"ok": True, "accepted": accepted, "rejected": len(attempts) - accepted}
+
+@bp.route("/api/typing")
+def api_typing():
+    """Typing speed and accuracy per deck."""
+    return json_response(telemetry.decks)
+
+@bp.route("/api/typing/deck/<deck>")
+def api_typing_deck(deck):
+    """A deck's speed and accuracy, with its weakest cards and characters and common confusions."""
+    found = telemetry.deck(deck, request.args.get("top", 10, type=int))
+    if found is None:
+        return {"ok": False, "error": "no typing recorded for this deck"}, 404
+    return json_response(lambda: found)
+
+@bp.route("/api/typing/card/<int:card_id>")
+def api_typing_card(card_id):
+    """A card's speed and accuracy, and where in the answer the errors are."""
+    found = telemetry.card(card_id)
+    if found is None:
+        return {"ok": False, "error": "no typing recorded for this card"}, 404
+    return json_response(lambda: found)
+
+@bp.route("/api/events")
+def api_events():
+    """Server-sent events: ``stats`` (changed deck counts) and ``decks`` (deck list changed)."""
+    q = events.subscribe()  # past MAX_EVENT_CLIENTS, the oldest stream is ended
+    # Bring the page up to date first: it may have been rendered from an older version.
+    events.publish("stats", stats_event(deck_index.all_totals()), to=q)
+    return Response(events.stream(q), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.before_request
+def restrict_debug():
+    if request.path.startswith("/debug/") and not DEBUG_REMOTE and request.remote_addr not in LOOPBACK:
+        return {"ok": False, "error": "debug endpoints are only served to local clients"}, 403
+
+@bp.route("/debug/startup")
+def debug_startup():
+    return jsonify(startup_timer.report())
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@bp.after_app_request
+def observe_request(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - start,
+                             endpoint=request.endpoint or "unmatched", status=response.status_code)
+    return response
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@bp.route("/debug/timings")
+def debug_timings():
+    return jsonify({"metrics": metrics.to_json(), "startup": startup_timer.report()})
+
+@bp.route("/debug/profile", methods=["GET", "POST"])
+def debug_profile():
+    """GET: the sampled stacks (``?format=collapsed`` for flamegraph input).
+
+    POST ``{"enabled": true, "interval": 0.01}`` starts sampling, ``false`` stops it.
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        if body.get("enabled"):
+            interval = body.get("interval", 0.01)
+            if isinstance(interval, bool) or not isinstance(interval, (int, float)) or not 0 < interval <= 10:
+                return {"ok": False, "error": "interval must be a number of seconds, at most 10"}, 400
+            profiler.start(interval, reset=body.get("reset", True))
+        else:
+            profiler.stop()
+    if request.args.get("format") == "collapsed":
+        return Response(profiler.collapsed(), mimetype="text/plain")
+    return jsonify(profiler.report(request.args.get("top", 30, type=int)))
+
+def start_flask(app, timer=startup_timer):
+    from werkzeug.serving import make_server
+    with timer.phase("flask_bind"):
+        server = make_server(HOST, PORT, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def serve(app, host, port, threads):
+    """Serve headless with waitress when installed, else werkzeug's threaded server."""
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        print("waitress is not installed; using the development server")
+        app.run(host=host, port=port, threaded=True)
+        return
+    waitress_serve(app, host=host, port=port, threads=threads)
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Typing practice for Anki decks.")
+    parser.add_argument("--headless", action="store_true",
+                        help="serve the web UI only: no window, no Anki process management")
+    parser.add_argument("--backend", choices=["desktop", "remote", "fake"], default=BACKEND,
+                        help=f"how to reach AnkiConnect (default: {BACKEND})")
+    parser.add_argument("--anki-url", default=ANKI_CONNECT_URL, help="AnkiConnect URL")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--threads", type=int, default=8, help="headless worker threads")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global ANKI_CONNECT_URL, HOST, PORT
+    startup_timer.phases["imports"] = (0.0, time.perf_counter() - PROCESS_START)
+    args = parse_args(argv)
+    ANKI_CONNECT_URL, HOST, PORT = args.anki_url, args.host, args.port
+    if args.headless and args.backend == "desktop":
+        args.backend = "remote"
+    app = create_app(args.data_dir, args.backend, start=True)
+
+    if args.headless:
+        print(f"AnkiTypist serving on http://{HOST}:{PORT} (backend: {backend.name})")
+        serve(app, HOST, PORT, args.threads)
+        return
 
+    start_flask(app)
+    with startup_timer.phase("webview_import"):
+        import webview
     userdata = os.path.join(tempfile.gettempdir(), "anki_webview_userdata")
     os.makedirs(userdata, exist_ok=True)
 
-    webview.create_window("Anki Server", "http://127.0.0.1:5000")
-    webview.start(gui='edgechromium', debug=False, http_server=True)
+    webview.create_window("Anki Server", f"http://{HOST}:{PORT}")
+    webview.start(lambda: startup_timer.mark("window_shown"),
+                  gui='edgechromium' if sys.platform == "win32" else None,
+                  debug=False, http_server=True)
+
+if __name__ == "__main__":
+    main()
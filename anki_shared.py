@@ -0,0 +1,209 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class LocalShared:
+    """The single-process stand-in: nothing is shared and this worker does everything.
+
+    Worker processes that serve the same data dir use SqliteShared instead;
+    both have the same methods, so the server code doesn't branch on which
+    one it has.
+    """
+
+    name = "local"
+    multi_process = False
+
+    def __init__(self):
+        self.worker = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def acquire(self, lease, ttl):
+        """Take or renew ``lease`` for this worker; True while it holds it."""
+        return True
+
+    def release(self, lease):
+        pass
+
+    def claim_slot(self):
+        """A number no other live worker holds (for per-worker files)."""
+        return 0
+
+    def put(self, key, value):
+        pass
+
+    def get(self, key, since=0):
+        """``(version, value)`` if ``key`` was put after version ``since``, else None."""
+        return None
+
+    def put_deck(self, deck, rows):
+        pass
+
+    def get_deck(self, deck, max_age):
+        """``(rows, removed card ids)`` of a deck saved less than ``max_age`` seconds ago, or None."""
+        return None
+
+    def add_answer(self, card_id, ease):
+        pass
+
+    def last_answer(self):
+        """Sequence number of the newest grade in the feed."""
+        return 0
+
+    def answers_since(self, seq):
+        """``(seq, worker, card_id, ease)`` of grades after ``seq``, oldest first."""
+        return []
+
+    def prune(self, max_age):
+        pass
+
+    def close(self):
+        pass
+
+
+class SqliteShared(LocalShared):
+    """Caches shared by the worker processes of one data dir, in a SQLite file.
+
+    Holds the published deck list/stats (versioned keys), deck card rows,
+    a feed of grades (so every worker can drop answered cards and the
+    refresher can adjust its counts), leases for electing the one worker
+    that polls Anki, and slots that give each live worker its own files.
+    """
+
+    name = "sqlite"
+    multi_process = True
+
+    def __init__(self, path, busy_timeout=5):
+        super().__init__()
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            self.db.executescript(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, version INTEGER, value TEXT);"
+                "CREATE TABLE IF NOT EXISTS decks (deck TEXT PRIMARY KEY, saved_at REAL, seq INTEGER, rows TEXT);"
+                "CREATE TABLE IF NOT EXISTS answers (seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " worker TEXT, card_id INTEGER, ease INTEGER, at REAL);"
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, pid INTEGER, expires REAL);"
+                "CREATE TABLE IF NOT EXISTS slots (slot INTEGER PRIMARY KEY, owner TEXT, pid INTEGER);"
+            )
+
+    # ------------------- election -------------------
+    def acquire(self, lease, ttl):
+        # One statement, so two workers racing for a free lease can't both win.
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO leases VALUES (?, ?, ?, ?) ON CONFLICT(name) DO UPDATE"
+                " SET owner = excluded.owner, pid = excluded.pid, expires = excluded.expires"
+                " WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                (lease, self.worker, os.getpid(), now + ttl, now))
+            row = self.db.execute("SELECT owner, pid FROM leases WHERE name = ?", (lease,)).fetchone()
+        if row[0] == self.worker:
+            return True
+        if not _pid_alive(row[1]):
+            # The holder died without releasing it; take over without waiting out the lease.
+            with self.lock:
+                self.db.execute("UPDATE leases SET expires = 0 WHERE name = ? AND owner = ?", (lease, row[0]))
+            return self.acquire(lease, ttl)
+        return False
+
+    def release(self, lease):
+        with self.lock:
+            self.db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (lease, self.worker))
+
+    def claim_slot(self):
+        slot = 0
+        while True:
+            with self.lock:
+                row = self.db.execute("SELECT owner, pid FROM slots WHERE slot = ?", (slot,)).fetchone()
+                if row is None or not _pid_alive(row[1]):
+                    # Compare-and-swap on the previous owner.
+                    self.db.execute(
+                        "INSERT INTO slots VALUES (?, ?, ?) ON CONFLICT(slot) DO UPDATE"
+                        " SET owner = excluded.owner, pid = excluded.pid WHERE slots.owner IS ?",
+                        (slot, self.worker, os.getpid(), row[0] if row else None))
+                    if self.db.execute("SELECT owner FROM slots WHERE slot = ?",
+                                       (slot,)).fetchone()[0] == self.worker:
+                        return slot
+            slot += 1
+
+    # ------------------- data -------------------
+    def put(self, key, value):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO kv VALUES (?, 1, ?) ON CONFLICT(key) DO UPDATE"
+                " SET version = kv.version + 1, value = excluded.value",
+                (key, json.dumps(value, separators=(",", ":"))))
+
+    def get(self, key, since=0):
+        with self.lock:
+            row = self.db.execute("SELECT version, value FROM kv WHERE key = ? AND version > ?",
+                                  (key, since)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put_deck(self, deck, rows):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO decks VALUES (?, ?, " + _LAST_ANSWER + ", ?)",
+                (deck, time.time(), json.dumps(rows, separators=(",", ":"))))
+
+    def get_deck(self, deck, max_age):
+        with self.lock:
+            row = self.db.execute("SELECT seq, rows FROM decks WHERE deck = ? AND saved_at > ?",
+                                  (deck, time.time() - max_age)).fetchone()
+            if row is None:
+                return None
+            removed = {card_id for (card_id,) in self.db.execute(
+                "SELECT card_id FROM answers WHERE seq > ?", (row[0],))}
+        return json.loads(row[1]), removed
+
+    def add_answer(self, card_id, ease):
+        with self.lock:
+            self.db.execute("INSERT INTO answers (worker, card_id, ease, at) VALUES (?, ?, ?, ?)",
+                            (self.worker, card_id, ease, time.time()))
+
+    def last_answer(self):
+        with self.lock:
+            return self.db.execute("SELECT " + _LAST_ANSWER).fetchone()[0]
+
+    def answers_since(self, seq):
+        with self.lock:
+            return self.db.execute("SELECT seq, worker, card_id, ease FROM answers WHERE seq > ?"
+                                   " ORDER BY seq", (seq,)).fetchall()
+
+    def prune(self, max_age):
+        """Forget grades and deck rows older than any reader still trusts."""
+        cutoff = time.time() - max_age
+        with self.lock:
+            self.db.execute("DELETE FROM decks WHERE saved_at < ?", (cutoff,))
+            # Grades newer than a saved deck are still needed to filter its rows.
+            self.db.execute("DELETE FROM answers WHERE at < ? AND seq <= IFNULL((SELECT MIN(seq) FROM decks), seq)",
+                            (cutoff,))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# AUTOINCREMENT's counter, which (unlike MAX(seq)) survives pruning.
+_LAST_ANSWER = "(SELECT IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'answers'), 0))"
+
+
+def _pid_alive(pid):
+    import psutil
+    return pid is not None and psutil.pid_exists(pid)
+
+
+def make_shared(name, path):
+    if name == "local":
+        return LocalShared()
+    if name == "sqlite":
+        return SqliteShared(path)
+    raise ValueError(f"unknown shared cache: {name!r} (expected local or sqlite)")
@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA_VERSION = 2
+
+
+def collection_mtime(profile_dir):
+    """Last write to a profile's collection (database or its WAL), or None."""
+    if not profile_dir:
+        return None
+    path = os.path.join(profile_dir, "collection.anki2")
+    mtimes = [os.path.getmtime(p) for p in (path, path + "-wal") if os.path.exists(p)]
+    return max(mtimes) if mtimes else None
+
+
+class SnapshotStore:
+    """SQLite copy of the deck list, stats and loaded deck cards.
+
+    Lets the UI render straight away on the next start while Anki is still
+    launching. Card content is only restored if the collection has not been
+    written since it was saved; older decks are kept for offline practice
+    (``load_deck``). The deck list and stats are always restored and then
+    revalidated once AnkiConnect answers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+
+    def _migrate(self):
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or int(row[0]) != SCHEMA_VERSION:
+                self.db.execute("DROP TABLE IF EXISTS decks")
+                self.db.execute("DELETE FROM meta")
+                self.db.execute("INSERT INTO meta VALUES ('schema', ?)", (str(SCHEMA_VERSION),))
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS decks ("
+                " deck TEXT PRIMARY KEY, saved_at REAL, col_mtime REAL, cards TEXT)"
+            )
+
+    def _get(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_meta(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def set_meta(self, key, value):
+        with self.lock, self.db:
+            self._set(key, value)
+
+    def load(self, col_mtime=None):
+        """Returns ``(decks, stats, deck_cards)``; missing parts are None/empty.
+
+        ``deck_cards`` leaves out decks saved before the collection's last
+        write (``col_mtime``); they stay in the store for ``load_deck``.
+        """
+        with self.lock:
+            decks = self._get("decks")
+            stats = self._get("stats")
+            deck_cards = {}
+            rows = self.db.execute("SELECT deck, col_mtime, cards FROM decks").fetchall()
+        for deck, saved_mtime, cards in rows:
+            if col_mtime is None or saved_mtime == col_mtime:
+                deck_cards[deck] = json.loads(cards)
+        return decks, tuple(stats) if stats else None, deck_cards
+
+    def load_deck(self, deck):
+        """A deck's saved rows whatever the collection did since, or None."""
+        with self.lock:
+            row = self.db.execute("SELECT cards FROM decks WHERE deck = ?", (deck,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_overview(self, decks, stats):
+        with self.lock, self.db:
+            self._set("decks", decks)
+            self._set("stats", list(stats))
+            self._set("saved_at", time.time())
+
+    def save_deck(self, deck, rows, col_mtime=None):
+        """``rows`` are ``[card_id, note_id, question, answer]`` lists."""
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO decks VALUES (?, ?, ?, ?)",
+                (deck, time.time(), col_mtime, json.dumps(rows, separators=(",", ":"))),
+            )
+
+    def drop_decks(self, decks=None):
+        """Forget the saved cards of ``decks``, or of every deck."""
+        with self.lock, self.db:
+            if decks is None:
+                self.db.execute("DELETE FROM decks")
+            else:
+                self.db.executemany("DELETE FROM decks WHERE deck = ?", [(d,) for d in decks])
+
+    def close(self):
+        with self.lock:
+            self.db.close()
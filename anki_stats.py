@@ -0,0 +1,185 @@
+import math
+import threading
+import time
+
+CARD_NEW = 0
+REVIEW_TYPES = (2, 3)  # review, relearning — what Anki's is:review matches
+
+
+def aggregate_stats(cards, new_cards, review_cards, card_states=None):
+    """Count learn/review cards per deck in a single pass over cardsInfo.
+
+    Returns the ``(stats, learn_today, review_today)`` tuple stored in
+    ``cache_data["stats"]``. When ``card_states`` is given it is filled with
+    ``card_id -> (deck, is_new, is_review)`` for later incremental updates.
+    """
+    new_ids = set(new_cards)
+    review_ids = set(review_cards)
+    stats = {}
+    for c in cards:
+        d = c["deckName"]
+        counts = stats.get(d)
+        if counts is None:
+            counts = stats[d] = {"learn": 0, "review": 0}
+        card_id = c["cardId"]
+        is_new = card_id in new_ids
+        is_review = card_id in review_ids
+        if is_new: counts["learn"] += 1
+        if is_review: counts["review"] += 1
+        if card_states is not None:
+            card_states[card_id] = (d, is_new, is_review)
+    return stats, len(new_cards), len(review_cards)
+
+
+class StatsTracker:
+    """Per-deck learn/review counters kept current from card deltas.
+
+    The first sync (and any sync after drift is suspected) rebuilds from the
+    full ``is:new``/``is:review`` sets. Later syncs only look at cards rated
+    or added since the previous sync whose modification time moved, and
+    apply the difference to the cached counters.
+    """
+
+    def __init__(self, full_rebuild_interval=1800, clock_skew=2):
+        self.full_rebuild_interval = full_rebuild_interval
+        self.clock_skew = clock_skew
+        self.lock = threading.RLock()
+        self.cards = {}
+        self.counts = {}
+        self.learn_total = 0
+        self.review_total = 0
+        self.last_sync = 0
+        self.last_full = 0
+        self.needs_full = True
+        self.last_mode = None  # "full" or "delta": how the last sync ran
+        self._pending = None
+        self.answers = {}  # card_id -> (ease, time) of grades Anki may not have yet
+
+    def invalidate(self):
+        self.needs_full = True
+
+    def _full_due(self, now):
+        return (
+            self.needs_full
+            or now - self.last_full > self.full_rebuild_interval
+            or now - self.last_sync > 300 * 86400
+        )
+
+    def sync_actions(self):
+        """AnkiConnect actions for the first round trip of the next sync."""
+        now = time.time()
+        if self._full_due(now):
+            self._pending = ("full", now)
+            return [
+                ("findCards", {"query": "is:new"}),
+                ("findCards", {"query": "is:review"}),
+            ]
+        days = max(1, math.ceil((now - self.last_sync) / 86400) + 1)
+        self._pending = ("delta", now)
+        return [("findCards", {"query": f"rated:{days} OR added:{days}"})]
+
+    def sync(self, anki, results):
+        """Finish a sync started by sync_actions() and return the stats tuple.
+
+        AnkiConnect is called without the lock, so grades are recorded (and
+        served) while a rebuild fetches the collection; answers recorded
+        since the sync began are applied again on top of what it fetched.
+        """
+        mode, started = self._pending
+        self.last_mode = mode
+        if mode == "full":
+            fetched = self._fetch_all(anki, *results)
+        else:
+            fetched = self._fetch_changes(anki, results[0])
+        with self.lock:
+            if fetched is None:
+                self.needs_full = True
+                return self.snapshot()
+            if mode == "full":
+                states = {}
+                self.counts, self.learn_total, self.review_total = aggregate_stats(*fetched, states)
+                self.cards = states
+                self.last_full = started
+            else:
+                for c in fetched:
+                    ctype = c["type"]
+                    self.update_card(c["cardId"], c["deckName"], ctype == CARD_NEW, ctype in REVIEW_TYPES)
+            self._replay_answers(started)
+            self.last_sync = started
+            self.needs_full = False
+            return self.snapshot()
+
+    def _fetch_all(self, anki, new_cards, review_cards):
+        cards = anki.invoke("cardsInfo", cards=list(set(new_cards).union(review_cards)))
+        return cards, new_cards, review_cards
+
+    def _fetch_changes(self, anki, touched):
+        """cardsInfo of the touched cards modified since the last sync; None on drift."""
+        if not touched:
+            return []
+        since = self.last_sync - self.clock_skew
+        mod_times = anki.invoke("cardsModTime", cards=touched)
+        changed = [m["cardId"] for m in mod_times if m["mod"] >= since]
+        if len(mod_times) < len(touched):
+            return None  # cards were deleted behind our back
+        if not changed:
+            return []
+        infos = anki.invoke("cardsInfo", cards=changed)
+        if len(infos) < len(changed):
+            return None
+        return infos
+
+    def _replay_answers(self, started):
+        # Grades wait in the grade queue for a moment before Anki has them, so
+        # what was just fetched may still count their cards as new.
+        for card_id, (ease, at) in list(self.answers.items()):
+            self._answer(card_id, ease)
+            if at < started - self.clock_skew:
+                del self.answers[card_id]
+
+    def update_card(self, card_id, deck, is_new, is_review):
+        """Move one card's contribution to its new deck/state."""
+        with self.lock:
+            old = self.cards.get(card_id)
+            if old is not None:
+                self._add(*old, -1)
+            if is_new or is_review:
+                self.cards[card_id] = (deck, is_new, is_review)
+                self._add(deck, is_new, is_review, 1)
+            else:
+                self.cards.pop(card_id, None)
+
+    def record_answer(self, card_id, ease):
+        """Apply a grade to the counters ahead of the next sync.
+
+        A new card leaves the learn count (Easy graduates it straight to
+        review); review and relearning cards stay in review. Returns the
+        ``(deck, learn_delta, review_delta)`` applied, or None.
+        """
+        with self.lock:
+            self.answers[card_id] = (ease, time.time())
+            return self._answer(card_id, ease)
+
+    def _answer(self, card_id, ease):
+        state = self.cards.get(card_id)
+        if state is None or not state[1]:
+            return None
+        graduated = ease == 4
+        self.update_card(card_id, state[0], False, graduated)
+        return state[0], -1, 1 if graduated else 0
+
+    def _add(self, deck, is_new, is_review, sign):
+        counts = self.counts.get(deck)
+        if counts is None:
+            counts = self.counts[deck] = {"learn": 0, "review": 0}
+        if is_new:
+            counts["learn"] += sign
+            self.learn_total += sign
+        if is_review:
+            counts["review"] += sign
+            self.review_total += sign
+
+    def snapshot(self):
+        with self.lock:
+            stats = {d: dict(c) for d, c in self.counts.items()}
+            return stats, self.learn_total, self.review_total
@@ -0,0 +1,160 @@
+import threading
+import time
+
+from anki_connect import AnkiConnectError
+
+
+class AnkiSupervisor:
+    """Tracks whether AnkiConnect is answering, at startup and mid-session.
+
+    ``wait_ready`` probes with a short timeout and exponential backoff
+    until Anki answers. Once running, a monitor thread notices outages
+    (failed calls reported through ``report_failure``, the Anki process it
+    launched exiting, or a periodic probe when nothing else has talked to
+    Anki lately) and probes until Anki is back, whoever restarts it.
+    ``on_up``/``on_down`` callbacks run on each transition; ``wait_up``
+    blocks while Anki is away.
+    """
+
+    def __init__(self, anki, backend, probe_timeout=1.0, interval=10, backoff=0.05, max_backoff=2.0):
+        self.anki = anki
+        self.backend = backend
+        self.probe_timeout = probe_timeout
+        self.interval = interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = "starting"
+        self.changed_at = time.time()
+        self.outages = 0
+        self.last_error = None
+        self.version = None
+        self.on_up = []
+        self.on_down = []
+        self.watch = True  # probe when idle; off where another process does the watching
+        self.cond = threading.Condition()
+        self._up = threading.Event()
+        self._suspect = False
+        self._stopping = False
+        self._thread = None
+        anki.on_unavailable = self.report_failure
+
+    # ------------------- probing -------------------
+    def probe(self):
+        """One readiness check: True if AnkiConnect answered within ``probe_timeout``."""
+        try:
+            self.version = self.anki.invoke("version", timeout=self.probe_timeout)
+        except AnkiConnectError as e:
+            self.last_error = str(e)
+            return False
+        return True
+
+    def wait_ready(self, timeout):
+        """Probe until AnkiConnect answers; False if it didn't within ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        delay = self.backoff
+        while not self.probe():
+            remaining = deadline - time.monotonic()
+            if self.backend.reap():
+                self.last_error = "Anki exited during startup"
+                remaining = 0
+            if remaining <= 0:
+                self._set("down")
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.max_backoff)
+        self._set("up")
+        return True
+
+    def _set(self, state):
+        with self.cond:
+            if state == self.state:
+                return
+            was, self.state = self.state, state
+            self.changed_at = time.time()
+            if state == "up":
+                self.last_error = None
+                self._up.set()
+            else:
+                self._up.clear()
+                self.outages += was == "up"
+            error = self.last_error
+        if state == "up":
+            print("AnkiConnect ready" if was == "starting" else "AnkiConnect is back")
+        elif was == "up":
+            print("[!] Lost AnkiConnect:", error)
+        else:
+            print("[!] AnkiConnect not answering:", error)
+        for callback in self.on_up if state == "up" else self.on_down:
+            try:
+                callback()
+            except Exception as e:
+                print("Supervisor callback failed:", e)
+
+    # ------------------- public -------------------
+    def is_up(self):
+        return self._up.is_set()
+
+    def wait_up(self, timeout=None):
+        """Block while Anki is unreachable; True once it is up."""
+        return self._up.wait(timeout)
+
+    def report_failure(self, error):
+        """A call couldn't reach AnkiConnect: have the monitor check now."""
+        with self.cond:
+            self.last_error = str(error)
+            if self.state == "up":
+                self._suspect = True
+                self.cond.notify_all()
+
+    def status(self):
+        with self.cond:
+            return {
+                "state": self.state,
+                "since": self.changed_at,
+                "outages": self.outages,
+                "version": self.version,
+                "last_error": self.last_error,
+                "anki_pid": self.backend.pid,
+            }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="anki-supervisor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self._stopping = True
+            self.cond.notify_all()
+
+    # ------------------- monitor -------------------
+    def _run(self):
+        delay = self.backoff
+        while True:
+            with self.cond:
+                if self.state == "up":
+                    if not self._suspect:
+                        self.cond.wait(self.interval)
+                    suspect, self._suspect = self._suspect, False
+                else:
+                    self.cond.wait(delay)
+                    suspect = False
+                if self._stopping:
+                    return
+                up = self.state == "up"
+            if up:
+                if self.backend.reap():
+                    self.last_error = "Anki exited"
+                # Calls that went through since the last check say enough.
+                elif not suspect and (not self.watch
+                                      or time.monotonic() - self.anki.last_reply() < self.interval):
+                    continue
+                elif self.probe():
+                    continue
+                delay = self.backoff
+                self._set("down")
+            elif self.probe():
+                self._set("up")
+            else:
+                delay = min(delay * 2, self.max_backoff)
@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from collections import Counter
+
+BACKSPACE = "\b"
+_TOTALS = ("attempts", "chars", "ms", "keystrokes", "errors", "corrections")
+
+
+def analyze(keys, times, expected=None):
+    """Replay one attempt's keystrokes against the expected answer.
+
+    ``keys`` is what was typed, one character per key with ``"\\b"`` for
+    Backspace; ``times`` the milliseconds before each key (the first is the
+    pause after the card was shown, and is left out of the typing time).
+    The cursor is assumed to stay at the end, so a key is an error if it
+    differs from the expected character at that position, even when it is
+    corrected afterwards. Without ``expected`` only the speed is measured.
+    """
+    typed = []
+    errors = keystrokes = corrections = 0
+    positions, confusions = Counter(), Counter()
+    chars = {}  # expected char -> [keystrokes, errors, ms]
+    for i, (key, ms) in enumerate(zip(keys, times)):
+        if key == BACKSPACE:
+            corrections += 1
+            if typed:
+                typed.pop()
+            continue
+        pos = len(typed)
+        typed.append(key)
+        if expected is None:
+            continue
+        want = expected[pos] if pos < len(expected) else ""
+        keystrokes += 1
+        wrong = key != want
+        if wrong:
+            errors += 1
+            positions[pos] += 1
+            confusions[want, key] += 1
+        if want:
+            stats = chars.setdefault(want, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += wrong
+            stats[2] += ms if i else 0
+    return {
+        "chars": len(typed),
+        "ms": sum(times[1:]),
+        "keystrokes": keystrokes,
+        "errors": errors,
+        "corrections": corrections,
+        "positions": positions,
+        "confusions": confusions,
+        "char_stats": chars,
+    }
+
+
+def wpm(chars, ms):
+    """Words (five characters) per minute."""
+    return round(chars / 5 / (ms / 60000), 1) if ms else None
+
+
+def _summary(row):
+    totals = dict(zip(_TOTALS, row))
+    totals["wpm"] = wpm(totals["chars"], totals["ms"])
+    totals["accuracy"] = (round(1 - totals["errors"] / totals["keystrokes"], 3)
+                          if totals["keystrokes"] else None)
+    return totals
+
+
+def _pack(times):
+    # Milliseconds between keys, as little-endian uint16 (pauses over a minute are clipped).
+    packed = array("H", (min(max(int(t), 0), 0xFFFF) for t in times))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+class TelemetryStore:
+    """Typed attempts, kept raw and as running totals, in a SQLite file.
+
+    Every attempt is appended to ``attempts`` (keys as text, timings packed
+    two bytes per key) and, in the same transaction, added to per-deck,
+    per-card, per-character, per-position and confusion totals, so the
+    summaries never rescan the raw events. Several processes can share the
+    file.
+    """
+
+    def __init__(self, path, busy_timeout=5):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        totals = ", ".join(f"{c} INTEGER" for c in _TOTALS)
+        with self.lock, self.db:
+            self.db.executescript(
+                "CREATE TABLE IF NOT EXISTS attempts (id INTEGER PRIMARY KEY, at REAL,"
+                " deck TEXT, card INTEGER, keys TEXT, times BLOB);"
+                f"CREATE TABLE IF NOT EXISTS decks (deck TEXT PRIMARY KEY, {totals});"
+                f"CREATE TABLE IF NOT EXISTS cards (card INTEGER PRIMARY KEY, deck TEXT, {totals});"
+                "CREATE TABLE IF NOT EXISTS positions (card INTEGER, pos INTEGER, errors INTEGER,"
+                " PRIMARY KEY (card, pos));"
+                "CREATE TABLE IF NOT EXISTS chars (deck TEXT, ch TEXT, keystrokes INTEGER,"
+                " errors INTEGER, ms INTEGER, PRIMARY KEY (deck, ch));"
+                "CREATE TABLE IF NOT EXISTS confusions (deck TEXT, expected TEXT, typed TEXT,"
+                " count INTEGER, PRIMARY KEY (deck, expected, typed));"
+            )
+
+    def record(self, deck, attempts):
+        """Store ``(card_id, keys, times, at, expected)`` attempts typed in ``deck``."""
+        raw, decks, cards = [], Counter(), {}
+        positions, chars, confusions = Counter(), {}, Counter()
+        for card_id, keys, times, at, expected in attempts:
+            raw.append((at, deck, card_id, keys, _pack(times)))
+            result = analyze(keys, times, expected)
+            counts = Counter({c: result[c] for c in _TOTALS[1:]}, attempts=1)
+            decks.update(counts)
+            cards.setdefault(card_id, Counter()).update(counts)
+            for pos, n in result["positions"].items():
+                positions[card_id, pos] += n
+            for ch, stats in result["char_stats"].items():
+                total = chars.setdefault(ch, [0, 0, 0])
+                for j, n in enumerate(stats):
+                    total[j] += n
+            confusions.update(result["confusions"])
+        if not raw:
+            return 0
+        add = ", ".join(f"{c} = {c} + excluded.{c}" for c in _TOTALS)
+        values = ", ".join("?" * len(_TOTALS))
+        with self.lock, self.db:
+            self.db.executemany("INSERT INTO attempts (at, deck, card, keys, times) VALUES (?, ?, ?, ?, ?)", raw)
+            self.db.execute(f"INSERT INTO decks VALUES (?, {values}) ON CONFLICT(deck) DO UPDATE SET {add}",
+                            (deck, *(decks[c] for c in _TOTALS)))
+            self.db.executemany(
+                f"INSERT INTO cards VALUES (?, ?, {values}) ON CONFLICT(card) DO UPDATE SET deck = excluded.deck, {add}",
+                [(card_id, deck, *(counts[c] for c in _TOTALS)) for card_id, counts in cards.items()])
+            self.db.executemany(
+                "INSERT INTO positions VALUES (?, ?, ?) ON CONFLICT(card, pos) DO UPDATE"
+                " SET errors = errors + excluded.errors",
+                [(card_id, pos, n) for (card_id, pos), n in positions.items()])
+            self.db.executemany(
+                "INSERT INTO chars VALUES (?, ?, ?, ?, ?) ON CONFLICT(deck, ch) DO UPDATE SET"
+                " keystrokes = keystrokes + excluded.keystrokes, errors = errors + excluded.errors,"
+                " ms = ms + excluded.ms",
+                [(deck, ch, *stats) for ch, stats in chars.items()])
+            self.db.executemany(
+                "INSERT INTO confusions VALUES (?, ?, ?, ?) ON CONFLICT(deck, expected, typed) DO UPDATE"
+                " SET count = count + excluded.count",
+                [(deck, want, got, n) for (want, got), n in confusions.items()])
+        return len(raw)
+
+    # ------------------- summaries -------------------
+    def decks(self):
+        """Totals per deck, most practised first."""
+        with self.lock:
+            rows = self.db.execute(f"SELECT deck, {', '.join(_TOTALS)} FROM decks ORDER BY attempts DESC").fetchall()
+        return [dict(deck=row[0], **_summary(row[1:])) for row in rows]
+
+    def deck(self, deck, top=10):
+        """A deck's totals with its weakest cards, characters and most common confusions; None if unseen."""
+        with self.lock:
+            row = self.db.execute(f"SELECT {', '.join(_TOTALS)} FROM decks WHERE deck = ?", (deck,)).fetchone()
+            if row is None:
+                return None
+            cards = self.db.execute(
+                f"SELECT card, {', '.join(_TOTALS)} FROM cards WHERE deck = ? AND keystrokes > 0"
+                " ORDER BY CAST(errors AS REAL) / keystrokes DESC, attempts DESC LIMIT ?", (deck, top)).fetchall()
+            chars = self.db.execute(
+                "SELECT ch, keystrokes, errors, ms FROM chars WHERE deck = ? AND keystrokes > 0"
+                " ORDER BY CAST(errors AS REAL) / keystrokes DESC, keystrokes DESC LIMIT ?", (deck, top)).fetchall()
+            confusions = self.db.execute(
+                "SELECT expected, typed, count FROM confusions WHERE deck = ? ORDER BY count DESC LIMIT ?",
+                (deck, top)).fetchall()
+        return dict(
+            deck=deck,
+            **_summary(row),
+            weak_cards=[dict(card_id=r[0], **_summary(r[1:])) for r in cards],
+            weak_chars=[{"char": ch, "keystrokes": n, "error_rate": round(err / n, 3),
+                    "ms": round(ms / n)} for ch, n, err, ms in chars],
+            confusions=[{"expected": want, "typed": got, "count": n} for want, got, n in confusions],
+        )
+
+    def card(self, card_id):
+        """A card's totals and the answer positions mistyped most; None if unseen."""
+        with self.lock:
+            row = self.db.execute(f"SELECT deck, {', '.join(_TOTALS)} FROM cards WHERE card = ?",
+                                  (card_id,)).fetchone()
+            if row is None:
+                return None
+            positions = self.db.execute("SELECT pos, errors FROM positions WHERE card = ? ORDER BY pos",
+                                        (card_id,)).fetchall()
+        return dict(card_id=card_id, deck=row[0], **_summary(row[1:]),
+                    positions=[{"pos": pos, "errors": n} for pos, n in positions])
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,93 @@
+"""Time and memory of turning cardsInfo/notesInfo into cached cards.
+
+Run from the repository root:
+
+    python -m bench.bench_cards [--sizes 10000 100000] [--cards-per-note 2]
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from anki_cards import NoteStore
+
+WORDS = ["ls", "cd", "grep", "sed", "awk", "find", "xargs", "tar", "git", "ssh"]
+
+
+def make_payload(n_cards, cards_per_note=2, field_chars=200, seed=0):
+    """Synthetic ``cardsInfo``/``notesInfo`` for ``n_cards`` cards sharing notes."""
+    rng = random.Random(seed)
+    n_notes = max(1, n_cards // cards_per_note)
+    notes_info = []
+    for i in range(n_notes):
+        note_id = 1_000_000 + i
+        front = "".join(rng.choice("abcdefghij ") for _ in range(field_chars))
+        notes_info.append({
+            "noteId": note_id,
+            "modelName": "Basic (and reversed card)",
+            "fields": {
+                "Front": {"value": f"{front} #{i}", "order": 0},
+                "Back": {"value": rng.choice(WORDS), "order": 1},
+            },
+        })
+    cards_info = [
+        {"cardId": 5_000_000 + c, "note": 1_000_000 + c % n_notes}
+        for c in range(n_cards)
+    ]
+    return cards_info, notes_info
+
+
+def legacy_build(cards_info, notes_info):
+    note_map = {n["noteId"]: n for n in notes_info}
+    return [
+        {
+            "card_id": c["cardId"],
+            "question": list(note_map[c["note"]]["fields"].values())[0]["value"],
+            "answer": list(note_map[c["note"]]["fields"].values())[-1]["value"]
+        } for c in cards_info
+    ]
+
+
+def store_build(cards_info, notes_info):
+    return NoteStore().build(cards_info, notes_info)
+
+
+def measure(fn, payload, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*payload)
+        best = min(best, time.perf_counter() - start)
+    # Memory retained by the result, measured separately so tracing doesn't skew timing.
+    gc.collect()
+    tracemalloc.start()
+    result = fn(*payload)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return best, retained
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--cards-per-note", type=int, default=2)
+    parser.add_argument("--field-chars", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        payload = make_payload(size, args.cards_per_note, args.field_chars)
+        for name, fn in (("legacy_dicts", legacy_build), ("note_store", store_build)):
+            seconds, retained = measure(fn, payload, args.repeat)
+            row = {"benchmark": name, "cards": size, "seconds": seconds, "retained_bytes": retained}
+            results.append(row)
+            print(json.dumps(row))
+    return results
+
+
+if __name__ == "__main__":
+    main()
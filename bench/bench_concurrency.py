@@ -0,0 +1,88 @@
+"""Stress concurrent AnkiConnect calls and Flask requests against the fake.
+
+Run from the repository root:
+
+    python -m bench.bench_concurrency [--clients 32] [--latency 0.05]
+
+Reports how many requests reached AnkiConnect with and without coalescing,
+and checks that every concurrent client saw the same result.
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+
+from anki_connect import AnkiConnect
+from fake_ankiconnect import FakeAnkiConnect, FakeCollection
+
+
+def hammer(clients, fn):
+    """Call ``fn`` from ``clients`` threads released at once; returns (results, seconds)."""
+    barrier = threading.Barrier(clients)
+    results = [None] * clients
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+
+def bench_client(server, clients, coalesce):
+    anki = AnkiConnect(server.url, pool_size=clients, coalesce=coalesce)
+    query = 'deck:"Deck 0" is:due'
+    before = len(server.calls)
+    results, seconds = hammer(clients, lambda: anki.invoke("findCards", query=query))
+    assert all(r == results[0] for r in results), "clients saw different results"
+    anki.close()
+    return {"benchmark": "client_findCards", "coalesce": coalesce, "clients": clients,
+            "requests": len(server.calls) - before, "seconds": seconds}
+
+
+def bench_app(clients, latency):
+    import anki_server
+    app = anki_server.create_app(tempfile.mkdtemp(), "fake", start=True)
+    anki_server.anki_ready.wait(30)
+    while anki_server.prefetcher.pending():
+        time.sleep(0.05)  # let the startup prefetch settle so only our requests are counted
+    server = anki_server.backend.server
+    server.latency = latency
+    client = app.test_client()
+    # A deck the startup prefetch did not warm.
+    deck = min(d for d in anki_server.get_cached_decks() if d not in anki_server.deck_cache.entries)
+    rows = []
+    for name, path in (("app_deck_cards", f"/api/cards/{deck}"), ("app_home", "/")):
+        before = len(server.calls)
+        results, seconds = hammer(clients, lambda: client.get(path).get_data())
+        assert all(r == results[0] for r in results), f"{path}: clients saw different results"
+        rows.append({"benchmark": name, "clients": clients,
+                     "requests": len(server.calls) - before, "seconds": seconds})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds the fake AnkiConnect takes per request")
+    args = parser.parse_args(argv)
+
+    results = []
+    with FakeAnkiConnect(FakeCollection.generate(20, 200), latency=args.latency) as server:
+        for coalesce in (False, True):
+            results.append(bench_client(server, args.clients, coalesce))
+    results.extend(bench_app(args.clients, args.latency))
+    for row in results:
+        print(json.dumps(row))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Size and encoding time of /api/cards payloads on large decks.
+
+Compares the row (dict per card) and columnar shapes, json and orjson,
+and gzip/brotli compression (brotli only if installed). Run from the
+repository root:
+
+    python -m bench.bench_payload [--sizes 10000 100000] [--field-chars 200]
+"""
+import argparse
+import json
+import time
+
+import anki_payload
+from anki_cards import NoteStore, to_columns, to_dicts
+from bench.bench_cards import make_payload
+
+
+def stdlib_dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--cards-per-note", type=int, default=2)
+    parser.add_argument("--field-chars", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    encoders = [("json", stdlib_dumps)]
+    if anki_payload.orjson is not None:
+        encoders.append(("orjson", anki_payload.dumps))
+    results = []
+    for size in args.sizes:
+        cards = NoteStore().build(*make_payload(size, args.cards_per_note, args.field_chars))
+        for shape, to_shape in (("rows", to_dicts), ("columns", to_columns)):
+            for encoder, dumps in encoders:
+                seconds, body = best_time(lambda: dumps(to_shape(cards)), args.repeat)
+                for coding in [None] + anki_payload.encodings():
+                    compress_seconds, compressed = best_time(
+                        lambda: anki_payload.compress(body, coding), args.repeat)
+                    row = {"benchmark": "cards_payload", "cards": size, "shape": shape,
+                           "encoder": encoder, "coding": coding or "identity",
+                           "encode_seconds": seconds, "compress_seconds": compress_seconds,
+                           "bytes": len(compressed)}
+                    results.append(row)
+                    print(json.dumps(row))
+    return results
+
+
+if __name__ == "__main__":
+    main()
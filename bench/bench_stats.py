@@ -0,0 +1,73 @@
+"""Micro-benchmark for the stats aggregation used by the background refresh.
+
+Run from the repository root:
+
+    python -m bench.bench_stats [--sizes 10000 100000 500000] [--legacy]
+"""
+import argparse
+import json
+import random
+import time
+
+from anki_stats import aggregate_stats
+
+
+def make_payload(n_cards, n_decks=50, seed=0):
+    """Synthetic ``findCards``/``cardsInfo`` results for ``n_cards`` cards."""
+    rng = random.Random(seed)
+    decks = [f"Deck {i // 10}::Sub {i}" for i in range(n_decks)]
+    new_cards, review_cards, cards = [], [], []
+    for card_id in range(1_000_000, 1_000_000 + n_cards):
+        kind = rng.random()
+        if kind < 0.4:
+            new_cards.append(card_id)
+        else:
+            review_cards.append(card_id)
+        cards.append({"cardId": card_id, "deckName": rng.choice(decks)})
+    rng.shuffle(cards)
+    return cards, new_cards, review_cards
+
+
+def legacy_aggregate(cards, new_cards, review_cards):
+    stats = {}
+    for c in cards:
+        d = c["deckName"]
+        stats.setdefault(d, {"learn": 0, "review": 0})
+        if c["cardId"] in new_cards: stats[d]["learn"] += 1
+        if c["cardId"] in review_cards: stats[d]["review"] += 1
+    return (stats, len(new_cards), len(review_cards))
+
+
+def best_of(fn, args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--legacy", action="store_true",
+                        help="also time the old list-membership loop (quadratic, keep sizes small)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        payload = make_payload(size)
+        seconds, stats = best_of(aggregate_stats, payload, args.repeat)
+        row = {"benchmark": "aggregate_stats", "cards": size, "seconds": seconds}
+        if args.legacy:
+            legacy_seconds, legacy_stats = best_of(legacy_aggregate, payload, 1)
+            assert legacy_stats == stats
+            row["legacy_seconds"] = legacy_seconds
+        results.append(row)
+        print(json.dumps(row))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""End-to-end benchmark of the server against a generated collection.
+
+Run from the repository root:
+
+    python -m bench.run --decks 50 --cards 200 --latency 0.005 --out results.json
+    python -m bench.run --compare baseline.json results.json
+
+Starts the fake AnkiConnect, drives the app in-process (card loading, stats
+refresh, the deck index and the routes) and times cold starts of the
+server as a subprocess. Results are written as JSON (one entry per
+measurement, with median/p95/min in seconds) so runs from different
+commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from fake_ankiconnect import FakeAnkiConnect, FakeCollection
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(name, samples, **extra):
+    samples = sorted(samples)
+    return {
+        "name": name,
+        "n": len(samples),
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min": samples[0],
+        **extra,
+    }
+
+
+def timed(name, fn, repeat, setup=None, **extra):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(name, samples, **extra)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cold_start(anki_url, data_dir, timeout=60):
+    """Seconds from launching the headless server until ``/`` answers 200."""
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "anki_server.py"), "--headless", "--backend", "remote",
+         "--anki-url", anki_url, "--port", str(port), "--data-dir", data_dir],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=timeout) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("server did not come up")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    import anki_server
+    from anki_decks import DeckIndex
+
+    collection = FakeCollection.generate(args.decks, args.cards, depth=args.depth,
+                                         field_chars=args.field_chars)
+    data_dir = tempfile.mkdtemp(prefix="ankitypist-bench-")
+    results = []
+    with FakeAnkiConnect(collection, latency=args.latency) as server:
+        anki_server.ANKI_CONNECT_URL = server.url
+        anki_server.PREFETCH_DECKS = 0  # keep background loads out of the timings
+        app = anki_server.create_app(os.path.join(data_dir, "app"), "remote")
+        anki_server.connect_anki()
+        client = app.test_client()
+        decks = anki_server.get_cached_decks()
+        leaf = max(decks, key=lambda d: d.count("::"))
+        top = min(decks, key=lambda d: (d.count("::"), d))
+        repeat = args.repeat
+
+        def get(path, status=200):
+            r = client.get(path)
+            assert r.status_code == status, (path, r.status_code)
+            return r
+
+        def settle():
+            while anki_server.prefetcher.pending():
+                time.sleep(0.005)
+
+        for label, deck in (("leaf", leaf), ("top", top)):
+            results.append(timed(f"preload_deck[{label}]", lambda d=deck: anki_server.preload_deck(d),
+                                 repeat, deck=deck))
+
+        def full_refresh():
+            anki_server.stats_tracker.invalidate()
+            anki_server.refresh_stats()
+        results.append(timed("refresh_stats[full]", full_refresh, repeat))
+        results.append(timed("refresh_stats[delta]", anki_server.refresh_stats, repeat))
+
+        stats = anki_server.cache_data["stats"][0]
+        results.append(timed("deck_index[build]", lambda: DeckIndex(decks).set_stats(stats), repeat))
+        index = DeckIndex(decks)
+        index.set_stats(stats)
+        results.append(timed("deck_index[children]", lambda: [index.children(d) for d in decks], repeat,
+                             decks=len(decks)))
+
+        def clear_render():
+            anki_server.render_cache = (None, {})
+        results.append(timed("route[/][cold]", lambda: get("/"), repeat, setup=clear_render))
+        results.append(timed("route[/][warm]", lambda: get("/"), repeat))
+        results.append(timed("route[/deck][top]", lambda: get(f"/deck/{top}"), repeat, setup=clear_render))
+        results.append(timed("route[/deck][leaf]", lambda: get(f"/deck/{leaf}"), repeat, setup=clear_render))
+
+        def drop_leaf():
+            settle()
+            anki_server.deck_cache.invalidate(leaf)
+        results.append(timed("route[/api/cards][cold]", lambda: get(f"/api/cards/{leaf}"), repeat,
+                             setup=drop_leaf))
+        results.append(timed("route[/api/cards][warm]", lambda: get(f"/api/cards/{leaf}"), repeat))
+        results.append(timed("route[/api/cards][page,cold]",
+                             lambda: get(f"/api/cards/{leaf}?cursor=0&limit=50"), repeat, setup=drop_leaf))
+        settle()
+
+        card_ids = iter(collection.cards)
+        results.append(timed("route[/api/grade]", lambda: get(f"/api/grade/{next(card_ids)}/3"), repeat))
+
+        fresh = (os.path.join(data_dir, f"fresh{i}") for i in range(args.starts))
+        results.append(timed("cold_start[no snapshot]", lambda: cold_start(server.url, next(fresh)),
+                             args.starts))
+        # That left a snapshot behind in fresh0; later starts restore it.
+        warm = os.path.join(data_dir, "fresh0")
+        results.append(timed("cold_start[snapshot]", lambda: cold_start(server.url, warm), args.starts))
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def compare(base_path, new_path, threshold):
+    with open(base_path) as f:
+        base = {r["name"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    regressions = 0
+    print(f"{'benchmark':<34} {'base':>10} {'new':>10} {'change':>8}")
+    for r in new:
+        b = base.get(r["name"])
+        if b is None:
+            print(f"{r['name']:<34} {'-':>10} {r['median'] * 1000:9.2f}ms")
+            continue
+        change = (r["median"] - b["median"]) / b["median"] if b["median"] else 0.0
+        flag = " !" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"{r['name']:<34} {b['median'] * 1000:8.2f}ms {r['median'] * 1000:8.2f}ms {change:+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--decks", type=int, default=50, help="leaf decks")
+    parser.add_argument("--cards", type=int, default=200, help="cards per leaf deck")
+    parser.add_argument("--depth", type=int, default=None, help="deck nesting depth")
+    parser.add_argument("--field-chars", type=int, default=0, help="question length")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every AnkiConnect call")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--starts", type=int, default=3, help="cold starts to time")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="flag medians slower than the base by more than this fraction")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+
+    results = run(args)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "threshold")},
+        },
+        "results": results,
+    }
+    for r in results:
+        print(json.dumps(r))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""In-process stand-in for the AnkiConnect add-on.
+
+Serves a generated collection over the AnkiConnect JSON protocol so the
+client, the Flask routes and the benchmarks can run without Anki:
+
+    python fake_ankiconnect.py --port 8765 --decks 20 --cards 500
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CARD_NEW, CARD_LEARN, CARD_REVIEW, CARD_RELEARN = 0, 1, 2, 3
+
+_TERM_RE = re.compile(r'-?\w+:"[^"]*"|-?\w+:\S+|\S+')
+
+
+class FakeCollection:
+    def __init__(self):
+        self.decks = []
+        self.notes = {}
+        self.cards = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def generate(cls, decks=10, cards_per_deck=100, seed=0, depth=None, fanout=5, field_chars=0):
+        """A collection of ``decks`` leaf decks with ``cards_per_deck`` cards each.
+
+        Leaf decks sit ``depth`` levels deep (default: 2 when there are more
+        than 5 decks, else 1), ``fanout`` to a parent. Questions are padded to
+        ``field_chars`` characters.
+        """
+        rng = random.Random(seed)
+        col = cls()
+        created = int(time.time()) - 30 * 86400
+        note_id, card_id = 1_500_000_000_000, 1_600_000_000_000
+        if depth is None:
+            depth = 2 if decks > 5 else 1
+        filler = "lorem ipsum dolor sit amet " * (field_chars // 27 + 1)
+        for d in range(decks):
+            name = "::".join(
+                [f"Deck {d // fanout ** (depth - 1)}"]
+                + [f"Sub {d // fanout ** (depth - 1 - level)}" for level in range(1, depth)]
+            )
+            col.add_deck(name)
+            for i in range(cards_per_deck):
+                note_id += 1
+                question = f"Question {d}-{i}"
+                if len(question) < field_chars:
+                    question = f"{question} {filler}"[:field_chars]
+                col.notes[note_id] = {
+                    "noteId": note_id,
+                    "modelName": "Basic",
+                    "tags": [],
+                    "mod": created,
+                    "fields": {
+                        "Front": {"value": question, "order": 0},
+                        "Back": {"value": f"answer {d}-{i}", "order": 1},
+                    },
+                }
+                card_id += 1
+                kind = rng.random()
+                ctype = CARD_NEW if kind < 0.4 else CARD_REVIEW if kind < 0.9 else CARD_LEARN
+                col.cards[card_id] = {
+                    "cardId": card_id,
+                    "note": note_id,
+                    "deckName": name,
+                    "modelName": "Basic",
+                    "ord": 0,
+                    "type": ctype,
+                    "queue": ctype,
+                    "due": ctype == CARD_NEW or rng.random() < 0.5,
+                    "mod": created,
+                    "added": created,
+                    "rated": None,
+                }
+        return col
+
+    def add_deck(self, name):
+        parts = name.split("::")
+        for depth in range(1, len(parts) + 1):
+            parent = "::".join(parts[:depth])
+            if parent not in self.decks:
+                self.decks.append(parent)
+
+    # ------------------- queries -------------------
+    def _matches(self, card, term):
+        negate = term.startswith("-")
+        term = term.lstrip("-")
+        key, _, value = term.partition(":")
+        value = value.strip('"')
+        if key == "deck":
+            deck = card["deckName"]
+            ok = value == "*" or deck == value or deck.startswith(value + "::")
+        elif term == "is:new":
+            ok = card["type"] == CARD_NEW
+        elif term == "is:review":
+            ok = card["type"] in (CARD_REVIEW, CARD_RELEARN)
+        elif term == "is:learn":
+            ok = card["type"] in (CARD_LEARN, CARD_RELEARN)
+        elif term == "is:due":
+            ok = card["due"] and card["type"] != CARD_NEW
+        elif key == "rated":
+            ok = card["rated"] is not None and card["rated"] >= time.time() - int(value) * 86400
+        elif key == "added":
+            ok = card["added"] >= time.time() - int(value) * 86400
+        elif key == "edited":
+            note = self.notes[card["note"]]
+            ok = note["mod"] >= time.time() - int(value) * 86400
+        elif key == "cid":
+            ok = str(card["cardId"]) in value.split(",")
+        else:
+            raise ValueError(f"unsupported search term: {term}")
+        return ok != negate
+
+    def search(self, query):
+        clauses = [_TERM_RE.findall(part) for part in re.split(r"\s+OR\s+", query.strip())]
+        with self.lock:
+            return [
+                cid for cid, card in self.cards.items()
+                if any(all(self._matches(card, t) for t in terms) for terms in clauses)
+            ]
+
+    # ------------------- actions -------------------
+    def version(self):
+        return 6
+
+    def getActiveProfile(self):
+        return "User 1"
+
+    def deckNames(self):
+        return list(self.decks)
+
+    def findCards(self, query):
+        return self.search(query)
+
+    def findNotes(self, query):
+        return list(dict.fromkeys(self.cards[cid]["note"] for cid in self.search(query)))
+
+    def cardsInfo(self, cards):
+        out = []
+        for cid in cards:
+            card = self.cards.get(cid)
+            if card is None:
+                continue
+            note = self.notes[card["note"]]
+            info = {k: v for k, v in card.items() if k not in ("due", "rated", "added")}
+            info["due"] = 0 if card["due"] else 1
+            info["fields"] = note["fields"]
+            info["fieldOrder"] = card["ord"]
+            out.append(info)
+        return out
+
+    def cardsModTime(self, cards):
+        return [{"cardId": cid, "mod": self.cards[cid]["mod"]} for cid in cards if cid in self.cards]
+
+    def notesInfo(self, notes):
+        out = []
+        for nid in notes:
+            note = self.notes.get(nid)
+            if note is None:
+                continue
+            info = dict(note)
+            info["cards"] = [cid for cid, c in self.cards.items() if c["note"] == nid]
+            out.append(info)
+        return out
+
+    def answerCards(self, answers):
+        results = []
+        now = int(time.time())
+        with self.lock:
+            for a in answers:
+                card = self.cards.get(a["cardId"])
+                if card is None:
+                    results.append(False)
+                    continue
+                ease = a["ease"]
+                if card["type"] == CARD_NEW:
+                    card["type"] = CARD_REVIEW if ease == 4 else CARD_LEARN
+                elif card["type"] == CARD_REVIEW and ease == 1:
+                    card["type"] = CARD_RELEARN
+                elif card["type"] in (CARD_LEARN, CARD_RELEARN) and ease >= 3:
+                    card["type"] = CARD_REVIEW
+                card["queue"] = card["type"]
+                card["due"] = False
+                card["mod"] = now
+                card["rated"] = now
+                results.append(True)
+        return results
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # stress clients connect all at once
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+
+    def process_request_thread(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self.connections_lock:
+                self.connections.discard(request)
+
+    def handle_error(self, request, client_address):
+        # Stress clients hang up mid-request; don't print their tracebacks
+        # into the benchmark output.
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def close_connections(self):
+        """Drop open keep-alive connections, as Anki exiting would."""
+        with self.connections_lock:
+            connections = list(self.connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class FakeAnkiConnect:
+    """Threaded HTTP server speaking the AnkiConnect protocol."""
+
+    def __init__(self, collection=None, host="127.0.0.1", port=0, latency=0.0):
+        self.collection = collection or FakeCollection.generate()
+        self.latency = latency
+        self.calls = []
+        self.httpd = _Server((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def dispatch(self, request):
+        action = request.get("action")
+        params = request.get("params") or {}
+        self.calls.append(action)
+        try:
+            if not action or action.startswith("_"):
+                raise ValueError(f"unsupported action: {action}")
+            if action == "multi":
+                result = [self.dispatch(a) for a in params["actions"]]
+            else:
+                result = getattr(self.collection, action)(**params)
+            return {"result": result, "error": None}
+        except Exception as e:
+            return {"result": None, "error": f"{type(e).__name__}: {e}"}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, every
+            # keep-alive reply waits out the client's delayed ACK (~40 ms).
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if server.latency:
+                    time.sleep(server.latency)
+                reply = json.dumps(server.dispatch(json.loads(body or b"{}"))).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                try:
+                    self.wfile.write(reply)
+                except ConnectionError:
+                    self.close_connection = True  # the client cancelled the call
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd.close_connections()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a generated collection over AnkiConnect.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--decks", type=int, default=10)
+    parser.add_argument("--cards", type=int, default=100, help="cards per deck")
+    parser.add_argument("--depth", type=int, default=None, help="deck nesting depth")
+    parser.add_argument("--field-chars", type=int, default=0, help="question length")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args(argv)
+
+    collection = FakeCollection.generate(args.decks, args.cards, depth=args.depth,
+                                         field_chars=args.field_chars)
+    server = FakeAnkiConnect(collection, args.host, args.port, args.latency)
+    print(f"Fake AnkiConnect listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+const DECK = document.body.dataset.deck;
+const PAGE_SIZE = 50;
+// Identifies this page to the server so leaving it only cancels its own loads.
+const VIEW = Math.random().toString(36).slice(2);
+let cards=[], total=0, currentIndex=0, currentCard=null, pendingPages=null;
+// Set while the server can't reach Anki (or is still starting it) and serves saved cards.
+let offline=false;
+const ANKI_POLL = 5000;
+// Keystrokes of the card on screen ("\b" for Backspace) and the ms before each;
+// finished attempts wait in `attempts` and are uploaded in batches, off the Enter path.
+const TYPING_BATCH = 20, TYPING_INTERVAL = 15000;
+let keys="", keyTimes=[], lastKeyAt=0, attempts=[];
+
+async function fetchPage(cursor){
+    const res = await fetch(`/api/cards/${encodeURIComponent(DECK)}?cursor=${cursor}&limit=${PAGE_SIZE}&format=columns&view=${VIEW}`);
+    const page = await res.json();
+    const cols = page.cards;
+    cols.card_id.forEach((card_id, i) => cards.push({card_id, question: cols.question[i], answer: cols.answer[i]}));
+    total = Math.max(page.total, cards.length);
+    offline = page.offline;
+    return page.next;
+}
+
+async function loadCards(){
+    let next = await fetchPage(0);
+    loadNextCard();
+    // Start on the first page; pull the rest of the deck in the background.
+    pendingPages = (async () => {
+        while(next !== null) next = await fetchPage(next);
+    })().catch(() => {}).finally(() => {
+        total = cards.length;
+        pendingPages = null;
+        updateProgress();
+    });
+}
+
+function updateProgress(){
+    document.getElementById("progress-bar").style.width = ((currentIndex/total)*100)+"%";
+}
+
+function loadNextCard(){
+    if(currentIndex >= cards.length && pendingPages){
+        document.getElementById("question").textContent = "Loading...";
+        pendingPages.then(loadNextCard);
+        return;
+    }
+    if(currentIndex >= cards.length && offline){
+        // Out of saved cards is not the end of the deck: wait for Anki and reload.
+        document.getElementById("question").textContent = "Anki is unreachable";
+        document.getElementById("answer").style.display="none";
+        document.getElementById("grade-buttons").style.display="none";
+        document.getElementById("feedback").textContent = "Cards will load when it is back...";
+        setTimeout(waitForAnki, ANKI_POLL);
+        return;
+    }
+    if(currentIndex >= cards.length){
+        document.getElementById("question").textContent = "Finished all cards!";
+        document.getElementById("answer").style.display="none";
+        document.getElementById("grade-buttons").style.display="none";
+        document.getElementById("feedback").textContent = "Redirecting to main deck list...";
+        setTimeout(() => {
+            window.location.href = "/";
+        }, 1000); // wait 2 seconds before redirect
+        return;
+    }
+
+    currentCard = cards[currentIndex];
+    document.getElementById("question").textContent = currentCard.question;
+    document.getElementById("answer").value = "";
+    document.getElementById("answer").style.display = "inline-block";
+    document.getElementById("grade-buttons").style.display="none";
+    document.getElementById("feedback").textContent = "";
+    document.getElementById("answer").focus();
+    keys = ""; keyTimes = []; lastKeyAt = performance.now();
+    updateProgress();
+}
+
+async function waitForAnki(){
+    let up = false;
+    try {
+        up = (await (await fetch("/api/anki")).json()).state === "up";
+    } catch(e) {}
+    if(!up){
+        setTimeout(waitForAnki, ANKI_POLL);
+        return;
+    }
+    // Grades given meanwhile are dropped by the server, so start over from the top.
+    cards = []; total = 0; currentIndex = 0; offline = false;
+    loadCards();
+}
+
+function endAttempt(card){
+    if(!keys) return;
+    // The answer goes along: the card is graded, and gone from the server's cache, by upload time.
+    attempts.push({card: card.card_id, keys, dt: keyTimes, at: Date.now(), answer: card.answer});
+    keys = ""; keyTimes = [];
+    if(attempts.length >= TYPING_BATCH) setTimeout(uploadAttempts, 0);
+}
+
+function uploadAttempts(beacon){
+    if(!attempts.length) return;
+    const body = JSON.stringify({deck: DECK, attempts});
+    attempts = [];
+    if(beacon){
+        navigator.sendBeacon("/api/typing/events", new Blob([body], {type: "application/json"}));
+    } else {
+        fetch("/api/typing/events", {method: "POST", headers: {"Content-Type": "application/json"},
+                                     body, keepalive: true}).catch(() => {});
+    }
+}
+
+
+async function checkAnswer(){
+    const typed = document.getElementById("answer").value;
+    if(!typed.trim()) return;
+    const card = currentCard;
+    endAttempt(card);
+    const res = await fetch("/api/check", {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({card_id: card.card_id, answer: typed, deck: DECK})
+    });
+    const result = await res.json();
+    if(card !== currentCard) return;
+    const feedback = document.getElementById("feedback");
+    if(!result.ok){
+        feedback.innerHTML = "<span class='wrong'></span>";
+        feedback.firstChild.textContent = "Could not check answer: " + result.error;
+        document.getElementById("grade-buttons").style.display="flex";
+    } else if(result.correct){
+        feedback.innerHTML = "<span class='correct'></span>";
+        feedback.firstChild.textContent = result.quality === "exact" ? "Correct!" : "Almost: " + card.answer;
+        gradeCard(result.ease);
+    } else {
+        feedback.innerHTML = "<span class='wrong'></span>";
+        feedback.firstChild.textContent = "Wrong. Correct: " + card.answer;
+        document.getElementById("grade-buttons").style.display="flex";
+    }
+}
+
+function gradeCard(ease){
+    fetch(`/api/grade/${currentCard.card_id}/${ease}`);
+    currentIndex++;
+    loadNextCard();
+}
+
+document.getElementById("answer").addEventListener("keyup", e => {
+    if(e.key==="Enter") checkAnswer();
+});
+
+document.getElementById("answer").addEventListener("keydown", e => {
+    if(document.getElementById("grade-buttons").style.display==="flex"){
+        if(["1","2","3","4"].includes(e.key)){
+            e.preventDefault();
+            gradeCard(parseInt(e.key));
+        }
+    } else if((e.key.length === 1 && !e.ctrlKey && !e.metaKey || e.key === "Backspace") && !e.isComposing){
+        keys += e.key === "Backspace" ? "\b" : e.key;
+        keyTimes.push(Math.round(e.timeStamp - lastKeyAt));
+        lastKeyAt = e.timeStamp;
+    }
+});
+
+setInterval(uploadAttempts, TYPING_INTERVAL);
+
+// Leaving: send the attempts still buffered and, mid-load, tell the server
+// to stop fetching this deck from Anki.
+window.addEventListener("pagehide", () => {
+    uploadAttempts(true);
+    if(pendingPages || !cards.length){
+        navigator.sendBeacon(`/api/cancel/${encodeURIComponent(DECK)}?view=${VIEW}`);
+    }
+});
+
+loadCards();
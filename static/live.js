@@ -0,0 +1,50 @@
+// Keeps the deck counts on this page current via /api/events.
+(() => {
+    if(!window.EventSource) return;
+    const rows = {};
+    document.querySelectorAll("[data-deck]").forEach(el => { rows[el.dataset.deck] = el; });
+    let source = null;
+    let retryTimer = null;
+    let retryDelay = 1000;
+
+    function onStats(e){
+        const update = JSON.parse(e.data);
+        for(const [deck, counts] of Object.entries(update.decks)){
+            const row = rows[deck];
+            if(!row) continue;
+            row.querySelector("[data-count=learn]").textContent = counts.learn;
+            row.querySelector("[data-count=review]").textContent = counts.review;
+        }
+    }
+
+    function connect(){
+        clearTimeout(retryTimer);
+        retryTimer = null;
+        // The server opens every stream with the current counts.
+        source = new EventSource("/api/events");
+        source.addEventListener("open", () => { retryDelay = 1000; });
+        source.addEventListener("stats", onStats);
+        // Decks were added, renamed or removed: the rendered list is stale.
+        source.addEventListener("decks", () => window.location.reload());
+        // EventSource retries dropped streams itself, but gives up for good on
+        // an error response; try again later, backing off up to a minute.
+        source.addEventListener("error", () => {
+            if(source.readyState !== EventSource.CLOSED || document.hidden) return;
+            retryTimer = setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 60000);
+        });
+    }
+
+    // Don't hold a server thread for a page nobody is looking at.
+    document.addEventListener("visibilitychange", () => {
+        if(document.hidden){
+            clearTimeout(retryTimer);
+            retryTimer = null;
+            source.close();
+        } else {
+            connect();
+        }
+    });
+
+    connect();
+})();
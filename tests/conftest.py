@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from anki_connect import AnkiConnect
+from fake_ankiconnect import FakeAnkiConnect, FakeCollection
+
+
+@pytest.fixture
+def fake():
+    with FakeAnkiConnect(FakeCollection.generate(5, 40)) as server:
+        yield server
+
+
+@pytest.fixture
+def anki(fake):
+    client = AnkiConnect(fake.url, pool_size=32, timeout=10)
+    yield client
+    client.close()
+
+
+def wait_for(condition, timeout=5.0, interval=0.01):
+    """Poll ``condition`` until it is true; False if it never was within ``timeout``."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def hammer(clients, fn):
+    """Call ``fn`` from ``clients`` threads released at once; returns their results."""
+    barrier = threading.Barrier(clients)
+    results = [None] * clients
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """The app, created once against its bundled fake AnkiConnect (the server keeps module state)."""
+    import anki_server
+    app = anki_server.create_app(str(tmp_path_factory.mktemp("data")), "fake", start=True)
+    assert anki_server.anki_ready.wait(15)
+    return app
+
+
+@pytest.fixture(scope="session")
+def server(app):
+    import anki_server
+    return anki_server
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def busiest_deck(s):
+    """The leaf deck with the most due cards."""
+    leaves = [d for d in s.get_cached_decks() if not any(o.startswith(d + "::") for o in s.deck_list_cache)]
+    return max(leaves, key=lambda d: len(s.anki.invoke("findCards", query=s.due_query(d))))
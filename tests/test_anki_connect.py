@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+from anki_connect import AnkiConnect, AnkiConnectCancelled, AnkiConnectUnavailable
+from conftest import hammer, wait_for
+
+QUERY = 'deck:"Deck 0" is:due'
+
+
+def test_concurrent_identical_reads_share_one_request(fake, anki):
+    fake.latency = 0.2
+    results = hammer(16, lambda: anki.invoke("findCards", query=QUERY))
+    assert fake.calls.count("findCards") == 1
+    assert all(r == results[0] for r in results) and results[0]
+
+
+def test_coalescing_can_be_turned_off(fake):
+    fake.latency = 0.1
+    anki = AnkiConnect(fake.url, pool_size=16, coalesce=False)
+    try:
+        hammer(8, lambda: anki.invoke("findCards", query=QUERY))
+    finally:
+        anki.close()
+    assert fake.calls.count("findCards") == 8
+
+
+def test_writes_are_never_coalesced(fake, anki):
+    fake.latency = 0.1
+    card_id = next(iter(fake.collection.cards))
+    hammer(4, lambda: anki.invoke("answerCards", answers=[{"cardId": card_id, "ease": 3}]))
+    assert fake.calls.count("answerCards") == 4
+
+
+def test_large_id_lists_are_chunked_in_order(fake):
+    anki = AnkiConnect(fake.url, chunk_size=10, max_inflight=4)
+    try:
+        ids = list(fake.collection.cards)[:40]
+        infos = anki.invoke("cardsInfo", cards=ids)
+    finally:
+        anki.close()
+    assert [c["cardId"] for c in infos] == ids
+    assert fake.calls.count("cardsInfo") == 4
+
+
+def _start_in_group(anki, key, outcome):
+    def run():
+        try:
+            with anki.group(key):
+                outcome[key] = anki.invoke("findCards", query=QUERY)
+        except AnkiConnectCancelled as e:
+            outcome[key] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _flight(anki):
+    flights = list(anki.aio.flights.values())
+    return flights[0] if flights else None
+
+
+def test_cancelling_one_caller_keeps_the_shared_flight(fake, anki):
+    fake.latency = 0.5
+    outcome = {}
+    threads = [_start_in_group(anki, key, outcome) for key in ("a", "b")]
+    assert wait_for(lambda: _flight(anki) is not None and _flight(anki)[1] == 2)
+    task = _flight(anki)[0]
+    assert anki.cancel("a") == 1
+    for t in threads:
+        t.join(5)
+    assert isinstance(outcome["a"], AnkiConnectCancelled)
+    assert isinstance(outcome["b"], list) and outcome["b"]
+    assert not task.cancelled()
+    assert fake.calls.count("findCards") == 1
+
+
+def test_cancelling_the_last_caller_cancels_the_flight(fake, anki):
+    fake.latency = 0.5
+    outcome = {}
+    threads = [_start_in_group(anki, key, outcome) for key in ("a", "b")]
+    assert wait_for(lambda: _flight(anki) is not None and _flight(anki)[1] == 2)
+    task = _flight(anki)[0]
+    anki.cancel("a")
+    assert wait_for(lambda: _flight(anki) is not None and _flight(anki)[1] == 1)
+    assert not task.done()
+    anki.cancel("b")
+    for t in threads:
+        t.join(5)
+    assert all(isinstance(outcome[k], AnkiConnectCancelled) for k in ("a", "b"))
+    assert wait_for(task.cancelled)
+    assert not anki.aio.flights
+
+
+def test_unreachable_anki_raises_and_reports(fake):
+    url = fake.url
+    fake.stop()
+    anki = AnkiConnect(url, timeout=2)
+    reported = []
+    anki.on_unavailable = reported.append
+    try:
+        with pytest.raises(AnkiConnectUnavailable):
+            anki.invoke("version")
+    finally:
+        anki.close()
+    assert len(reported) == 1
@@ -0,0 +1,59 @@
+import time
+
+from anki_cache import DeckCache
+from anki_cards import Note
+
+
+def _cards(*ids):
+    return [(i, Note(i, f"q{i}", f"a{i}")) for i in ids]
+
+
+def test_graded_card_leaves_every_deck_listing_it():
+    cache = DeckCache()
+    cache.put("Parent", _cards(1, 2, 3))
+    cache.put("Parent::Child", _cards(2, 3))
+    assert cache.remove_card(2) == {"Parent", "Parent::Child"}
+    assert [c for c, _ in cache.get("Parent")] == [1, 3]
+    assert [c for c, _ in cache.get("Parent::Child")] == [3]
+
+
+def test_card_removed_before_its_page_loads_never_arrives():
+    cache = DeckCache()
+    entry = cache.begin("Deck", [1, 2, 3, 4])
+    cache.remove_card(3)
+    cache.add_page("Deck", entry, [1, 2, 3, 4], _cards(1, 2, 3, 4))
+    assert [c for c, _ in cache.get("Deck")] == [1, 2, 4]
+
+
+def test_version_changes_with_every_load_and_removal():
+    cache = DeckCache()
+    entry = cache.begin("Deck", [1, 2])
+    seen = {entry.version}
+    cache.add_page("Deck", entry, [1], _cards(1))
+    seen.add(entry.version)
+    cache.remove_card(1)
+    seen.add(entry.version)
+    cache.remove_card(99)  # not in the deck: nothing changed
+    assert entry.version in seen and len(seen) == 3
+    assert cache.version("Deck") is None  # partly loaded: not served as it is
+    cache.add_page("Deck", entry, [2], _cards(2))
+    assert cache.version("Deck") == entry.version not in seen
+    assert cache.put("Deck", _cards(2)) and cache.version("Deck") != entry.version
+
+
+def test_expired_entry_has_no_version():
+    cache = DeckCache(ttl=0.05)
+    cache.put("Deck", _cards(1))
+    assert cache.version("Deck") is not None
+    time.sleep(0.1)
+    assert cache.version("Deck") is None
+    assert cache.entry("Deck", expire=False) is not None
+
+
+def test_expired_entries_are_kept_for_offline_use():
+    cache = DeckCache(ttl=0.05)
+    cache.put("Deck", _cards(1))
+    time.sleep(0.1)
+    assert cache.entry("Deck", expire=False) is not None
+    assert cache.get("Deck") is None  # expired: dropped on a normal lookup
+    assert cache.entry("Deck", expire=False) is None
@@ -0,0 +1,52 @@
+from anki_decks import DeckIndex
+
+DECKS = ["Default", "Lang", "Lang::Go", "Lang::Rust", "Lang::Rust::Cargo"]
+STATS = {"Default": {"learn": 1, "review": 0}, "Lang::Go": {"learn": 2, "review": 3},
+         "Lang::Rust": {"learn": 0, "review": 1}, "Lang::Rust::Cargo": {"learn": 4, "review": 5}}
+
+
+def _index():
+    index = DeckIndex(DECKS)
+    index.set_stats(STATS)
+    return index
+
+
+def test_counts_roll_up_to_every_ancestor():
+    index = _index()
+    assert index.totals("Lang") == {"learn": 6, "review": 9}
+    assert index.totals("Lang::Rust") == {"learn": 4, "review": 6}
+    assert index.totals("Missing") == {"learn": 0, "review": 0}
+    assert index.all_totals()["Lang::Go"] == (2, 3)
+
+
+def test_children_are_direct_subdecks_only():
+    index = _index()
+    assert [c["full"] for c in index.children()] == ["Default", "Lang"]
+    assert index.children("Lang") == [
+        {"full": "Lang::Go", "name": "Go", "learn": 2, "review": 3},
+        {"full": "Lang::Rust", "name": "Rust", "learn": 4, "review": 6},
+    ]
+    assert index.children("Missing") == []
+
+
+def test_adjust_walks_the_ancestors():
+    index = _index()
+    index.adjust("Lang::Rust::Cargo", -1, 1)
+    assert index.totals("Lang::Rust::Cargo") == {"learn": 3, "review": 6}
+    assert index.totals("Lang") == {"learn": 5, "review": 10}
+    assert index.totals("Default") == {"learn": 1, "review": 0}
+
+
+def test_removed_decks_take_their_counts_with_them():
+    index = _index()
+    index.update(["Default", "Lang", "Lang::Go"])
+    assert index.totals("Lang") == {"learn": 2, "review": 3}
+    assert [c["full"] for c in index.children("Lang")] == ["Lang::Go"]
+    assert "Lang::Rust" not in index.all_totals()
+
+
+def test_stats_for_an_unlisted_deck_create_its_parents():
+    index = DeckIndex()
+    index.set_stats({"A::B": {"learn": 1, "review": 2}})
+    assert index.totals("A") == {"learn": 1, "review": 2}
+    assert [c["full"] for c in index.children()] == ["A"]
@@ -0,0 +1,37 @@
+from anki_events import EventBus
+
+
+def test_a_new_stream_past_the_limit_ends_the_oldest():
+    bus = EventBus(max_clients=2)
+    first, second = bus.subscribe(), bus.subscribe()
+    streams = [bus.stream(q, keepalive=0.01) for q in (first, second)]
+    for stream in streams:
+        next(stream)  # the retry line; the generators are now subscribed
+
+    third = bus.subscribe()
+    assert third is not None
+    assert bus.subscribers() == 2
+    assert list(streams[0]) == []  # ended, and unsubscribed on the way out
+    assert bus.subscribers() == 2
+
+    bus.publish("stats", {"decks": {}})
+    assert third.get_nowait()[1] == "stats"
+    assert second.get_nowait()[1] == "stats"
+
+
+def test_slow_subscriber_loses_oldest_events():
+    bus = EventBus(max_queue=2)
+    q = bus.subscribe()
+    for n in range(5):
+        bus.publish("stats", n)
+    assert [q.get_nowait()[2] for _ in range(2)] == ["3", "4"]
+
+
+def test_close_ends_every_stream():
+    bus = EventBus()
+    streams = [bus.stream(bus.subscribe(), keepalive=0.01) for _ in range(3)]
+    for stream in streams:
+        next(stream)
+    bus.close()
+    assert all(list(stream) == [] for stream in streams)
+    assert bus.subscribers() == 0
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from anki_cards import NoteStore
+from anki_fields import cloze, compile_plan, load_field_map, strip_html
+
+
+def _fields(**values):
+    return {name: {"value": value, "order": i} for i, (name, value) in enumerate(values.items())}
+
+
+def _note(note_id, model, fields):
+    return {"noteId": note_id, "modelName": model, "fields": fields}
+
+
+def _card(card_id, note_id, ord=0):
+    return {"cardId": card_id, "note": note_id, "ord": ord}
+
+
+def test_strip_html():
+    assert strip_html("git <b>status</b>") == "git status"
+    assert strip_html("<div>one<br>two</div><div>three</div>") == "one\ntwo\nthree"
+    assert strip_html("a &amp;&amp; b&nbsp;c[sound:x.mp3]<script>x()</script>") == "a && b c"
+    assert strip_html("plain text") == "plain text"
+
+
+def test_cloze_asks_one_deletion_at_a_time():
+    text = "{{c1::git}} {{c2::commit::verb}} -m"
+    assert cloze(text, 1) == ("[...] commit -m", "git")
+    assert cloze(text, 2) == ("git [verb] -m", "commit")
+
+
+@pytest.mark.parametrize("rule, expected", [
+    ({}, ("Front", "Back")),                                   # first and last field
+    ({"question": "Extra", "answer": "Front"}, ("Extra", "Front")),
+    ({"question": 1, "answer": -2}, ("Extra", "Extra")),
+    ({"question": "Missing", "answer": 7}, ("Front", "Back")),  # unknown: the defaults
+])
+def test_fields_resolve_by_name_or_position(rule, expected):
+    plan = compile_plan({"Basic": rule}, "Basic", _fields(Front="q", Extra="e", Back="a"))
+    assert (plan.question, plan.answer) == expected
+
+
+def test_model_rule_overrides_the_wildcard():
+    field_map = {"*": {"strip_html": True, "answer": "Front"}, "Basic": {"answer": "Back"}}
+    plan = compile_plan(field_map, "Basic", _fields(Front="q", Back="a"))
+    assert (plan.answer, plan.strip) == ("Back", True)
+
+
+def test_plan_is_recompiled_when_a_note_type_changes_its_fields():
+    store = NoteStore({"Basic": {"question": "Front", "answer": "Back"}})
+    cards = store.build([_card(1, 10)], [_note(10, "Basic", _fields(Front="q1", Back="a1"))])
+    assert (cards[0][1].question, cards[0][1].answer) == ("q1", "a1")
+    # The note type was edited: "Front" renamed, so the cached plan no longer fits.
+    cards = store.build([_card(2, 20)], [_note(20, "Basic", _fields(Prompt="q2", Back="a2"))])
+    assert (cards[0][1].question, cards[0][1].answer) == ("q2", "a2")
+
+
+def test_cloze_cards_of_one_note_get_their_own_deletion():
+    store = NoteStore({"Cloze": {"question": "Text", "cloze": True, "strip_html": True}})
+    fields = _fields(Text="<b>{{c1::ls}}</b> {{c2::-la}}", Extra="")
+    cards = store.build([_card(1, 10, 0), _card(2, 10, 1)], [_note(10, "Cloze", fields)])
+    assert [(n.question, n.answer) for _, n in cards] == [("[...] -la", "ls"), ("ls [...]", "-la")]
+
+
+@pytest.mark.parametrize("rule", [{"answer": None}, {"answer": 1.5}, {"question": True}, {"question": [0]}])
+def test_invalid_field_references_are_rejected_on_load(tmp_path, rule):
+    path = tmp_path / "fields.json"
+    path.write_text(json.dumps({"Basic": rule}))
+    assert load_field_map(str(path)) == {}
+
+
+def test_valid_field_map_is_loaded(tmp_path):
+    field_map = {"*": {"strip_html": True}, "Basic": {"question": "Front", "answer": -1}}
+    path = tmp_path / "fields.json"
+    path.write_text(json.dumps(field_map))
+    assert load_field_map(str(path)) == field_map
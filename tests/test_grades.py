@@ -0,0 +1,63 @@
+import time
+
+from anki_connect import AnkiConnect
+from anki_grades import GradeQueue
+from conftest import wait_for
+
+
+def _cards(fake, n):
+    return list(fake.collection.cards)[:n]
+
+
+def test_grades_journaled_while_anki_is_down_are_replayed(fake, anki, tmp_path):
+    journal = str(tmp_path / "grades.jsonl")
+    offline = AnkiConnect("http://127.0.0.1:9", timeout=1)  # nothing listens there
+    queue = GradeQueue(offline, journal)
+    card_ids = _cards(fake, 3)
+    for card_id in card_ids:
+        queue.submit(card_id, 3)
+    offline.close()
+
+    replay = GradeQueue(anki, journal).start()
+    try:
+        assert replay.replaying
+        assert wait_for(lambda: replay.status()["pending"] == 0)
+    finally:
+        replay.stop()
+    assert replay.status()["submitted"] == 3
+    assert fake.calls.count("answerCards") == 1  # one batch
+    assert all(fake.collection.cards[c]["rated"] for c in card_ids)
+    assert open(journal).read() == ""
+
+
+def test_replay_skips_cards_reviewed_since(fake, anki, tmp_path):
+    journal = str(tmp_path / "grades.jsonl")
+    queue = GradeQueue(anki, journal)  # not started: grades stay in the journal
+    first, second = _cards(fake, 2)
+    queue.submit(first, 3)
+    queue.submit(second, 3)
+    fake.collection.cards[second]["mod"] = int(time.time()) + 5  # reviewed elsewhere
+
+    replay = GradeQueue(anki, journal).start()
+    try:
+        assert wait_for(lambda: replay.status()["pending"] == 0)
+    finally:
+        replay.stop()
+    status = replay.status()
+    assert (status["submitted"], status["conflicts"]) == (1, 1)
+    assert [g["cardId"] for g in status["recent_conflicts"]] == [second]
+    assert fake.collection.cards[first]["rated"] and not fake.collection.cards[second]["rated"]
+    # Settled: a third start has nothing left to replay.
+    assert GradeQueue(anki, journal).status()["pending"] == 0
+
+
+def test_live_grades_go_out_in_batches(fake, anki, tmp_path):
+    queue = GradeQueue(anki, str(tmp_path / "grades.jsonl"), linger=0.2).start()
+    try:
+        for card_id in _cards(fake, 5):
+            queue.submit(card_id, 3)
+        assert wait_for(lambda: queue.status()["submitted"] == 5)
+    finally:
+        queue.stop()
+    assert fake.calls.count("answerCards") == 1
+    assert "cardsModTime" not in fake.calls  # only waiting grades are checked for conflicts
@@ -0,0 +1,106 @@
+from urllib.parse import quote
+
+import pytest
+
+from anki_match import Matcher, bounded_distance, summarize, token_diff
+from conftest import busiest_deck
+
+
+@pytest.mark.parametrize("a, b, limit, expected", [
+    ("abc", "abc", 0, 0),
+    ("kitten", "sitting", 3, 3),
+    ("kitten", "sitting", 2, 3),  # over the limit: limit + 1
+    ("git status", "git stauts", 2, 2),
+    ("", "ab", 1, 2),             # lengths alone are too far apart
+    ("abc", "", 5, 3),
+])
+def test_bounded_distance(a, b, limit, expected):
+    assert bounded_distance(a, b, limit) == expected
+
+
+def test_token_ratio():
+    ops, ratio = token_diff("a b c d e".split(), "a b c d x".split())
+    assert ratio == pytest.approx(0.8)
+    assert ops[-1] == {"op": "replace", "expected": ["e"], "typed": ["x"]}
+
+
+@pytest.mark.parametrize("mode, typed, quality", [
+    ("exact", "ls -la", "exact"),
+    ("exact", " ls -la", "wrong"),
+    ("case", " ls -la\n", "exact"),
+    ("case", "LS -la", "wrong"),
+    ("ignore_case", "LS -LA", "exact"),
+    ("whitespace", "ls    -la", "exact"),
+    ("edit", "ls -l", "close"),
+    ("edit", "ls -al", "wrong"),      # two typos in a six-character answer is one too many
+    ("tokens", "ls -la -h", "close"),
+    ("tokens", "ls", "wrong"),
+])
+def test_modes(mode, typed, quality):
+    assert Matcher().check(typed, "ls -la", mode=mode)["quality"] == quality
+
+
+def test_short_answers_get_no_typos_in_edit_mode():
+    assert Matcher("edit").check("sl", "ls")["quality"] == "wrong"
+
+
+def test_quality_maps_to_an_ease():
+    matcher = Matcher("edit", eases={"close": 3})
+    assert matcher.check("git status", "git status")["ease"] == 3
+    assert matcher.check("git stauts", "git status")["ease"] == 3
+    assert matcher.check("rm -rf /", "git status")["ease"] == 1
+    assert Matcher("edit").check("git stauts", "git status")["ease"] == 2
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Matcher("fuzzy")
+    with pytest.raises(ValueError):
+        Matcher().check("a", "a", mode="fuzzy")
+
+
+def test_summary_skips_errors():
+    matcher = Matcher()
+    results = [matcher.check("a", "a"), matcher.check("b", "a"), {"error": "unknown card"}]
+    assert summarize(results) == {"exact": 1, "close": 0, "wrong": 1, "checked": 2, "score": 0.5}
+
+
+def _card(server, client):
+    return client.get(f"/api/cards/{quote(busiest_deck(server))}").get_json()[0]
+
+
+def test_check_endpoint(server, client):
+    card = _card(server, client)
+    reply = client.post("/api/check", json={"card_id": card["card_id"], "answer": card["answer"]}).get_json()
+    assert reply["ok"] and reply["correct"] and reply["ease"] == 3
+    reply = client.post("/api/check", json={"card_id": card["card_id"], "answer": "nope"}).get_json()
+    assert reply["ok"] and not reply["correct"] and reply["ease"] == 1
+    assert client.post("/api/check", json={"card_id": 1, "answer": "x"}).status_code == 404
+    assert client.post("/api/check", json={"card_id": "1", "answer": "x"}).status_code == 400
+    reply = client.post("/api/check", json={"card_id": card["card_id"], "answer": "x", "mode": "fuzzy"})
+    assert reply.status_code == 400
+
+
+def test_check_batch_answers_bad_items_one_by_one(server, client):
+    card = _card(server, client)
+    items = [
+        {"card_id": card["card_id"], "answer": card["answer"]},
+        {"expected": "git status", "answer": "git stauts"},
+        {"card_id": [1], "answer": "x"},
+        {"expected": None, "answer": "x"},
+        {"card_id": 1, "answer": "x"},
+        {"card_id": card["card_id"]},
+        "junk",
+    ]
+    reply = client.post("/api/check/batch", json={"mode": "edit", "items": items})
+    assert reply.status_code == 200
+    results = reply.get_json()["results"]
+    assert results[0]["quality"] == "exact" and results[1]["quality"] == "close"
+    assert [r["error"] for r in results[2:]] == [
+        "card_id (int) or expected (str) is required",
+        "card_id (int) or expected (str) is required",
+        "unknown card",
+        "answer (str) is required",
+        "answer (str) is required",
+    ]
+    assert reply.get_json()["summary"]["checked"] == 2
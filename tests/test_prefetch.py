@@ -0,0 +1,43 @@
+import threading
+
+from anki_prefetch import Prefetcher
+from conftest import hammer
+
+
+def test_concurrent_runs_of_a_key_share_one_load():
+    prefetcher = Prefetcher()
+    calls = []
+    release = threading.Event()
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "cards"
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    assert hammer(8, lambda: prefetcher.run("deck", load)) == ["cards"] * 8
+    assert len(calls) == 1 and prefetcher.pending() == 0
+
+
+def test_a_request_takes_over_a_queued_load():
+    prefetcher = Prefetcher(workers=1)
+    release = threading.Event()
+    prefetcher.submit("slow", lambda: release.wait(5))
+    assert prefetcher.submit("deck", lambda: "from the pool")
+    assert not prefetcher.submit("deck", lambda: "again")  # already in flight
+    assert prefetcher.run("deck", lambda: "from the request") == "from the request"
+    release.set()
+    prefetcher.shutdown()
+
+
+def test_shutdown_drops_queued_loads():
+    prefetcher = Prefetcher(workers=1)
+    release, ran = threading.Event(), []
+    prefetcher.submit("running", lambda: release.wait(5))
+    prefetcher.submit("queued", lambda: ran.append("queued"))
+    prefetcher.shutdown()
+    assert not prefetcher.submit("late", lambda: ran.append("late"))
+    release.set()
+    prefetcher.executor.shutdown(wait=True)
+    assert ran == [] and prefetcher.pending() == 0
@@ -0,0 +1,133 @@
+import json
+from urllib.parse import quote
+
+from conftest import busiest_deck, hammer, wait_for
+from fake_ankiconnect import FakeAnkiConnect
+
+
+def _cards(client, deck, **args):
+    query = "&".join(f"{k}={v}" for k, v in args.items())
+    return client.get(f"/api/cards/{quote(deck)}?{query}").get_json()
+
+
+def test_concurrent_requests_for_a_cold_deck_load_it_once(server, client):
+    s = server
+    deck = busiest_deck(s)
+    assert wait_for(lambda: not s.prefetcher.pending())
+    s.deck_cache.invalidate(deck)
+    fake = s.backend.server
+    fake.latency = 0.05
+    before = fake.calls.count("notesInfo")  # only deck loads ask for notes
+    try:
+        results = hammer(16, lambda: client.get(f"/api/cards/{quote(deck)}").get_data())
+    finally:
+        fake.latency = 0
+    assert all(r == results[0] for r in results) and json.loads(results[0])
+    assert fake.calls.count("notesInfo") - before == 1
+
+
+def test_graded_card_is_not_served_again(server, client):
+    s = server
+    deck = busiest_deck(s)
+    cards = _cards(client, deck)
+    card_id = cards[0]["card_id"]
+    assert client.get(f"/api/grade/{card_id}/3").get_json() == {"ok": True}
+    assert card_id not in {c["card_id"] for c in _cards(client, deck)}
+    page = _cards(client, deck, limit=500, format="columns")
+    assert card_id not in page["cards"]["card_id"]
+    assert wait_for(lambda: s.grade_queue.status()["pending"] == 0)
+
+
+def test_practice_continues_offline_and_grades_replay(server, client):
+    s = server
+    deck = busiest_deck(s)
+    online = _cards(client, deck)
+    s.flush_snapshot()
+    s.deck_cache.invalidate()  # nothing in memory: the deck has to come from the snapshot
+    collection, port = s.backend.server.collection, int(s.backend.url.rsplit(":", 1)[1])
+    submitted = s.grade_queue.status()["submitted"]
+    s.backend.stop()
+    try:
+        s.supervisor.report_failure("test: Anki stopped")
+        assert wait_for(lambda: not s.supervisor.is_up())
+        offline = _cards(client, deck)
+        assert [c["card_id"] for c in offline] == [c["card_id"] for c in online]
+        page = _cards(client, deck, limit=5)
+        assert page["offline"] and len(page["cards"]) == 5
+        # Nothing saved: the page must tell "unreachable" apart from "finished".
+        empty = _cards(client, "Not saved", limit=5)
+        assert empty["offline"] and empty["cards"] == [] and empty["next"] is None
+        graded = [c["card_id"] for c in offline[:2]]
+        for card_id in graded:
+            assert client.get(f"/api/grade/{card_id}/3").get_json() == {"ok": True}
+        assert not set(graded) & {c["card_id"] for c in _cards(client, deck)}
+        assert wait_for(lambda: s.grade_queue.status()["retries"] > 0)
+    finally:
+        s.backend.server = FakeAnkiConnect(collection, port=port).start()
+    assert wait_for(s.supervisor.is_up, timeout=15)
+    assert wait_for(lambda: s.grade_queue.status()["pending"] == 0, timeout=15)
+    assert s.grade_queue.status()["submitted"] == submitted + 2
+    assert all(collection.cards[c]["rated"] for c in graded)
+
+
+def test_attempt_uploaded_after_grading_is_checked_against_its_answer(server, client):
+    deck = busiest_deck(server)
+    card = _cards(client, deck)[0]
+    card_id, expected = card["card_id"], card["answer"]
+    assert client.get(f"/api/grade/{card_id}/3").get_json() == {"ok": True}
+    assert server.deck_cache.note(card_id, deck) is None  # what the page uploads later
+
+    keys = "#\b" + expected  # a typo at the start, corrected
+    attempt = {"card": card_id, "keys": keys, "dt": [100] * len(keys), "at": 0, "answer": expected}
+    reply = client.post("/api/typing/events", json={"deck": deck, "attempts": [attempt]}).get_json()
+    assert reply == {"ok": True, "accepted": 1, "rejected": 0}
+
+    stats = client.get(f"/api/typing/card/{card_id}").get_json()
+    assert stats["keystrokes"] == len(expected) + 1 and stats["errors"] == 1
+    assert stats["corrections"] == 1 and stats["accuracy"] < 1
+    assert stats["positions"] == [{"pos": 0, "errors": 1}]
+    confusions = client.get(f"/api/typing/deck/{quote(deck)}").get_json()["confusions"]
+    assert any(c["expected"] == expected[0] and c["typed"] == "#" for c in confusions)
+
+
+def test_reloaded_deck_is_not_answered_with_its_expired_tag(server, client, monkeypatch):
+    deck = busiest_deck(server)
+    assert wait_for(lambda: not server.prefetcher.pending())
+    url = f"/api/cards/{quote(deck)}"
+    client.get(url)  # loaded, if it wasn't: tagged from the next request on
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    card_id = first.get_json()[0]["card_id"]
+
+    monkeypatch.setattr(server.deck_cache, "ttl", 0)
+    server.backend.server.collection.answerCards([{"cardId": card_id, "ease": 3}])  # graded elsewhere
+    reloaded = client.get(url, headers={"If-None-Match": etag})
+    assert reloaded.status_code == 200
+    assert card_id not in {c["card_id"] for c in reloaded.get_json()}
+
+
+def test_page_limit_must_be_positive(server, client):
+    deck = busiest_deck(server)
+    for limit in ("-5", "0", "many"):
+        reply = client.get(f"/api/cards/{quote(deck)}?limit={limit}&cursor=3")
+        assert reply.status_code == 400 and not reply.get_json()["ok"]
+    page = _cards(client, deck, limit=2, cursor=3)
+    assert page["next"] == 5 and len(page["cards"]) == 2
+
+
+def test_debug_endpoints_are_local_only(server, client, monkeypatch):
+    remote = {"REMOTE_ADDR": "10.0.0.2"}
+    assert client.get("/debug/timings", environ_base=remote).status_code == 403
+    reply = client.post("/debug/profile", json={"enabled": True}, environ_base=remote)
+    assert reply.status_code == 403 and not server.profiler.running
+    assert client.get("/metrics", environ_base=remote).status_code == 200
+    monkeypatch.setattr(server, "DEBUG_REMOTE", True)
+    assert client.get("/debug/timings", environ_base=remote).status_code == 200
+
+
+def test_profiler_interval_is_checked(server, client):
+    for interval in ("fast", -1, 0, 1e9, True):
+        reply = client.post("/debug/profile", json={"enabled": True, "interval": interval})
+        assert reply.status_code == 400 and not server.profiler.running
+    assert client.post("/debug/profile", json={"enabled": True, "interval": 0.005}).status_code == 200
+    assert client.post("/debug/profile", json={"enabled": False}).status_code == 200
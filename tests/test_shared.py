@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from anki_shared import LocalShared, SqliteShared, make_shared
+
+DEAD_PID = 2 ** 22 + 7  # above Linux's pid_max
+
+
+@pytest.fixture
+def workers(tmp_path):
+    path = str(tmp_path / "shared.db")
+    opened = [SqliteShared(path) for _ in range(3)]
+    yield opened
+    for shared in opened:
+        shared.close()
+
+
+def test_one_worker_holds_the_lease_until_it_releases_it(workers):
+    a, b, _ = workers
+    assert a.acquire("refresher", 10)
+    assert not b.acquire("refresher", 10)
+    assert a.acquire("refresher", 10)  # renewing
+    a.release("refresher")
+    assert b.acquire("refresher", 10) and not a.acquire("refresher", 10)
+
+
+def test_an_expired_lease_is_taken_over(workers):
+    a, b, _ = workers
+    assert a.acquire("refresher", 0.05)
+    time.sleep(0.1)
+    assert b.acquire("refresher", 10) and not a.acquire("refresher", 10)
+
+
+def test_a_dead_holders_lease_is_taken_over_at_once(workers):
+    a, b, _ = workers
+    assert a.acquire("refresher", 60)
+    a.db.execute("UPDATE leases SET pid = ?", (DEAD_PID,))
+    assert b.acquire("refresher", 10)
+
+
+def test_live_workers_get_slots_of_their_own(workers):
+    a, b, c = workers
+    assert (a.claim_slot(), b.claim_slot()) == (0, 1)
+    a.db.execute("UPDATE slots SET pid = ? WHERE slot = 0", (DEAD_PID,))
+    assert c.claim_slot() == 0  # freed by a worker that died
+
+
+def test_saved_deck_comes_back_without_cards_answered_since(workers):
+    a, b, _ = workers
+    b.add_answer(1, 3)  # before the save: already left out of the rows
+    a.put_deck("Deck", [[2, 20, "q2", "a2"], [3, 30, "q3", "a3"]])
+    b.add_answer(3, 3)
+    rows, removed = a.get_deck("Deck", max_age=60)
+    assert [r[0] for r in rows] == [2, 3] and removed == {3}
+    assert a.get_deck("Deck", max_age=0) is None
+    assert [(worker == b.worker, card_id) for _, worker, card_id, _ in a.answers_since(0)] == [(True, 1), (True, 3)]
+
+
+def test_keys_are_versioned(workers):
+    a, b, _ = workers
+    a.put("overview", {"decks": ["A"]})
+    version, value = b.get("overview")
+    assert value == {"decks": ["A"]} and b.get("overview", since=version) is None
+    a.put("overview", {"decks": ["A", "B"]})
+    assert b.get("overview", since=version)[1] == {"decks": ["A", "B"]}
+
+
+def test_make_shared():
+    assert isinstance(make_shared("local", "unused"), LocalShared)
+    with pytest.raises(ValueError):
+        make_shared("redis", "unused")
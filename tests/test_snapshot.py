@@ -0,0 +1,69 @@
+import os
+
+from anki_snapshot import SnapshotStore, collection_mtime
+
+ROWS = [[1, 10, "q1", "a1"], [2, 20, "q2", "a2"]]
+
+
+def test_decks_saved_before_the_last_collection_write_stay_for_offline_use(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshot.db"))
+    store.save_deck("Old", ROWS, col_mtime=100.0)
+    store.save_deck("Current", ROWS[:1], col_mtime=200.0)
+    _, _, deck_cards = store.load(col_mtime=200.0)
+    assert deck_cards == {"Current": ROWS[:1]}
+    assert store.load_deck("Old") == ROWS  # not restored, but still there offline
+    _, _, deck_cards = store.load(col_mtime=200.0)
+    assert "Old" not in deck_cards and store.load_deck("Old") == ROWS
+    store.close()
+
+
+def test_dropping_every_deck(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshot.db"))
+    store.save_deck("A", ROWS, col_mtime=100.0)
+    store.save_deck("B", ROWS, col_mtime=200.0)
+    store.drop_decks(["A"])
+    assert store.load_deck("A") is None and store.load_deck("B") == ROWS
+    store.drop_decks()
+    assert store.load_deck("B") is None
+    store.close()
+
+
+def test_overview_and_meta_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "snapshot.db")
+    store = SnapshotStore(path)
+    assert store.load() == (None, None, {})
+    store.save_overview(["Default", "Lang"], ({"Default": {"learn": 1}}, 5))
+    store.set_meta("etag", "abc")
+    store.close()
+    store = SnapshotStore(path)
+    decks, stats, _ = store.load()
+    assert decks == ["Default", "Lang"] and stats == ({"Default": {"learn": 1}}, 5)
+    assert store.get_meta("etag") == "abc" and store.get_meta("missing") is None
+    store.close()
+
+
+def test_an_old_schema_is_discarded(tmp_path):
+    path = str(tmp_path / "snapshot.db")
+    store = SnapshotStore(path)
+    store.save_deck("A", ROWS)
+    store.set_meta("etag", "abc")
+    with store.db:
+        store.db.execute("UPDATE meta SET value = '1' WHERE key = 'schema'")
+    store.close()
+    store = SnapshotStore(path)
+    assert store.load_deck("A") is None and store.get_meta("etag") is None
+    store.save_deck("A", ROWS)
+    assert store.load_deck("A") == ROWS
+    store.close()
+
+
+def test_collection_mtime_sees_the_wal(tmp_path):
+    assert collection_mtime(None) is None and collection_mtime(str(tmp_path)) is None
+    col = tmp_path / "collection.anki2"
+    col.write_text("")
+    os.utime(col, (100, 100))
+    assert collection_mtime(str(tmp_path)) == 100
+    wal = tmp_path / "collection.anki2-wal"
+    wal.write_text("")
+    os.utime(wal, (200, 200))
+    assert collection_mtime(str(tmp_path)) == 200
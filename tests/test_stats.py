@@ -0,0 +1,57 @@
+import threading
+import time
+
+from anki_stats import StatsTracker
+
+
+def _sync(tracker, anki):
+    return tracker.sync(anki, anki.multi(tracker.sync_actions()))
+
+
+def test_delta_sync_matches_a_full_rebuild(fake, anki):
+    tracker = StatsTracker()
+    _sync(tracker, anki)
+    assert tracker.last_mode == "full"
+
+    cards = fake.collection.cards
+    new = [c for c, card in cards.items() if card["type"] == 0][:5]
+    review = [c for c, card in cards.items() if card["type"] == 2][:5]
+    fake.collection.answerCards([{"cardId": c, "ease": 3} for c in new]
+                                + [{"cardId": c, "ease": 1} for c in review])
+
+    delta = _sync(tracker, anki)
+    assert tracker.last_mode == "delta"
+    assert delta == _sync(StatsTracker(), anki)
+
+
+def test_recorded_answer_moves_a_new_card_out_of_learn(fake, anki):
+    tracker = StatsTracker()
+    stats, learn, review = _sync(tracker, anki)
+    card_id = next(c for c, card in fake.collection.cards.items() if card["type"] == 0)
+    deck = fake.collection.cards[card_id]["deckName"]
+    assert tracker.record_answer(card_id, 4) == (deck, -1, 1)
+    after, learn_after, review_after = tracker.snapshot()
+    assert after[deck]["learn"] == stats[deck]["learn"] - 1
+    assert (learn_after, review_after) == (learn - 1, review + 1)
+    assert tracker.record_answer(card_id, 3) is None  # not new any more
+
+
+def test_grades_are_recorded_while_a_rebuild_fetches(fake, anki):
+    tracker = StatsTracker()
+    stats, learn, _ = _sync(tracker, anki)
+    card_id = next(c for c, card in fake.collection.cards.items() if card["type"] == 0)
+    deck = fake.collection.cards[card_id]["deckName"]
+    tracker.invalidate()
+    actions = anki.multi(tracker.sync_actions())
+    fake.latency = 0.5
+    rebuild = threading.Thread(target=tracker.sync, args=(anki, actions))
+    rebuild.start()
+    time.sleep(0.1)  # inside the cardsInfo round trip
+    start = time.perf_counter()
+    tracker.record_answer(card_id, 3)  # still in the grade queue: Anki has it as new
+    assert time.perf_counter() - start < 0.1
+    rebuild.join()
+    assert tracker.last_mode == "full"
+    after, learn_after, _ = tracker.snapshot()
+    assert after[deck]["learn"] == stats[deck]["learn"] - 1
+    assert learn_after == learn - 1
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from anki_connect import AnkiConnect, AnkiConnectUnavailable
+from anki_supervisor import AnkiSupervisor
+from conftest import wait_for
+from fake_ankiconnect import FakeAnkiConnect
+
+
+class Backend:
+    """Stands in for the backend: ``exited`` plays Anki's process going away."""
+
+    pid = None
+
+    def __init__(self):
+        self.exited = False
+
+    def reap(self):
+        return self.exited
+
+
+def _supervisor(anki, backend=None):
+    return AnkiSupervisor(anki, backend or Backend(), probe_timeout=0.5, interval=0.2,
+                          backoff=0.02, max_backoff=0.1)
+
+
+def test_ready_once_anki_answers(fake, anki):
+    supervisor = _supervisor(anki)
+    ups = []
+    supervisor.on_up.append(lambda: ups.append(1))
+    assert supervisor.wait_ready(5)
+    assert supervisor.is_up() and ups == [1]
+    assert supervisor.status()["state"] == "up" and supervisor.status()["version"] == 6
+
+
+def test_gives_up_after_the_timeout():
+    anki = AnkiConnect("http://127.0.0.1:9", timeout=1)  # nothing listens there
+    try:
+        supervisor = _supervisor(anki)
+        start = time.monotonic()
+        assert not supervisor.wait_ready(0.3)
+        assert time.monotonic() - start < 2
+        assert supervisor.status()["state"] == "down" and supervisor.status()["last_error"]
+    finally:
+        anki.close()
+
+
+def test_stops_waiting_when_anki_exits_during_startup():
+    anki = AnkiConnect("http://127.0.0.1:9", timeout=1)
+    backend = Backend()
+    backend.exited = True
+    try:
+        supervisor = _supervisor(anki, backend)
+        start = time.monotonic()
+        assert not supervisor.wait_ready(30)
+        assert time.monotonic() - start < 2
+        assert supervisor.status()["last_error"] == "Anki exited during startup"
+    finally:
+        anki.close()
+
+
+def test_notices_an_outage_and_the_return(fake, anki):
+    supervisor = _supervisor(anki)
+    downs, ups = [], []
+    supervisor.on_down.append(lambda: downs.append(1))
+    supervisor.on_up.append(lambda: ups.append(1))
+    assert supervisor.wait_ready(5)
+    supervisor.start()
+    port = int(fake.url.rsplit(":", 1)[1])
+    fake.stop()
+    try:
+        with pytest.raises(AnkiConnectUnavailable):
+            anki.invoke("deckNames")  # reported to the supervisor
+        assert wait_for(lambda: not supervisor.is_up())
+        assert downs == [1] and supervisor.status()["outages"] == 1
+        back = FakeAnkiConnect(fake.collection, port=port).start()
+        try:
+            assert supervisor.wait_up(5)
+            assert ups == [1, 1]
+        finally:
+            back.stop()
+    finally:
+        supervisor.stop()
+
+
+def test_notices_the_anki_process_exiting(fake, anki):
+    backend = Backend()
+    supervisor = _supervisor(anki, backend)
+    assert supervisor.wait_ready(5)
+    supervisor.start()
+    try:
+        backend.exited = True
+        assert wait_for(lambda: not supervisor.is_up())
+        assert supervisor.status()["last_error"] == "Anki exited"
+    finally:
+        supervisor.stop()
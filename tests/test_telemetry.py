@@ -0,0 +1,47 @@
+from anki_telemetry import TelemetryStore, analyze, wpm
+
+TYPO = (1, "lx\bs", [500, 100, 120, 80], 1.0, "ls")  # "x" for "s", then Backspace
+CLEAN = (2, "ls", [300, 100], 2.0, "ls")
+
+
+def test_a_corrected_typo_still_counts_as_an_error():
+    result = analyze(*TYPO[1:3], expected="ls")
+    assert (result["chars"], result["keystrokes"], result["errors"], result["corrections"]) == (2, 3, 1, 1)
+    assert result["positions"] == {1: 1} and result["confusions"] == {("s", "x"): 1}
+    assert result["char_stats"] == {"l": [1, 0, 0], "s": [2, 1, 180]}
+
+
+def test_the_pause_before_the_first_key_is_not_typing_time():
+    assert analyze("ls", [5000, 100], "ls")["ms"] == 100
+
+
+def test_keys_past_the_answer_are_errors():
+    result = analyze("lss", [0, 100, 100], "ls")
+    assert result["errors"] == 1 and result["confusions"] == {("", "s"): 1}
+    assert "" not in result["char_stats"]
+
+
+def test_without_an_answer_only_speed_is_measured():
+    result = analyze("ab\bc", [0, 100, 100, 100])
+    assert (result["chars"], result["ms"], result["corrections"]) == (2, 300, 1)
+    assert result["keystrokes"] == result["errors"] == 0 and not result["char_stats"]
+    assert wpm(result["chars"], result["ms"]) == 80.0 and wpm(2, 0) is None
+
+
+def test_store_summaries(tmp_path):
+    path = str(tmp_path / "telemetry.db")
+    store = TelemetryStore(path)
+    assert store.record("Shell", []) == 0
+    assert store.record("Shell", [TYPO, CLEAN]) == 2
+    store.close()
+    store = TelemetryStore(path)
+    assert store.deck("Missing") is None and store.card(99) is None
+    [deck] = store.decks()
+    assert (deck["deck"], deck["attempts"], deck["chars"], deck["ms"]) == ("Shell", 2, 4, 400)
+    assert deck["wpm"] == 120.0 and deck["accuracy"] == 0.8
+    summary = store.deck("Shell")
+    assert [c["card_id"] for c in summary["weak_cards"]] == [1, 2]
+    assert summary["weak_chars"][0] == {"char": "s", "keystrokes": 3, "error_rate": 0.333, "ms": 93}
+    assert summary["confusions"] == [{"expected": "s", "typed": "x", "count": 1}]
+    assert store.card(1)["positions"] == [{"pos": 1, "errors": 1}]
+    store.close()